@@ -1,7 +1,11 @@
 from __future__ import annotations
 
+from . import adapters
 from . import api
+from . import bg_loops
 from . import logging
+from . import metrics
+from . import query_plans
 from . import settings
 from . import state
 from . import utils
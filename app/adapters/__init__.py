@@ -0,0 +1,6 @@
+from __future__ import annotations
+
+from . import database
+from . import threadpool_database
+from . import instrumented_database
+from . import replicated_database
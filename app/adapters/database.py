@@ -0,0 +1,277 @@
+""" database: pool of async MySQL connections """
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any
+from typing import AsyncIterator
+from typing import Mapping
+from typing import Optional
+
+import aiomysql
+
+import app.metrics
+from app.logging import Colors
+from app.logging import log
+
+QueryParams = Optional[Mapping[str, Any]]
+
+# Errors meaning the connection (or the server behind it) is broken
+CONNECTION_ERRORS = (aiomysql.OperationalError, aiomysql.InterfaceError)
+
+# Errors the server answers a query with, leaving the connection usable
+SERVER_ERRORS = (
+    aiomysql.IntegrityError,
+    aiomysql.ProgrammingError,
+    aiomysql.DataError,
+    aiomysql.NotSupportedError,
+)
+
+pool_wait_time = app.metrics.histogram("database.pool.wait_ms")
+pool_acquire_timeouts = app.metrics.counter("database.pool.acquire_timeouts")
+pool_discarded_connections = app.metrics.counter("database.pool.discarded_connections")
+
+
+class Database:
+    """
+    Pool of async MySQL connections
+
+    Between `min_size` and `max_size` connections are kept open, callers wait
+    up to `acquire_timeout` seconds for one to free up before `TimeoutError`
+    is raised. Connections idle for longer than `health_check_interval` seconds
+    are pinged before being handed out, and broken ones are replaced.
+    Discarded connections are reopened in the background while fewer
+    than `min_size` are open.
+
+    Attributes:
+    -----------
+    size: `int`
+        The amount of open connections
+
+    in_use: `int`
+        The amount of connections currently running a query
+
+    waiters: `int`
+        The amount of callers waiting for a connection
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        password: str,
+        database: str,
+        min_size: int = 1,
+        max_size: int = 10,
+        acquire_timeout: float = 5.0,
+        health_check_interval: float = 30.0,
+    ) -> None:
+        self._connect_kwargs = {
+            "host": host,
+            "port": port,
+            "user": user,
+            "password": password,
+            "db": database,
+            "autocommit": True,
+        }
+
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+
+        # Idle connections with the time they were last used, most recent last
+        self._idle: deque[tuple[aiomysql.Connection, float]] = deque()
+        self._semaphore: asyncio.Semaphore | None = None
+        self._disconnected = False
+        # Running `_replenish` tasks, referenced so they aren't garbage collected
+        self._replenish_tasks: set[asyncio.Task[None]] = set()
+
+        self.size = 0
+        self.in_use = 0
+        self.waiters = 0
+
+    def __repr__(self) -> str:
+        host = self._connect_kwargs["host"]
+        port = self._connect_kwargs["port"]
+        return f"<Database {host}:{port} ({self.in_use}/{self.size} in use)>"
+
+    async def connect(self) -> None:
+        """Open the pool's first `min_size` connections"""
+        self._semaphore = asyncio.Semaphore(self.max_size)
+        self._disconnected = False
+
+        for _ in range(self.min_size):
+            connection = await self._open_connection()
+            self._idle.append((connection, time.monotonic()))
+
+    async def disconnect(self) -> None:
+        """Close every idle connection, connections in use are closed on release"""
+        self._disconnected = True
+
+        while self._idle:
+            connection, _ = self._idle.popleft()
+            self._close_connection(connection)
+
+    def pool_stats(self) -> dict[str, Any]:
+        return {
+            "size": self.size,
+            "idle": len(self._idle),
+            "in_use": self.in_use,
+            "waiters": self.waiters,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+        }
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[aiomysql.Connection]:
+        """Acquire a connection from the pool for the duration of the block"""
+        connection = await self._acquire()
+
+        try:
+            yield connection
+        except SERVER_ERRORS:
+            # The server rejected the query, the connection itself is fine
+            self._release(connection)
+            raise
+        except BaseException:
+            # Broken, or left mid-query (e.g. cancelled), with a result
+            # that'd be read by whoever reused it, don't reuse it
+            self._release(connection, discard=True)
+            raise
+        else:
+            self._release(connection)
+
+    async def fetch_one(
+        self, query: str, params: QueryParams = None
+    ) -> dict[str, Any] | None:
+        async with self.connection() as connection:
+            async with connection.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute(query, params)
+                return await cursor.fetchone()
+
+    async def fetch_all(
+        self, query: str, params: QueryParams = None
+    ) -> list[dict[str, Any]]:
+        async with self.connection() as connection:
+            async with connection.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute(query, params)
+                return list(await cursor.fetchall())
+
+    async def fetch_val(self, query: str, params: QueryParams = None) -> Any:
+        """Fetch the first column of the first row"""
+        async with self.connection() as connection:
+            async with connection.cursor() as cursor:
+                await cursor.execute(query, params)
+                row = await cursor.fetchone()
+                return row[0] if row is not None else None
+
+    async def execute(self, query: str, params: QueryParams = None) -> int:
+        """Execute a query, returns the id of the last inserted row"""
+        async with self.connection() as connection:
+            async with connection.cursor() as cursor:
+                await cursor.execute(query, params)
+                return cursor.lastrowid
+
+    async def _acquire(self) -> aiomysql.Connection:
+        assert self._semaphore is not None, "Database.connect() was never awaited"
+
+        start_time = time.perf_counter_ns()
+        self.waiters += 1
+        acquired = False
+        try:
+            async with asyncio.timeout(self.acquire_timeout):
+                await self._semaphore.acquire()
+                acquired = True
+        except TimeoutError:
+            if acquired:
+                self._semaphore.release()
+
+            pool_acquire_timeouts.increment()
+            raise TimeoutError(
+                f"Waited over {self.acquire_timeout}s for a database connection"
+            ) from None
+        except BaseException:
+            # Cancelled after the permit was handed over, give it back
+            if acquired:
+                self._semaphore.release()
+            raise
+        finally:
+            self.waiters -= 1
+            pool_wait_time.observe((time.perf_counter_ns() - start_time) / 1e6)
+
+        try:
+            connection = await self._get_connection()
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+        self.in_use += 1
+        return connection
+
+    async def _get_connection(self) -> aiomysql.Connection:
+        """Return a healthy idle connection, or open a new one"""
+        while self._idle:
+            connection, last_used = self._idle.pop()
+
+            if time.monotonic() - last_used < self.health_check_interval:
+                return connection
+
+            try:
+                await connection.ping(reconnect=False)
+            except Exception:
+                pool_discarded_connections.increment()
+                self._close_connection(connection)
+                continue
+
+            return connection
+
+        return await self._open_connection()
+
+    def _release(self, connection: aiomysql.Connection, discard: bool = False) -> None:
+        assert self._semaphore is not None
+
+        self.in_use -= 1
+
+        if self._disconnected:
+            self._close_connection(connection)
+        elif discard or connection.closed:
+            pool_discarded_connections.increment()
+            self._close_connection(connection)
+
+            if self.size < self.min_size:
+                task = asyncio.create_task(self._replenish())
+                self._replenish_tasks.add(task)
+                task.add_done_callback(self._replenish_tasks.discard)
+        else:
+            self._idle.append((connection, time.monotonic()))
+
+        self._semaphore.release()
+
+    async def _replenish(self) -> None:
+        """Open an idle connection, after a discarded one left fewer than `min_size`"""
+        try:
+            connection = await self._open_connection()
+        except Exception as exc:
+            log(f"Failed to reopen a database connection: {exc!r}", Colors.RED)
+            return
+
+        if self._disconnected or self.size > self.min_size:
+            self._close_connection(connection)
+        else:
+            self._idle.append((connection, time.monotonic()))
+
+    async def _open_connection(self) -> aiomysql.Connection:
+        connection = await aiomysql.connect(**self._connect_kwargs)
+        self.size += 1
+        return connection
+
+    def _close_connection(self, connection: aiomysql.Connection) -> None:
+        self.size -= 1
+        try:
+            connection.close()
+        except Exception:
+            pass
@@ -0,0 +1,245 @@
+""" instrumented database: per-query latency, row counts and callers, slow query log """
+from __future__ import annotations
+
+import asyncio
+import re
+import sys
+import time
+from collections import deque
+from functools import lru_cache
+from functools import partial
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import TypeVar
+from typing import TYPE_CHECKING
+
+import app.metrics
+from app.logging import Colors
+from app.logging import log
+
+if TYPE_CHECKING:
+    from app.adapters.database import QueryParams
+    from app.adapters.replicated_database import ReplicatedDatabase
+
+T = TypeVar("T")
+
+# Recent slow queries kept for the internal API, older ones are dropped
+SLOW_QUERY_LOG_SIZE = 100
+
+_NORMALIZATIONS = (
+    # Values, whether they're bound or inlined
+    (re.compile(r"'(?:[^'\\]|\\.)*'"), "?"),
+    (re.compile(r"%\(\w+\)s|%s"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"\s+"), " "),
+    # Lists whose length depends on the amount of values
+    (re.compile(r"\bIN \(\?(?:, \?)*\)", re.IGNORECASE), "IN (...)"),
+    (re.compile(r"(\((?:[^()]|\([^()]*\))*\))(?:, \1)+"), r"\1, ..."),
+    (re.compile(r"(WHEN \? THEN \? )(?:WHEN \? THEN \? )+"), r"\1... "),
+)
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(query: str) -> str:
+    """
+    `query` with its values replaced by `?`, so queries differing only
+    by their values (or the amount of them) share the same fingerprint
+    """
+    for pattern, replacement in _NORMALIZATIONS:
+        query = pattern.sub(replacement, query)
+
+    return query.strip()
+
+
+def _caller() -> str:
+    """`module.function` of the first frame outside of the database adapters"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if not module.startswith("app.adapters"):
+            return f"{module}.{frame.f_code.co_name}"
+
+        frame = frame.f_back
+
+    return "<unknown>"
+
+
+class QueryStats:
+    """Aggregated executions of one query fingerprint by one caller"""
+
+    def __init__(self, fingerprint: str, caller: str) -> None:
+        self.fingerprint = fingerprint
+        self.caller = caller
+
+        self.latency = app.metrics.Histogram(f"{caller}: {fingerprint}")
+        self.rows = 0
+        self.errors = 0
+
+    def __repr__(self) -> str:
+        return f"<QueryStats {self.caller}: {self.latency.count} calls>"
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "fingerprint": self.fingerprint,
+            "caller": self.caller,
+            "calls": self.latency.count,
+            "errors": self.errors,
+            "rows": self.rows,
+            "total_ms": self.latency.total,
+            "latency_ms": self.latency.as_dict(),
+        }
+
+
+class InstrumentedDatabase:
+    """
+    Wraps a database, timing every query it runs
+
+    Queries are aggregated per fingerprint and caller. Queries taking longer
+    than `slow_query_threshold` milliseconds are logged and kept in `slow_queries`,
+    along with their EXPLAIN output if `explain_slow_queries` is set.
+    Everything but the queries is passed through to the wrapped database.
+    """
+
+    def __init__(
+        self,
+        database: ReplicatedDatabase,
+        slow_query_threshold: float = 100.0,
+        explain_slow_queries: bool = False,
+    ) -> None:
+        self.database = database
+        self.slow_query_threshold = slow_query_threshold
+        self.explain_slow_queries = explain_slow_queries
+
+        self.stats: dict[tuple[str, str], QueryStats] = {}
+        self.slow_queries: deque[dict[str, Any]] = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+
+        self._explain_tasks: set[asyncio.Task[None]] = set()
+
+    def __repr__(self) -> str:
+        return f"<InstrumentedDatabase {self.database!r}>"
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.database, name)
+
+    async def disconnect(self) -> None:
+        for task in self._explain_tasks:
+            task.cancel()
+
+        await self.database.disconnect()
+
+    async def fetch_one(
+        self, query: str, params: QueryParams = None, primary: bool = False
+    ) -> dict[str, Any] | None:
+        return await self._run(
+            partial(self.database.fetch_one, primary=primary),
+            query,
+            params,
+            _caller(),
+            lambda row: int(row is not None),
+        )
+
+    async def fetch_all(
+        self, query: str, params: QueryParams = None, primary: bool = False
+    ) -> list[dict[str, Any]]:
+        return await self._run(
+            partial(self.database.fetch_all, primary=primary),
+            query,
+            params,
+            _caller(),
+            len,
+        )
+
+    async def fetch_val(
+        self, query: str, params: QueryParams = None, primary: bool = False
+    ) -> Any:
+        """Fetch the first column of the first row"""
+        return await self._run(
+            partial(self.database.fetch_val, primary=primary),
+            query,
+            params,
+            _caller(),
+            lambda value: int(value is not None),
+        )
+
+    async def execute(self, query: str, params: QueryParams = None) -> int:
+        """Execute a query, returns the id of the last inserted row"""
+        return await self._run(
+            self.database.execute, query, params, _caller(), lambda _: 0
+        )
+
+    def query_stats(self) -> list[dict[str, Any]]:
+        """Stats of every query, the ones that took the longest in total first"""
+        stats = sorted(
+            self.stats.values(), key=lambda stats: stats.latency.total, reverse=True
+        )
+        return [query_stats.as_dict() for query_stats in stats]
+
+    async def _run(
+        self,
+        function: Callable[[str, QueryParams], Awaitable[T]],
+        query: str,
+        params: QueryParams,
+        caller: str,
+        count_rows: Callable[[T], int],
+    ) -> T:
+        key = (fingerprint(query), caller)
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = QueryStats(*key)
+
+        start_time = time.perf_counter_ns()
+        try:
+            result = await function(query, params)
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            elapsed = (time.perf_counter_ns() - start_time) / 1e6
+            stats.latency.observe(elapsed)
+
+        rows = count_rows(result)
+        stats.rows += rows
+
+        if elapsed >= self.slow_query_threshold:
+            self._log_slow_query(stats, query, params, elapsed, rows)
+
+        return result
+
+    def _log_slow_query(
+        self,
+        stats: QueryStats,
+        query: str,
+        params: QueryParams,
+        elapsed: float,
+        rows: int,
+    ) -> None:
+        entry: dict[str, Any] = {
+            "fingerprint": stats.fingerprint,
+            "caller": stats.caller,
+            "time": time.time(),
+            "ms": elapsed,
+            "rows": rows,
+            "plan": None,
+        }
+        self.slow_queries.append(entry)
+
+        log(
+            f"Slow query ({elapsed:.2f}ms, {rows} rows) from {stats.caller}: "
+            f"{stats.fingerprint}",
+            Colors.YELLOW,
+        )
+
+        if self.explain_slow_queries and query.lstrip()[:6].upper() == "SELECT":
+            task = asyncio.create_task(self._explain(entry, query, params))
+            self._explain_tasks.add(task)
+            task.add_done_callback(self._explain_tasks.discard)
+
+    async def _explain(
+        self, entry: dict[str, Any], query: str, params: QueryParams
+    ) -> None:
+        # Straight through the wrapped database, so EXPLAINs aren't instrumented
+        try:
+            entry["plan"] = await self.database.fetch_all(f"EXPLAIN {query}", params)
+        except Exception as exc:
+            log(f"Failed to EXPLAIN slow query: {exc}", Colors.RED)
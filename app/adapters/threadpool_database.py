@@ -0,0 +1,238 @@
+""" threadpool database: blocking MySQLdb calls run on a bounded thread pool """
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import Callable
+from typing import TypeVar
+
+import MySQLdb
+import MySQLdb.cursors
+
+import app.metrics
+from app.adapters.database import QueryParams
+
+T = TypeVar("T")
+
+# Errors meaning the connection (or the server behind it) is broken
+CONNECTION_ERRORS = (MySQLdb.OperationalError, MySQLdb.InterfaceError)
+
+queue_depth = app.metrics.histogram(
+    "database.threadpool.queue_depth", buckets=(0, 1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+queue_wait_time = app.metrics.histogram("database.threadpool.queue_wait_ms")
+rejected_queries = app.metrics.counter("database.threadpool.rejected_queries")
+query_latencies = {
+    operation: app.metrics.histogram(f"database.threadpool.{operation}_ms")
+    for operation in ("fetch_one", "fetch_all", "fetch_val", "execute")
+}
+
+
+class DatabaseOverloadedError(Exception):
+    """Raised when the database's submission queue is full"""
+
+
+class ThreadPoolDatabase:
+    """
+    MySQLdb connections, one per thread of a bounded thread pool
+
+    Same interface as `app.adapters.database.Database`, the blocking calls just
+    happen off the event loop. At most `max_workers` queries run at once and
+    `max_queue_size` more can wait for a thread, any further query fails fast
+    with `DatabaseOverloadedError` instead of piling up.
+
+    Attributes:
+    -----------
+    pending: `int`
+        The amount of submitted queries that haven't finished, running ones included
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        password: str,
+        database: str,
+        max_workers: int = 8,
+        max_queue_size: int = 64,
+    ) -> None:
+        self._connect_kwargs = {
+            "host": host,
+            "port": port,
+            "user": user,
+            "password": password,
+            "database": database,
+            "autocommit": True,
+        }
+
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+
+        self._executor: ThreadPoolExecutor | None = None
+        self._local = threading.local()
+        self._connections: list[MySQLdb.Connection] = []
+        self._connections_lock = threading.Lock()
+
+        self.pending = 0
+
+    def __repr__(self) -> str:
+        host = self._connect_kwargs["host"]
+        port = self._connect_kwargs["port"]
+        return f"<ThreadPoolDatabase {host}:{port} ({self.pending} pending)>"
+
+    async def connect(self) -> None:
+        """Start the thread pool and check that the database is reachable"""
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="database"
+        )
+        await self.fetch_val("SELECT 1")
+
+    async def disconnect(self) -> None:
+        """Wait for pending queries, then close every thread's connection"""
+        if self._executor is not None:
+            await asyncio.to_thread(self._executor.shutdown, wait=True)
+            self._executor = None
+
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+
+    def pool_stats(self) -> dict[str, Any]:
+        return {
+            "connections": len(self._connections),
+            "pending": self.pending,
+            "max_workers": self.max_workers,
+            "max_queue_size": self.max_queue_size,
+        }
+
+    async def fetch_one(
+        self, query: str, params: QueryParams = None
+    ) -> dict[str, Any] | None:
+        return await self._submit("fetch_one", self._fetch_one, query, params)
+
+    async def fetch_all(
+        self, query: str, params: QueryParams = None
+    ) -> list[dict[str, Any]]:
+        return await self._submit("fetch_all", self._fetch_all, query, params)
+
+    async def fetch_val(self, query: str, params: QueryParams = None) -> Any:
+        """Fetch the first column of the first row"""
+        return await self._submit("fetch_val", self._fetch_val, query, params)
+
+    async def execute(self, query: str, params: QueryParams = None) -> int:
+        """Execute a query, returns the id of the last inserted row"""
+        return await self._submit("execute", self._execute, query, params)
+
+    async def _submit(
+        self,
+        operation: str,
+        function: Callable[[str, QueryParams], T],
+        query: str,
+        params: QueryParams,
+    ) -> T:
+        assert (
+            self._executor is not None
+        ), "ThreadPoolDatabase.connect() was never awaited"
+
+        waiting = max(0, self.pending - self.max_workers)
+        queue_depth.observe(waiting)
+        if waiting >= self.max_queue_size:
+            rejected_queries.increment()
+            raise DatabaseOverloadedError(
+                f"{self.pending} queries pending, not accepting more"
+            )
+
+        loop = asyncio.get_running_loop()
+
+        timings = [time.perf_counter_ns(), 0, 0]
+        self.pending += 1
+
+        # Cancelling the caller doesn't stop a query that's already running,
+        # so it's only counted as finished once its thread is done with it
+        future = self._executor.submit(self._run, function, query, params, timings)
+        future.add_done_callback(
+            lambda _: loop.call_soon_threadsafe(self._finished, operation, timings)
+        )
+
+        return await asyncio.wrap_future(future)
+
+    def _finished(self, operation: str, timings: list[int]) -> None:
+        """Runs on the event loop once a submitted query is done or cancelled"""
+        self.pending -= 1
+
+        # Metrics aren't thread safe, so they're only recorded on the event loop
+        submitted_at, started_at, finished_at = timings
+        if started_at:
+            queue_wait_time.observe((started_at - submitted_at) / 1e6)
+            query_latencies[operation].observe((finished_at - started_at) / 1e6)
+
+    def _run(
+        self,
+        function: Callable[[str, QueryParams], T],
+        query: str,
+        params: QueryParams,
+        timings: list[int],
+    ) -> T:
+        """Runs on one of the pool's threads, fills in `timings` as it goes"""
+        timings[1] = time.perf_counter_ns()
+
+        try:
+            return function(query, params)
+        except CONNECTION_ERRORS:
+            # The connection is most likely broken, reconnect on the next query
+            self._drop_connection()
+            raise
+        finally:
+            timings[2] = time.perf_counter_ns()
+
+    def _connection(self) -> MySQLdb.Connection:
+        connection = getattr(self._local, "connection", None)
+
+        if connection is None:
+            connection = MySQLdb.connect(**self._connect_kwargs)
+            self._local.connection = connection
+
+            with self._connections_lock:
+                self._connections.append(connection)
+
+        return connection
+
+    def _drop_connection(self) -> None:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            return
+
+        self._local.connection = None
+        with self._connections_lock:
+            self._connections.remove(connection)
+
+        try:
+            connection.close()
+        except MySQLdb.Error:
+            pass
+
+    def _fetch_one(self, query: str, params: QueryParams) -> dict[str, Any] | None:
+        with self._connection().cursor(MySQLdb.cursors.DictCursor) as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchone()
+
+    def _fetch_all(self, query: str, params: QueryParams) -> list[dict[str, Any]]:
+        with self._connection().cursor(MySQLdb.cursors.DictCursor) as cursor:
+            cursor.execute(query, params)
+            return list(cursor.fetchall())
+
+    def _fetch_val(self, query: str, params: QueryParams) -> Any:
+        with self._connection().cursor() as cursor:
+            cursor.execute(query, params)
+            row = cursor.fetchone()
+            return row[0] if row is not None else None
+
+    def _execute(self, query: str, params: QueryParams) -> int:
+        with self._connection().cursor() as cursor:
+            cursor.execute(query, params)
+            return cursor.lastrowid
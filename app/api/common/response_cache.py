@@ -0,0 +1,38 @@
+""" response cache: HTTP responses of `app.state.cache.ResponseCache` entries """
+from __future__ import annotations
+
+import time
+
+from fastapi import Request
+from fastapi import Response
+
+from app.state.cache import CachedResponse
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the request's `If-None-Match` header matches `etag`"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+
+    return False
+
+
+def response(request: Request, cached: CachedResponse, ttl: float) -> Response:
+    """
+    `cached` as a response, or a bodyless 304 if the client already has it
+
+    Clients may keep it for what's left of `ttl`, nothing if it's already stale
+    """
+    max_age = max(0, int(ttl - (time.monotonic() - cached.created_at)))
+    headers = {"ETag": cached.etag, "Cache-Control": f"public, max-age={max_age}"}
+
+    if etag_matches(request, cached.etag):
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=cached.body, media_type="application/json", headers=headers)
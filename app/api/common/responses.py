@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import orjson
 from fastapi import status
 from fastapi.responses import ORJSONResponse
 
@@ -35,6 +36,18 @@ def success(
     return ORJSONResponse(data, status_code, headers)
 
 
+def success_body(content: Any, meta: Optional[dict[str, Any]] = None) -> bytes:
+    """Serialized body of a `success` response, e.g. to be cached"""
+    if meta is None:
+        meta = {}
+
+    data = {"status": "success", "data": content, "meta": meta}
+
+    return orjson.dumps(
+        data, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    )
+
+
 class ErrorResponse(BaseModel, Generic[T]):
     status: Literal["error"]
     error: T
@@ -6,9 +6,14 @@ from fastapi import status
 from fastapi.requests import Request
 from fastapi.responses import FileResponse
 
+from dataclasses import dataclass
 from pathlib import Path
+import asyncio
+import mimetypes
 import os
+import time
 
+import app.metrics
 import app.settings
 from app.api.common import responses
 
@@ -17,6 +22,127 @@ AVATARS_PATH = Path(app.settings.DATA_DIRECTORY) / "avatars"
 router = APIRouter(tags=[f"Avatars (a.{app.settings.DOMAIN})"])
 
 ALLOWED_EXTENSIONS = ["", ".png", ".jpg", ".gif", ".jpeg", ".jfif"]
+
+# Content types of avatars saved without an extension, by their first bytes
+MAGIC_NUMBERS = {
+    b"\x89PNG\r\n\x1a\n": "image/png",
+    b"\xff\xd8\xff": "image/jpeg",
+    b"GIF87a": "image/gif",
+    b"GIF89a": "image/gif",
+}
+
+scan_time = app.metrics.histogram("avatars.index.scan_ms")
+
+
+@dataclass(slots=True)
+class Avatar:
+    path: str
+    content_type: str
+    # As of the last scan, to tell whether the content type has to be sniffed again
+    size: int
+    mtime: float
+
+
+class AvatarIndex:
+    """
+    Every avatar in `directory` by the name it's requested with,
+    so serving one doesn't look for it in the filesystem
+
+    Avatars are requested by file name, with or without one of
+    `ALLOWED_EXTENSIONS`, the first extension in that list wins.
+    The index is rebuilt by `load`, new avatars show up on the next rescan.
+
+    Serving an avatar still stats it once, a deliberate trade-off: avatars are
+    replaced and deleted outside of the server, the size and existence
+    from the last scan would be wrong until the next one (sending a
+    truncated file, or failing after the headers were sent).
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self._avatars: dict[str, Avatar] = {}
+
+    def __len__(self) -> int:
+        return len(self._avatars)
+
+    def __repr__(self) -> str:
+        return f"<AvatarIndex {self.directory} ({len(self)} avatars)>"
+
+    def get(self, name: str) -> Avatar | None:
+        return self._avatars.get(name)
+
+    async def load(self) -> None:
+        """(Re)scan the directory, the previous index is served meanwhile"""
+        start_time = time.perf_counter_ns()
+
+        self._avatars = await asyncio.to_thread(self._scan)
+
+        scan_time.observe((time.perf_counter_ns() - start_time) / 1e6)
+
+    def _scan(self) -> dict[str, Avatar]:
+        # Unchanged files keep their content type, instead of being sniffed again
+        previous = {avatar.path: avatar for avatar in self._avatars.values()}
+
+        # Maps request names to the extension priority and avatar they resolve to
+        found: dict[str, tuple[int, Avatar]] = {}
+
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+
+                stat_result = entry.stat()
+
+                previous_avatar = previous.get(entry.path)
+                if (
+                    previous_avatar is not None
+                    and previous_avatar.mtime == stat_result.st_mtime
+                    and previous_avatar.size == stat_result.st_size
+                ):
+                    content_type = previous_avatar.content_type
+                else:
+                    content_type = _content_type(entry.path)
+
+                avatar = Avatar(
+                    path=entry.path,
+                    content_type=content_type,
+                    size=stat_result.st_size,
+                    mtime=stat_result.st_mtime,
+                )
+
+                # Requested with its full name, as if with the "" extension
+                found[entry.name] = (0, avatar)
+
+        for name, (_, avatar) in list(found.items()):
+            stem, extension = os.path.splitext(name)
+            if not extension or extension not in ALLOWED_EXTENSIONS:
+                continue
+
+            priority = ALLOWED_EXTENSIONS.index(extension)
+            if stem not in found or found[stem][0] > priority:
+                found[stem] = (priority, avatar)
+
+        return {name: avatar for name, (_, avatar) in found.items()}
+
+
+def _content_type(path: str) -> str:
+    content_type = mimetypes.guess_type(path)[0]
+    if content_type is not None:
+        return content_type
+
+    with open(path, "rb") as file:
+        header = file.read(8)
+
+    for magic_number, content_type in MAGIC_NUMBERS.items():
+        if header.startswith(magic_number):
+            return content_type
+
+    return "application/octet-stream"
+
+
+index = AvatarIndex(AVATARS_PATH)
+
+
 @router.get(
     path="/{file_path:path}",
     name="Get User Avatar",
@@ -29,11 +155,23 @@ async def serve_avatar(file_path: str) -> FileResponse:
             message="Not found",
             status_code=status.HTTP_404_NOT_FOUND
         )
-    
-    for extension in ALLOWED_EXTENSIONS:
-        full_path = os.path.join(AVATARS_PATH, f"{file_path}{extension}")
-        if os.path.exists(full_path):
-            return FileResponse(full_path)
-
-    default_avatar_path = os.path.join(AVATARS_PATH, "default.jpg")
-    return FileResponse(default_avatar_path)
\ No newline at end of file
+
+    # Stat'd again as the index may be up to a rescan old, see `AvatarIndex`
+    for name in (file_path, "default.jpg"):
+        avatar = index.get(name)
+        if avatar is None:
+            continue
+
+        try:
+            stat_result = os.stat(avatar.path)
+        except FileNotFoundError:
+            continue
+
+        return FileResponse(
+            avatar.path, media_type=avatar.content_type, stat_result=stat_result
+        )
+
+    return responses.error(
+        message="Not found",
+        status_code=status.HTTP_404_NOT_FOUND
+    )
@@ -15,6 +15,7 @@ from fastapi.responses import RedirectResponse, HTMLResponse
 from typing import Optional, Literal, Mapping, TypedDict
 
 import app.settings
+import app.state.sessions
 from app.api.common import responses
 from app.constants import regexes
 from app.types import IPAddress
@@ -56,7 +57,7 @@ async def handle_client_request(
     if osu_token is None:
         # The client is performing a login
         request_body = await request.body()
-        login_data = login(headers=request.headers, body=request_body, ip=ip)
+        login_data = await login(headers=request.headers, body=request_body, ip=ip)
 
     # player = app.state.sessions.players.get(token=osu_token)
 
@@ -71,7 +72,9 @@ class LoginResponse:
         self.response_body = response_body
 
 
-def login(headers: Mapping[str, str], body: bytes, ip: IPAddress) -> LoginResponse:
+async def login(
+    headers: Mapping[str, str], body: bytes, ip: IPAddress
+) -> LoginResponse:
     """\
     Login has no specific packet, but happens when the osu!
     client sends a request without an 'osu-token' header.
@@ -142,11 +145,17 @@ def login(headers: Mapping[str, str], body: bytes, ip: IPAddress) -> LoginRespon
     #         player_already_logged_in.logout()
     #         del player_already_logged_in
 
-    player_info = players_repo.get_one(name=login_data.username)
+    player_info = await players_repo.get_one(name=login_data.username)
 
+    # Only send who is online, the client requests the presence
+    # of players it actually needs with USER_PRESENCE_REQUEST
     return LoginResponse(
         osu_token="asda",
-        response_body=app.packets.UserId(0) + app.packets.Notification("Logged in"),
+        response_body=(
+            app.packets.UserId(0)
+            + app.packets.Notification("Logged in")
+            + app.state.sessions.online_players.presence_bundle
+        ),
     )
 
 
@@ -17,18 +17,19 @@ from fastapi.openapi.utils import get_openapi
 from fastapi.requests import Request
 import starlette.routing
 
+import app.bg_loops
 import app.settings
 import app.state
+from app.repositories import players as players_repo
+from app.repositories import stats as stats_repo
 from app.api import api_router
 from app.api import domains
 from app.api import middleware
+from app.adapters.threadpool_database import DatabaseOverloadedError
 from app.api.common import responses
 from app.logging import log
 from app.logging import Colors
 
-import MySQLdb
-import MySQLdb.cursors
-
 
 class BanchoAPI(FastAPI):
     def openapi(self) -> dict[str, Any]:
@@ -86,6 +87,17 @@ def init_exception_handlers(asgi_app: BanchoAPI) -> None:
             message="Not found", status_code=status.HTTP_404_NOT_FOUND
         )
 
+    @asgi_app.exception_handler(DatabaseOverloadedError)
+    async def handle_database_overloaded_error(
+        request: Request, exc: DatabaseOverloadedError
+    ) -> responses.ErrorResponse:
+        log(f"Database overloaded, rejected {request.url}", Colors.RED)
+
+        return responses.error(
+            message="Server is overloaded, try again later",
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+
     @asgi_app.exception_handler(RequestValidationError)
     async def handle_validation_error(
         request: Request, exc: RequestValidationError
@@ -127,15 +139,9 @@ async def lifespan(asgi_app: FastAPI):
     )
 
     try:
-        app.state.services.database = MySQLdb.connect(
-            host=app.settings.MYSQL_HOST,
-            port=app.settings.MYSQL_PORT,
-            user=app.settings.MYSQL_USERNAME,
-            password=app.settings.MYSQL_PASSWORD,
-            database=app.settings.MYSQL_DATABASE,
-        )
+        await app.state.services.database.connect()
         log("Connected to MySQL", Colors.GREEN)
-    except:
+    except Exception:
         log("MySQL Connection Failed", Colors.RED)
     # await app.state.services.redis.initialize()
 
@@ -148,12 +154,32 @@ async def lifespan(asgi_app: FastAPI):
 
     # app.state.services.ip_resolver = app.state.services.IPResolver()
 
-    # await app.state.services.run_sql_migrations()
+    try:
+        await app.state.services.run_sql_migrations()
+    except Exception as exc:
+        # Serving on a half migrated schema would fail in less obvious ways later
+        log(f"Failed to run SQL migrations, not starting: {exc}", Colors.RED)
+        raise
 
     # async with app.state.services.database.connection() as db_conn:
     #     await collections.initialize_ram_caches(db_conn)
 
-    # await app.bg_loops.initialize_housekeeping_tasks()
+    try:
+        await players_repo.load_counts()
+    except Exception:
+        log("Failed to load player counts, counting in MySQL", Colors.RED)
+
+    try:
+        await stats_repo.load_rankings()
+    except Exception:
+        log("Failed to load leaderboards and ranks", Colors.RED)
+
+    try:
+        await domains.avatars.index.load()
+    except Exception:
+        log("Failed to index avatars", Colors.RED)
+
+    await app.bg_loops.initialize_housekeeping_tasks()
 
     log("Startup process complete.", Colors.GREEN)
     log(
@@ -163,8 +189,20 @@ async def lifespan(asgi_app: FastAPI):
 
     yield
 
+    for task in app.state.sessions.housekeeping_tasks:
+        task.cancel()
+
+    await asyncio.gather(
+        *app.state.sessions.housekeeping_tasks, return_exceptions=True
+    )
+    app.state.sessions.housekeeping_tasks.clear()
+
+    await app.state.write_behind.queue.flush()
+
     await app.state.services.http_client.close()
-    app.state.services.database.close()
+    if app.state.services.redis_client is not None:
+        await app.state.services.redis_client.aclose()
+    await app.state.services.database.disconnect()
 
     log("Server shut down successfully, thank you for using bancho", Colors.MAGENTA)
 
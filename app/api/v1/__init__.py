@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from fastapi import APIRouter
 
+from . import internal
 from . import leaderboard
 from . import players
 
@@ -10,4 +11,5 @@ import app.settings
 apiv1_router = APIRouter(tags=[f"API v1 (api.{app.settings.DOMAIN}/v1)"], prefix="/v1")
 
 apiv1_router.include_router(players.router)
-apiv1_router.include_router(leaderboard.router)
\ No newline at end of file
+apiv1_router.include_router(leaderboard.router)
+apiv1_router.include_router(internal.router)
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import ipaddress
+
+from fastapi import APIRouter
+from fastapi import Request
+from fastapi import status
+
+import app.settings
+import app.state.services
+from app.api.common import responses
+from app.types import IPAddress
+
+router = APIRouter(include_in_schema=False)
+
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(proxy, strict=False)
+    for proxy in app.settings.INTERNAL_API_TRUSTED_PROXIES
+]
+
+
+def _parse_ip(ip_string: str | None) -> IPAddress | None:
+    if ip_string is None:
+        return None
+
+    try:
+        return ipaddress.ip_address(ip_string.strip())
+    except ValueError:
+        return None
+
+
+def client_ip(request: Request) -> IPAddress | None:
+    """
+    Address of whoever made the request, `None` if it can't be trusted
+
+    Forwarded headers are set by clients as they please, so the X-Real-IP
+    header is only used on requests coming from one of `TRUSTED_PROXIES`
+    """
+    peer = _parse_ip(request.client.host if request.client is not None else None)
+    if peer is None:
+        return None
+
+    if any(peer in proxy for proxy in TRUSTED_PROXIES):
+        # A proxy not telling who it's forwarding for could be forwarding anyone
+        return _parse_ip(request.headers.get("X-Real-IP"))
+
+    return peer
+
+
+def is_internal_request(request: Request) -> bool:
+    """Whether the request comes from a private network (e.g. the machine itself)"""
+    ip = client_ip(request)
+    return ip is not None and (ip.is_private or ip.is_loopback)
+
+
+@router.get(path="/internal/queries", name="Get Query Stats")
+async def handle_get_query_stats(request: Request):
+    if not is_internal_request(request):
+        return responses.error(
+            message="Forbidden", status_code=status.HTTP_403_FORBIDDEN
+        )
+
+    database = app.state.services.database
+    return responses.success(
+        content={
+            "queries": database.query_stats(),
+            "slow_queries": list(database.slow_queries),
+        },
+        meta={"slow_query_threshold_ms": database.slow_query_threshold},
+    )
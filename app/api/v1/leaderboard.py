@@ -1,8 +1,12 @@
 from __future__ import annotations
 
-from time import perf_counter_ns
+import base64
+import binascii
+
+import orjson
 
 from fastapi import APIRouter
+from fastapi import Request
 from fastapi import status
 from fastapi.param_functions import Query
 
@@ -10,21 +14,62 @@ from typing import Any
 from typing import Literal
 from typing import Optional
 
-from app.logging import format_time_magnitude
+import app.query_plans
+import app.state.cache
 from app.constants.gamemodes import GameMode
 from app.state.services import database
+import app.state.sessions
 from app.api.common import responses
+from app.api.common import response_cache
 
 router = APIRouter()
 
+# Deeper pages have to be reached with the `next` cursor of the previous page
+MAX_OFFSET = 10_000
+
+# Keys of the leaderboard entries holding the value each `sort` ranks by
+SORT_KEYS = {
+    "tscore": "total_score",
+    "rscore": "ranked_score",
+    "pp": "pp",
+    "acc": "acc",
+    "plays": "plays",
+    "playtime": "playtime",
+}
+
+def encode_cursor(sort: str, value: Any, player_id: int) -> str:
+    """Opaque cursor pointing right after the player with `value` in `sort`"""
+    return base64.urlsafe_b64encode(orjson.dumps([sort, value, player_id])).decode()
+
+
+def decode_cursor(cursor: str, sort: str) -> tuple[Any, int] | None:
+    """(value, player id) of a cursor made for `sort`, `None` if it's invalid"""
+    try:
+        cursor_sort, value, player_id = orjson.loads(base64.urlsafe_b64decode(cursor))
+    except (binascii.Error, orjson.JSONDecodeError, TypeError, ValueError):
+        return None
+
+    if (
+        cursor_sort != sort
+        or not isinstance(value, (int, float))
+        or not isinstance(player_id, int)
+    ):
+        return None
+
+    return value, player_id
+
 
 @router.get(path="/leaderboard", name="Get Leaderboard", description="Get leaderboard")
 async def handle_get_leaderboard(
+    request: Request,
     sort: Literal["tscore", "rscore", "pp", "acc", "plays", "playtime"] = "pp",
     mode: int = Query(0, alias="mode", ge=0, le=11),
     limit: int = Query(50, ge=1, le=100),
-    offset: int = Query(0, min=0, max=2_147_483_647),
+    offset: int = Query(0, ge=0),
     country: Optional[str] = Query(None, min_length=2, max_length=2),
+    cursor: Optional[str] = Query(
+        None, description="`next` cursor of the previous page"
+    ),
 ):
     if mode in (
         GameMode.RELAX_MANIA,
@@ -38,60 +83,137 @@ async def handle_get_leaderboard(
 
     mode = GameMode(mode)
 
+    # "PL" and "pl" are the same page
+    if country is not None:
+        country = country.lower()
+
+    if offset > MAX_OFFSET:
+        return responses.error(
+            message=f"Offset can't exceed {MAX_OFFSET}, page with the `next` cursor",
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
+
+    after = None
+    if cursor is not None:
+        after = decode_cursor(cursor, sort)
+        if after is None:
+            return responses.error(
+                message="Invalid cursor", status_code=status.HTTP_400_BAD_REQUEST
+            )
+
+    async def render_page() -> bytes:
+        if app.state.sessions.leaderboards.loaded:
+            leaderboard = app.state.sessions.leaderboards.page(
+                mode, sort, offset, limit, country, after
+            )
+        else:
+            leaderboard = await fetch_leaderboard(
+                mode, sort, offset, limit, country, after
+            )
+
+        next_cursor = None
+        if len(leaderboard) == limit:
+            last = leaderboard[-1]
+            next_cursor = encode_cursor(sort, last[SORT_KEYS[sort]], last["id"])
+
+        return responses.success_body(content=leaderboard, meta={"next": next_cursor})
+
+    cache = app.state.cache.leaderboard_pages
+    cached = await cache.get((sort, mode, limit, offset, country, cursor), render_page)
+    return response_cache.response(request, cached, ttl=cache.ttl)
+
+
+def leaderboard_query(
+    mode: GameMode,
+    sort: str,
+    offset: int,
+    limit: int,
+    country: Optional[str],
+    after: Optional[tuple[Any, int]] = None,
+) -> tuple[str, dict[str, Any]]:
+    """
+    Query and params of a leaderboard page
+
+    `after` (value, player id) seeks past the player ranked there,
+    so deep pages don't make MySQL walk every row before them
+    """
     query = f"""
         SELECT u.id as player_id, u.name, u.country, s.tscore, s.rscore,
-        s.pp, s.plays, s.playtime, s.acc, s.max_combo, 
-        s.xh_count, s.x_count, s.sh_count, s.s_count, s.a_count, 
-        c.id as clan_id, c.name as clan_name, c.tag as clan_tag 
-        FROM stats s 
+        s.pp, s.plays, s.playtime, s.acc, s.max_combo,
+        s.xh_count, s.x_count, s.sh_count, s.s_count, s.a_count,
+        c.id as clan_id, c.name as clan_name, c.tag as clan_tag
+        FROM stats s
         LEFT JOIN users u ON s.id = u.id
-        LEFT JOIN clans c ON u.clan_id = c.id 
+        LEFT JOIN clans c ON u.clan_id = c.id
         WHERE u.priv & 1 AND s.{sort} > 0 AND s.mode = %(mode)s
     """
 
     params: dict[str, Any] = {"mode": mode}
 
     if country is not None:
-        query += "AND u.country = %(country)s"
+        query += " AND u.country = %(country)s"
         params["country"] = country
 
-    query += f"ORDER BY s.{sort} DESC LIMIT %(offset)s, %(limit)s"
+    if after is not None:
+        query += f" AND (s.{sort}, s.id) < (%(after_value)s, %(after_id)s)"
+        params["after_value"], params["after_id"] = after
+
+    query += f" ORDER BY s.{sort} DESC, s.id DESC LIMIT %(offset)s, %(limit)s"
     params["offset"] = offset
     params["limit"] = limit
 
-    start = perf_counter_ns()
+    return query, params
+
+
+for _sort in SORT_KEYS:
+    app.query_plans.register(
+        f"leaderboard.{_sort}",
+        *leaderboard_query(GameMode.VANILLA_OSU, _sort, 0, 50, None),
+    )
+    app.query_plans.register(
+        f"leaderboard.{_sort}.country_after",
+        *leaderboard_query(GameMode.VANILLA_OSU, _sort, 0, 50, "pl", (1, 1)),
+    )
+
 
-    database.execute(query, params)
-    result = database.fetchall()
+async def fetch_leaderboard(
+    mode: GameMode,
+    sort: str,
+    offset: int,
+    limit: int,
+    country: Optional[str],
+    after: Optional[tuple[Any, int]] = None,
+) -> list[dict[str, Any]]:
+    """Leaderboard page straight from MySQL, for when it isn't loaded in memory"""
+    query, params = leaderboard_query(mode, sort, offset, limit, country, after)
 
-    end = perf_counter_ns()
-    print(f"Leaderboard query took {format_time_magnitude(end - start)}")
+    result = await database.fetch_all(query, params)
 
     leaderboard = []
 
     for user in result:
         u = {
-            "id": user[0],
-            "name": user[1],
-            "country": user[2],
-            "total_score": user[3],
-            "ranked_score": user[4],
-            "pp": user[5],
-            "plays": user[6],
-            "playtime": user[7],
-            "acc": user[8],
-            "max_combo": user[9],
-            "xh_count": user[10],
-            "x_count": user[11],
-            "sh_count": user[12],
-            "s_count": user[13],
-            "a_count": user[14],
+            "id": user["player_id"],
+            "name": user["name"],
+            "country": user["country"],
+            "total_score": user["tscore"],
+            "ranked_score": user["rscore"],
+            "pp": user["pp"],
+            "plays": user["plays"],
+            "playtime": user["playtime"],
+            "acc": user["acc"],
+            "max_combo": user["max_combo"],
+            "xh_count": user["xh_count"],
+            "x_count": user["x_count"],
+            "sh_count": user["sh_count"],
+            "s_count": user["s_count"],
+            "a_count": user["a_count"],
             "clan": {
-                "id": user[15],
-                "name": user[16],
-                "tag": user[17],
+                "id": user["clan_id"],
+                "name": user["clan_name"],
+                "tag": user["clan_tag"],
             },
         }
         leaderboard.append(u)
 
-    return responses.success(content=leaderboard)
+    return leaderboard
@@ -2,27 +2,46 @@ from __future__ import annotations
 
 from fastapi import APIRouter
 from fastapi import status
+from fastapi.param_functions import Query
 
 from typing import Any
+from typing import Optional
 
+from app.objects.stats import ModeData
 from app.repositories import players as players_repo
+from app.repositories import stats as stats_repo
 from app.api.common import responses
 from app.api.common.responses import SuccessResponse
 
 router = APIRouter()
 
+# Most players a single /v1/players request can ask for
+MAX_PLAYERS_PER_REQUEST = 100
+
 # TODO:
-# /v1/players
 # /v1/players/{player_id}/status
 # /v1/players/{player_id}/stats/{mode}
-# /v1/players/{player_id}/stats
+
+
+def format_mode_stats(stats: ModeData) -> dict[str, Any]:
+    return {
+        "total_score": stats.total_score,
+        "ranked_score": stats.ranked_score,
+        "pp": stats.pp,
+        "acc": stats.acc,
+        "plays": stats.playcount,
+        "playtime": stats.playtime,
+        "max_combo": stats.max_combo,
+        "total_hits": stats.total_hits,
+        "grades": {grade.name: count for grade, count in stats.grades.items()},
+    }
 
 
 @router.get(
     path="/players/count", name="Get player count", description="Get player count"
 )
 async def handle_get_player_count():
-    player_count = players_repo.count()
+    player_count = await players_repo.count()
     return responses.success(content=player_count, status_code=status.HTTP_200_OK)
 
 
@@ -32,7 +51,7 @@ async def handle_get_player_count():
     description="Get player using provided id",
 )
 async def handle_get_player(player_id: int) -> SuccessResponse[dict[str, Any]]:
-    player = players_repo.get_one(id=player_id)
+    player = await players_repo.get_one(id=player_id)
 
     if player is None:
         return responses.error(
@@ -47,16 +66,21 @@ async def handle_get_player(player_id: int) -> SuccessResponse[dict[str, Any]]:
     description="Get player stats using provided id",
 )
 async def handle_get_player_stats(player_id: int) -> SuccessResponse[dict[str, Any]]:
-    # player = players_repo.get_one(id=player_id)
+    player = await players_repo.get_one(id=player_id)
 
-    # if player is None:
-    #     return responses.error(
-    #         message="Player not found",
-    #         status_code=status.HTTP_404_NOT_FOUND
-    #     )
+    if player is None:
+        return responses.error(
+            message="Player not found", status_code=status.HTTP_404_NOT_FOUND
+        )
 
-    return responses.error(
-        message="Not yet implemented", status_code=status.HTTP_501_NOT_IMPLEMENTED
+    stats = await stats_repo.get_all_modes(player_id)
+
+    return responses.success(
+        content={
+            str(mode.value): format_mode_stats(mode_stats)
+            for mode, mode_stats in stats.items()
+        },
+        status_code=status.HTTP_200_OK,
     )
 
 
@@ -103,9 +127,34 @@ async def handle_get_player_stats_for_mode(
 @router.get(
     path="/players", name="Get multiple players", description="Get multiple players"
 )
-async def handle_get_players() -> SuccessResponse[dict[str, Any]]:
-    # players = players_repo.get_all()
+async def handle_get_players(
+    ids: Optional[str] = Query(None, description="Comma separated player ids"),
+    names: Optional[str] = Query(None, description="Comma separated player names"),
+) -> SuccessResponse[list[dict[str, Any]]]:
+    if ids is None and names is None:
+        return responses.error(
+            message="Provide ids and/or names", status_code=status.HTTP_400_BAD_REQUEST
+        )
 
-    return responses.error(
-        message="Not yet implemented", status_code=status.HTTP_501_NOT_IMPLEMENTED
+    try:
+        player_ids = [int(id) for id in ids.split(",") if id] if ids else []
+    except ValueError:
+        return responses.error(
+            message="Invalid player id", status_code=status.HTTP_400_BAD_REQUEST
+        )
+
+    player_names = [name for name in names.split(",") if name] if names else []
+
+    if len(player_ids) + len(player_names) > MAX_PLAYERS_PER_REQUEST:
+        return responses.error(
+            message=f"Can't request more than {MAX_PLAYERS_PER_REQUEST} players at once",
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
+
+    players = await players_repo.get_many(ids=player_ids, names=player_names)
+
+    return responses.success(
+        content=players,
+        status_code=status.HTTP_200_OK,
+        meta={"requested": len(player_ids) + len(player_names), "found": len(players)},
     )
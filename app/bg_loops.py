@@ -0,0 +1,80 @@
+""" bg_loops: housekeeping tasks running alongside the server """
+from __future__ import annotations
+
+import asyncio
+
+import app.api.domains.avatars
+import app.settings
+import app.state.sessions
+from app.logging import Colors
+from app.logging import log
+import app.state.write_behind
+from app.repositories import players as players_repo
+from app.repositories import stats as stats_repo
+
+
+async def initialize_housekeeping_tasks() -> None:
+    """Start every housekeeping task, they run until the server shuts down"""
+    app.state.sessions.housekeeping_tasks.update(
+        {
+            asyncio.create_task(
+                _reconcile_player_counts(
+                    interval=app.settings.PLAYER_COUNTS_RECONCILE_INTERVAL
+                )
+            ),
+            asyncio.create_task(
+                _rebuild_leaderboards(
+                    interval=app.settings.LEADERBOARD_REBUILD_INTERVAL
+                )
+            ),
+            asyncio.create_task(
+                _rescan_avatars(interval=app.settings.AVATARS_RESCAN_INTERVAL)
+            ),
+            asyncio.create_task(
+                _flush_write_behind_queue(
+                    interval=app.settings.WRITE_BEHIND_FLUSH_INTERVAL
+                )
+            ),
+        }
+    )
+
+
+async def _reconcile_player_counts(interval: float) -> None:
+    """Reload the player counts, in case incremental updates drifted off"""
+    while True:
+        await asyncio.sleep(interval)
+
+        try:
+            await players_repo.load_counts()
+        except Exception as exc:
+            log(f"Failed to reconcile player counts: {exc}", Colors.RED)
+
+
+async def _rebuild_leaderboards(interval: float) -> None:
+    """Rebuild the leaderboards and ranks, to pick up outside changes"""
+    while True:
+        await asyncio.sleep(interval)
+
+        try:
+            await stats_repo.load_rankings()
+        except Exception as exc:
+            log(f"Failed to rebuild leaderboards and ranks: {exc}", Colors.RED)
+
+
+async def _rescan_avatars(interval: float) -> None:
+    """Rescan the avatars directory, to pick up new and changed avatars"""
+    while True:
+        await asyncio.sleep(interval)
+
+        try:
+            await app.api.domains.avatars.index.load()
+        except Exception as exc:
+            log(f"Failed to rescan avatars: {exc}", Colors.RED)
+
+
+async def _flush_write_behind_queue(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+
+        # Shielded so a flush that's underway finishes when the task gets cancelled
+        await asyncio.shield(app.state.write_behind.queue.flush())
@@ -0,0 +1,124 @@
+""" metrics: in-process counters and histograms """
+from __future__ import annotations
+
+import bisect
+from typing import Any
+from typing import Sequence
+
+__all__ = ("Counter", "Histogram", "counter", "histogram", "snapshot")
+
+# Upper bounds of the default histogram buckets, in milliseconds
+LATENCY_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class Counter:
+    """A value that only goes up"""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.value = 0
+
+    def __repr__(self) -> str:
+        return f"<Counter {self.name}: {self.value}>"
+
+    def increment(self, amount: int = 1) -> None:
+        self.value += amount
+
+    def as_dict(self) -> dict[str, Any]:
+        return {"type": "counter", "value": self.value}
+
+
+class Histogram:
+    """
+    Distribution of observed values
+
+    Attributes:
+    -----------
+    buckets: `Sequence[float]`
+        Upper bounds of the buckets, values above the last one go in an overflow bucket
+
+    bucket_counts: `list[int]`
+        Amount of observed values per bucket, overflow bucket included
+    """
+
+    def __init__(self, name: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def __repr__(self) -> str:
+        return f"<Histogram {self.name}: {self.count} values, mean {self.mean:.2f}>"
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def observe(self, value: float) -> None:
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percentile: float) -> float:
+        """Upper bound of the bucket the `percentile`th value (0-100) falls in"""
+        if not self.count:
+            return 0.0
+
+        rank = self.count * percentile / 100
+        seen = 0
+        for bucket, bucket_count in zip(self.buckets, self.bucket_counts):
+            seen += bucket_count
+            if seen >= rank:
+                return bucket
+
+        return self.max
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "type": "histogram",
+            "count": self.count,
+            "total": self.total,
+            "mean": self.mean,
+            "min": self.min if self.count else 0.0,
+            "max": self.max if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+
+_metrics: dict[str, Counter | Histogram] = {}
+
+
+def counter(name: str) -> Counter:
+    """Get the counter registered under `name`, creating it if needed"""
+    metric = _metrics.get(name)
+    if metric is None:
+        metric = _metrics[name] = Counter(name)
+
+    assert isinstance(metric, Counter), f"{name} is not a counter"
+    return metric
+
+
+def histogram(name: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    """Get the histogram registered under `name`, creating it if needed"""
+    metric = _metrics.get(name)
+    if metric is None:
+        metric = _metrics[name] = Histogram(name, buckets)
+
+    assert isinstance(metric, Histogram), f"{name} is not a histogram"
+    return metric
+
+
+def snapshot() -> dict[str, dict[str, Any]]:
+    """Return the current value of every registered metric"""
+    return {name: metric.as_dict() for name, metric in sorted(_metrics.items())}
@@ -1,5 +1,8 @@
 from __future__ import annotations
 
 from . import collections
+from . import leaderboards
 from . import match
 from . import player
+from . import ranks
+from . import stats
@@ -1,93 +1,245 @@
 from __future__ import annotations
-from typing import Iterator, Sequence
+import time
+from typing import Callable, Collection, Hashable, Iterable, Iterator
+import app.metrics
+import app.packets as Packets
 from app.constants.privileges import Privileges
 from app.logging import log
 
 from app.objects.player import Player
 from app.settings import DEBUG
 
+broadcast_duration = app.metrics.histogram("broadcasts.duration_ms")
+broadcast_recipients = app.metrics.histogram(
+    "broadcasts.recipients", buckets=(1, 10, 100, 1_000, 10_000, 100_000)
+)
 
-class Players(list[Player]):
-    """Currently online players"""
 
-    def __init__(self, *args, **kwargs) -> None:
-        super().__init__(*args, **kwargs)
+class Players:
+    """
+    Currently online players
+
+    Indexed by token, id and safe name, so lookups don't depend on the amount of players online.
+    The id set and privilege partitions (staff, restricted, unrestricted) are kept up to date
+    on append/remove and whenever a player's privileges change, through `update_privileges`
+    """
+
+    def __init__(self, players: Iterable[Player] = ()) -> None:
+        # Maps each player to the token it was indexed under, in login order
+        # (the token is wiped on logout, before the player gets removed)
+        self._players: dict[Player, str] = {}
+
+        self._by_token: dict[str, Player] = {}
+        self._by_id: dict[int, Player] = {}
+        self._by_safe_name: dict[str, Player] = {}
+        # Every session of each account, in login order, the last one is indexed
+        self._sessions: dict[int, list[Player]] = {}
+
+        self._ids: set[int] = set()
+        self._staff: set[Player] = set()
+        self._restricted: set[Player] = set()
+        self._unrestricted: set[Player] = set()
+
+        self._presence_bundle: bytes | None = None
+
+        for player in players:
+            self.append(player)
 
     def __iter__(self) -> Iterator[Player]:
-        return super().__iter__()
+        return iter(self._players)
+
+    def __len__(self) -> int:
+        return len(self._players)
 
     def __contains__(self, player: object) -> bool:
         if isinstance(player, str):
-            return player in (player.name for player in self)
+            return Player.make_safe_name(player) in self._by_safe_name
         else:
-            return super().__contains__(player)
+            return player in self._players
 
     def __repr__(self) -> str:
         return f'[{", ".join(map(repr, self))}]'
 
+    # NOTE: the sets below are maintained in place, they must not be modified by callers
+
     @property
     def ids(self) -> set[int]:
         """Return a set of ID's of currently logged in players"""
-        return {p.id for p in self}
+        return self._ids
 
     @property
     def staff(self) -> set[Player]:
         """Return a set of staff that is currently online"""
-        return {player for player in self if player.privileges & Privileges.STAFF}
+        return self._staff
 
     @property
     def restricted_players(self) -> set[Player]:
         """Return a set of currently logged in restricted players"""
-        return {
-            player for player in self if not player.privileges & Privileges.UNRESTRICTED
-        }
+        return self._restricted
 
     @property
     def unrestricted_players(self) -> set[Player]:
         """Return a set of currently logged in unrestricted players"""
-        return {
-            player for player in self if player.privileges & Privileges.UNRESTRICTED
-        }
+        return self._unrestricted
+
+    def update_privileges(self, player: Player) -> None:
+        """Move `player` to the privilege partitions matching its current privileges"""
+        if player not in self._players:
+            return
+
+        if player.privileges & Privileges.STAFF:
+            self._staff.add(player)
+        else:
+            self._staff.discard(player)
+
+        was_unrestricted = player in self._unrestricted
+
+        if player.privileges & Privileges.UNRESTRICTED:
+            self._restricted.discard(player)
+            self._unrestricted.add(player)
+        else:
+            self._unrestricted.discard(player)
+            self._restricted.add(player)
+
+        if (player in self._unrestricted) != was_unrestricted:
+            self._presence_bundle = None
+
+    @property
+    def presence_bundle(self) -> bytes:
+        """
+        `UserPresenceBundle` packet of all online unrestricted players, only
+        re-encoded after one logged in or out, or got (un)restricted
+        """
+        if self._presence_bundle is None:
+            # A set, as two sessions of the same account may both be partitioned
+            self._presence_bundle = Packets.UserPresenceBundle(
+                sorted({player.id for player in self._unrestricted})
+            )
+
+        return self._presence_bundle
+
+    def presences(self, player_ids: Iterable[int]) -> bytes:
+        """Presence packets of online players in `player_ids`, for USER_PRESENCE_REQUEST"""
+        packets = []
+        for player_id in player_ids:
+            player = self._by_id.get(player_id)
+            if player is not None:
+                packets.append(player.presence_packet)
+
+        return b"".join(packets)
+
+    def friends_of(self, player: Player) -> list[Player]:
+        """Return the online players that are in `player`'s friends list"""
+        return [
+            self._by_id[friend_id]
+            for friend_id in player.friends
+            if friend_id in self._by_id
+        ]
 
     def enqueue_packet(
-        self, data: bytes, immune_to_packet: Sequence[Player] = []
-    ) -> None:
-        """Enqueue `data` in a packet to all players, except for those that are in `immune_to_packet`"""
-        for player in self:
-            if player not in immune_to_packet:
-                player.enqueue_packet(data)
+        self,
+        data: bytes,
+        immune_to_packet: Collection[Player] = frozenset(),
+        recipients: Iterable[Player] | None = None,
+        where: Callable[[Player], bool] | None = None,
+        coalesce_key: Hashable | None = None,
+    ) -> int:
+        """
+        Enqueue `data` in a packet to all players, except for those that are in `immune_to_packet`
+
+        `recipients` narrows the broadcast down to a precomputed group, e.g. `unrestricted_players`,
+        `staff` or `friends_of(player)`, and `where` filters recipients further.
+        The same `data` object is shared by every recipient's queue, see `Player.enqueue_packet`
+        for `coalesce_key`.
+
+        Returns the amount of players `data` was enqueued to
+        """
+        start_time = time.perf_counter_ns()
+
+        if not isinstance(data, bytes):
+            data = bytes(data)
+
+        if not isinstance(immune_to_packet, (set, frozenset)):
+            immune_to_packet = set(immune_to_packet)
+
+        if recipients is None:
+            recipients = self
+
+        recipient_count = 0
+        for player in recipients:
+            if player in immune_to_packet:
+                continue
+
+            if where is not None and not where(player):
+                continue
+
+            player.enqueue_packet(data, coalesce_key)
+            recipient_count += 1
+
+        broadcast_duration.observe((time.perf_counter_ns() - start_time) / 1e6)
+        broadcast_recipients.observe(recipient_count)
+
+        return recipient_count
 
     def get(
         self, token: str | None = None, id: int | None = None, name: str | None = None
-    ):
+    ) -> Player | None:
         """Get a player by `token`, `id`, or `name` from cache"""
-        for player in self:
-            if token is not None:
-                if player.token == token:
-                    return player
-            elif id is not None:
-                if player.id == id:
-                    return player
-            elif name is not None:
-                if player.safe_name == player.make_safe_name(name):
-                    return player
+        if token is not None:
+            return self._by_token.get(token)
+        elif id is not None:
+            return self._by_id.get(id)
+        elif name is not None:
+            return self._by_safe_name.get(Player.make_safe_name(name))
 
         return None
 
     def append(self, player: Player) -> None:
         """Append `player` to the list"""
-        if player in self:
+        if player in self._players:
             if DEBUG:
                 log(f"{player} double-added to global player list?")
             return
 
-        super().append(player)
+        self._players[player] = player.token
+        self._by_token[player.token] = player
+        self._by_id[player.id] = player
+        self._by_safe_name[player.safe_name] = player
+        self._sessions.setdefault(player.id, []).append(player)
+
+        self._ids.add(player.id)
+        self.update_privileges(player)
+
+        self._presence_bundle = None
 
     def remove(self, player: Player) -> None:
         """Remove `player` from the list"""
-        if player not in self:
+        if player not in self._players:
             if DEBUG:
                 log(f"{player} removed from player list when not online")
             return
 
-        super().remove(player)
+        token = self._players.pop(player)
+
+        if self._by_token.get(token) is player:
+            del self._by_token[token]
+
+        sessions = self._sessions[player.id]
+        sessions.remove(player)
+
+        if sessions:
+            # Another session of the same account is still online, it's indexed instead
+            self._by_id[player.id] = sessions[-1]
+            self._by_safe_name[player.safe_name] = sessions[-1]
+        else:
+            del self._sessions[player.id]
+            del self._by_id[player.id]
+            self._ids.discard(player.id)
+            if self._by_safe_name.get(player.safe_name) is player:
+                del self._by_safe_name[player.safe_name]
+
+        self._staff.discard(player)
+        self._restricted.discard(player)
+        self._unrestricted.discard(player)
+
+        self._presence_bundle = None
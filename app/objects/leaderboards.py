@@ -0,0 +1,502 @@
+""" leaderboards: players ranked per gamemode and sort key, kept in memory """
+from __future__ import annotations
+
+from bisect import bisect_left
+from bisect import bisect_right
+from bisect import insort
+from dataclasses import dataclass
+from typing import Any
+from typing import Iterable
+from typing import Iterator
+
+from app.constants.gamemodes import GameMode
+from app.objects.stats import ModeData
+from app.objects.score import Grade
+
+__all__ = ("RankedList", "Leaderboard", "LeaderboardPlayer", "Leaderboards")
+
+# `sort` values of /v1/leaderboard, mapped to the `ModeData` attribute they rank by
+SORTS = {
+    "tscore": "total_score",
+    "rscore": "ranked_score",
+    "pp": "pp",
+    "acc": "acc",
+    "plays": "playcount",
+    "playtime": "playtime",
+}
+
+# Sort key of a ranked player, best first: (-value, -player id), ties are
+# broken like `ORDER BY value DESC, id DESC` so pages match the SQL path
+RankKey = tuple[Any, int]
+
+
+class RankedList:
+    """
+    Sorted list that can be indexed by position in O(log n)
+
+    Keys are kept in buckets of up to `2 * BUCKET_SIZE` sorted keys, with a Fenwick
+    tree over the bucket sizes to find which bucket holds the nth key.
+    Inserting or removing a key only touches one bucket and O(log n) tree nodes,
+    unless a bucket is split or dropped, the tree is then rebuilt in O(n / BUCKET_SIZE)
+    """
+
+    BUCKET_SIZE = 512
+
+    def __init__(self, keys: Iterable[RankKey] = ()) -> None:
+        self._buckets: list[list[RankKey]] = []
+        # Largest key of each bucket, to find the bucket a key belongs in
+        self._maxes: list[RankKey] = []
+        # 1-indexed Fenwick tree over len(bucket) for each bucket
+        self._tree: list[int] = [0]
+        self._len = 0
+
+        sorted_keys = sorted(keys)
+        for start in range(0, len(sorted_keys), self.BUCKET_SIZE):
+            bucket = sorted_keys[start : start + self.BUCKET_SIZE]
+            self._buckets.append(bucket)
+            self._maxes.append(bucket[-1])
+
+        self._len = len(sorted_keys)
+        self._build_tree()
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[RankKey]:
+        for bucket in self._buckets:
+            yield from bucket
+
+    def __repr__(self) -> str:
+        return f"<RankedList {self._len} keys in {len(self._buckets)} buckets>"
+
+    def add(self, key: RankKey) -> None:
+        if not self._buckets:
+            self._buckets.append([key])
+            self._maxes.append(key)
+            self._len = 1
+            self._build_tree()
+            return
+
+        bucket_index = bisect_left(self._maxes, key)
+        if bucket_index == len(self._buckets):
+            bucket_index -= 1
+
+        bucket = self._buckets[bucket_index]
+        insort(bucket, key)
+        self._maxes[bucket_index] = bucket[-1]
+        self._len += 1
+
+        if len(bucket) > 2 * self.BUCKET_SIZE:
+            self._buckets[bucket_index : bucket_index + 1] = [
+                bucket[: self.BUCKET_SIZE],
+                bucket[self.BUCKET_SIZE :],
+            ]
+            self._maxes[bucket_index : bucket_index + 1] = [
+                bucket[self.BUCKET_SIZE - 1],
+                bucket[-1],
+            ]
+            self._build_tree()
+        else:
+            self._tree_add(bucket_index, 1)
+
+    def remove(self, key: RankKey) -> None:
+        """Remove `key`, raises `KeyError` if it isn't in the list"""
+        bucket_index = bisect_left(self._maxes, key)
+        if bucket_index == len(self._buckets):
+            raise KeyError(key)
+
+        bucket = self._buckets[bucket_index]
+        index = bisect_left(bucket, key)
+        if bucket[index] != key:
+            raise KeyError(key)
+
+        del bucket[index]
+        self._len -= 1
+
+        if not bucket:
+            del self._buckets[bucket_index]
+            del self._maxes[bucket_index]
+            self._build_tree()
+        else:
+            self._maxes[bucket_index] = bucket[-1]
+            self._tree_add(bucket_index, -1)
+
+    def index(self, key: RankKey) -> int:
+        """Position of `key`, raises `KeyError` if it isn't in the list"""
+        bucket_index = bisect_left(self._maxes, key)
+        if bucket_index == len(self._buckets):
+            raise KeyError(key)
+
+        bucket = self._buckets[bucket_index]
+        index = bisect_left(bucket, key)
+        if bucket[index] != key:
+            raise KeyError(key)
+
+        return self._items_before(bucket_index) + index
+
+    def bisect_right(self, key: RankKey) -> int:
+        """Amount of keys lower than or equal to `key`"""
+        bucket_index = bisect_right(self._maxes, key)
+        if bucket_index == len(self._buckets):
+            return self._len
+
+        bucket = self._buckets[bucket_index]
+        return self._items_before(bucket_index) + bisect_right(bucket, key)
+
+    def slice(self, offset: int, limit: int) -> list[RankKey]:
+        """Up to `limit` keys, starting at position `offset`"""
+        if offset >= self._len or limit <= 0:
+            return []
+
+        bucket_index, index = self._locate(offset)
+
+        keys: list[RankKey] = []
+        while bucket_index < len(self._buckets) and len(keys) < limit:
+            bucket = self._buckets[bucket_index]
+            keys.extend(bucket[index : index + limit - len(keys)])
+            bucket_index += 1
+            index = 0
+
+        return keys
+
+    def _build_tree(self) -> None:
+        tree = [0] + [len(bucket) for bucket in self._buckets]
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+
+        self._tree = tree
+
+    def _tree_add(self, bucket_index: int, delta: int) -> None:
+        i = bucket_index + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _items_before(self, bucket_index: int) -> int:
+        """Amount of keys in the buckets before `bucket_index`"""
+        total = 0
+        i = bucket_index
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+
+        return total
+
+    def _locate(self, position: int) -> tuple[int, int]:
+        """Bucket index and index within that bucket of the key at `position`"""
+        bucket_index = 0
+        remaining = position
+
+        step = 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            next_index = bucket_index + step
+            if next_index < len(self._tree) and self._tree[next_index] <= remaining:
+                bucket_index = next_index
+                remaining -= self._tree[next_index]
+            step >>= 1
+
+        return bucket_index, remaining
+
+
+class Leaderboard:
+    """
+    Players ranked by a single stat in a single gamemode, globally and per country
+
+    Countries are case insensitive, like they are when filtering in MySQL
+    """
+
+    def __init__(self) -> None:
+        self._ranking = RankedList()
+        self._country_rankings: dict[str, RankedList] = {}
+        # Maps player ids to their current key and country
+        self._entries: dict[int, tuple[RankKey, str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, player_id: int) -> bool:
+        return player_id in self._entries
+
+    def __repr__(self) -> str:
+        return f"<Leaderboard {len(self)} players>"
+
+    def load(self, entries: Iterable[tuple[int, Any, str]]) -> None:
+        """Replace every entry with `entries` of (player id, value, country)"""
+        self._entries = {
+            player_id: ((-value, -player_id), country.lower())
+            for player_id, value, country in entries
+            if value > 0
+        }
+
+        self._ranking = RankedList(key for key, _ in self._entries.values())
+
+        # Taken from the sorted ranking, so they're already in order when sorted again
+        country_keys: dict[str, list[RankKey]] = {}
+        for key in self._ranking:
+            country_keys.setdefault(self._entries[-key[1]][1], []).append(key)
+
+        self._country_rankings = {
+            country: RankedList(keys) for country, keys in country_keys.items()
+        }
+
+    def set(self, player_id: int, value: Any, country: str) -> None:
+        """Rank the player by `value`, players without a positive value aren't ranked"""
+        self.remove(player_id)
+
+        if value <= 0:
+            return
+
+        country = country.lower()
+        key = (-value, -player_id)
+        self._entries[player_id] = (key, country)
+        self._ranking.add(key)
+
+        country_ranking = self._country_rankings.get(country)
+        if country_ranking is None:
+            country_ranking = self._country_rankings[country] = RankedList()
+        country_ranking.add(key)
+
+    def remove(self, player_id: int) -> None:
+        entry = self._entries.pop(player_id, None)
+        if entry is None:
+            return
+
+        key, country = entry
+        self._ranking.remove(key)
+
+        country_ranking = self._country_rankings[country]
+        country_ranking.remove(key)
+        if not country_ranking:
+            del self._country_rankings[country]
+
+    def page(
+        self,
+        offset: int,
+        limit: int,
+        country: str | None = None,
+        after: tuple[Any, int] | None = None,
+    ) -> list[int]:
+        """
+        Ids of the players ranked `offset + 1` to `offset + limit`,
+        counting from the player ranked right after `after` (value, player id) if given
+        """
+        if country is None:
+            ranking = self._ranking
+        else:
+            ranking = self._country_rankings.get(country.lower())
+            if ranking is None:
+                return []
+
+        if after is not None:
+            value, player_id = after
+            offset += ranking.bisect_right((-value, -player_id))
+
+        return [-negated_id for _, negated_id in ranking.slice(offset, limit)]
+
+    def count(self, country: str | None = None) -> int:
+        if country is None:
+            return len(self._ranking)
+
+        ranking = self._country_rankings.get(country.lower())
+        return len(ranking) if ranking is not None else 0
+
+    def rank(self, player_id: int, country: str | None = None) -> int | None:
+        """The player's 1-based rank, `None` if they aren't ranked"""
+        entry = self._entries.get(player_id)
+        if entry is None:
+            return None
+
+        key, player_country = entry
+        if country is None:
+            return self._ranking.index(key) + 1
+        elif country.lower() == player_country:
+            return self._country_rankings[player_country].index(key) + 1
+        else:
+            return None
+
+
+@dataclass(slots=True)
+class LeaderboardPlayer:
+    id: int
+    name: str
+    country: str
+    clan_id: int | None
+
+
+class Leaderboards:
+    """
+    A `Leaderboard` for every valid gamemode and sort, with the data they're shown with
+
+    Only unrestricted players are loaded, restricted players have to be removed
+    with `remove_player` (and are added back by `update_stats`). Loading a million
+    players takes seconds, so reloads should build a new instance off the event loop
+    and swap it in.
+
+    Attributes:
+    -----------
+    loaded: `bool`
+        Whether the leaderboards were loaded from the database yet
+    """
+
+    def __init__(self) -> None:
+        self._leaderboards: dict[tuple[GameMode, str], Leaderboard] = {
+            (mode, sort): Leaderboard()
+            for mode in GameMode.valid_gamemodes()
+            for sort in SORTS
+        }
+        self._players: dict[int, LeaderboardPlayer] = {}
+        self._stats: dict[GameMode, dict[int, ModeData]] = {
+            mode: {} for mode in GameMode.valid_gamemodes()
+        }
+        # Maps clan ids to (name, tag)
+        self._clans: dict[int, tuple[str, str]] = {}
+
+        # Changes made while a replacement is being built, see `start_recording`
+        self._recorded: list[tuple[Any, ...]] | None = None
+
+        self.loaded = False
+
+    def __repr__(self) -> str:
+        return f"<Leaderboards {len(self._players)} players>"
+
+    def get(self, mode: GameMode, sort: str) -> Leaderboard:
+        return self._leaderboards[mode, sort]
+
+    def player(self, player_id: int) -> LeaderboardPlayer | None:
+        return self._players.get(player_id)
+
+    def start_recording(self) -> None:
+        """
+        Record every change made from now on, so they can be applied
+        with `replay` to a replacement built from data read meanwhile
+        """
+        if self._recorded is None:
+            self._recorded = []
+
+    def stop_recording(self) -> None:
+        self._recorded = None
+
+    def replay(self, leaderboards: Leaderboards) -> None:
+        """Apply the changes recorded so far to `leaderboards`, and stop recording"""
+        recorded, self._recorded = self._recorded or [], None
+
+        for method, *args in recorded:
+            getattr(leaderboards, method)(*args)
+
+    def load(
+        self,
+        players: Iterable[LeaderboardPlayer],
+        stats: Iterable[tuple[int, GameMode, ModeData]],
+        clans: dict[int, tuple[str, str]],
+    ) -> None:
+        """Replace every leaderboard with `stats` of (player id, mode, stats)"""
+        self._players = {player.id: player for player in players}
+        self._clans = clans
+
+        self._stats = {mode: {} for mode in GameMode.valid_gamemodes()}
+        for player_id, mode, mode_stats in stats:
+            if player_id in self._players and mode in self._stats:
+                self._stats[mode][player_id] = mode_stats
+
+        for (mode, sort), leaderboard in self._leaderboards.items():
+            attribute = SORTS[sort]
+            leaderboard.load(
+                (
+                    player_id,
+                    getattr(mode_stats, attribute),
+                    self._players[player_id].country,
+                )
+                for player_id, mode_stats in self._stats[mode].items()
+            )
+
+        self.loaded = True
+
+    def update_stats(
+        self,
+        player_id: int,
+        mode: GameMode,
+        stats: ModeData,
+        player: LeaderboardPlayer | None = None,
+    ) -> None:
+        """
+        Re-rank the player in `mode` after their stats changed (e.g. a new score)
+
+        Players who aren't on the leaderboards yet (registered or unrestricted
+        since they were loaded) are added if `player` is given
+        """
+        if self._recorded is not None:
+            self._recorded.append(("update_stats", player_id, mode, stats, player))
+
+        if mode not in self._stats:
+            return
+
+        if player_id in self._players:
+            player = self._players[player_id]
+        elif player is not None:
+            self._players[player_id] = player
+        else:
+            return
+
+        self._stats[mode][player_id] = stats
+        for sort, attribute in SORTS.items():
+            self._leaderboards[mode, sort].set(
+                player_id, getattr(stats, attribute), player.country
+            )
+
+    def remove_player(self, player_id: int) -> None:
+        """Remove the player from every leaderboard, e.g. on restriction"""
+        if self._recorded is not None:
+            self._recorded.append(("remove_player", player_id))
+
+        if self._players.pop(player_id, None) is None:
+            return
+
+        for mode_stats in self._stats.values():
+            mode_stats.pop(player_id, None)
+
+        for leaderboard in self._leaderboards.values():
+            leaderboard.remove(player_id)
+
+    def page(
+        self,
+        mode: GameMode,
+        sort: str,
+        offset: int,
+        limit: int,
+        country: str | None = None,
+        after: tuple[Any, int] | None = None,
+    ) -> list[dict[str, Any]]:
+        """A page of the leaderboard, formatted like /v1/leaderboard entries"""
+        leaderboard = self._leaderboards[mode, sort]
+
+        entries = []
+        for player_id in leaderboard.page(offset, limit, country, after):
+            player = self._players[player_id]
+            stats = self._stats[mode][player_id]
+            clan_name, clan_tag = self._clans.get(player.clan_id, (None, None))
+            clan_id = player.clan_id if player.clan_id in self._clans else None
+
+            entries.append(
+                {
+                    "id": player.id,
+                    "name": player.name,
+                    "country": player.country,
+                    "total_score": stats.total_score,
+                    "ranked_score": stats.ranked_score,
+                    "pp": stats.pp,
+                    "plays": stats.playcount,
+                    "playtime": stats.playtime,
+                    "acc": stats.acc,
+                    "max_combo": stats.max_combo,
+                    "xh_count": stats.grades[Grade.XH],
+                    "x_count": stats.grades[Grade.X],
+                    "sh_count": stats.grades[Grade.SH],
+                    "s_count": stats.grades[Grade.S],
+                    "a_count": stats.grades[Grade.A],
+                    "clan": {"id": clan_id, "name": clan_name, "tag": clan_tag},
+                }
+            )
+
+        return entries
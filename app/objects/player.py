@@ -6,18 +6,22 @@ from enum import Enum, IntEnum, unique
 from functools import cached_property
 import time
 
-from typing import Any, TypedDict
+from typing import Any, Hashable, TypedDict
 import uuid
+import app.metrics
 import app.packets as Packets
 from app.constants.gamemodes import ALLOWED_GAMEMODES, GameMode
 from app.constants.mods import Mods
 from app.logging import Colors, log
 
-from app.objects.score import Grade
+from app.objects.stats import ModeData
+from app.repositories import players as players_repo
+from app.repositories import stats as stats_repo
 from app.constants.privileges import ClientPrivileges, Privileges
-from app.settings import DOMAIN
+from app.settings import DOMAIN, PLAYER_QUEUE_MAX_BYTES
+import app.state.cache
 import app.state.sessions as Sessions
-from app.state.services import database
+import app.state.write_behind
 from app.types import IPAddress
 
 # from app.utils import escape_enum, pymysql_encode
@@ -25,6 +29,13 @@ from app.types import IPAddress
 
 __all__ = ("ModeData", "Status", "Player")
 
+packet_cache_hits = app.metrics.counter("players.packet_cache.hits")
+packet_cache_misses = app.metrics.counter("players.packet_cache.misses")
+
+queue_coalesced_packets = app.metrics.counter("players.queue.coalesced_packets")
+queue_dropped_packets = app.metrics.counter("players.queue.dropped_packets")
+queue_dropped_bytes = app.metrics.counter("players.queue.dropped_bytes")
+
 
 @unique
 # @pymysql_encode(escape_enum)
@@ -57,23 +68,6 @@ class Action(IntEnum):
     OsuDirect = 13
 
 
-@dataclass
-class ModeData:
-    """A player's stats in a single gamemode."""
-
-    total_score: int
-    ranked_score: int
-    pp: int
-    acc: float
-    playcount: int
-    playtime: int
-    max_combo: int
-    total_hits: int
-    rank: int  # global
-
-    grades: dict[Grade, int]  # XH, X, SH, S, A
-
-
 @dataclass
 class Status:
     """Current user status"""
@@ -161,8 +155,10 @@ class Player:
     tournament_client: `bool`
         Whether this is a tournament client
 
-    queue: `bytearray`
-        Bytes enqueued to the player which will be transmitted at the tail end of their next connection to the server
+    queue: `list[bytes]`
+        Packets enqueued to the player which will be transmitted at the tail end of their next connection to the server.
+        Chunks are stored by reference, so a packet broadcast to many players is only encoded once.
+        Capped at `PLAYER_QUEUE_MAX_BYTES`, low priority packets are coalesced and dropped first
     """
 
     def __init__(
@@ -172,6 +168,8 @@ class Player:
         self.name = name
         self.safe_name = self.make_safe_name(self.name)
 
+        self._presence_packet: tuple[tuple[Any, ...], bytes] | None = None
+
         if "password_bcrypt" in extras:
             self.password_bcrypt: bytes | None = extras["password_bcrypt"]
         else:
@@ -234,17 +232,65 @@ class Player:
         self.last_np: LastNp | None = None
         self.bot_client = extras.get("bot_client", False)
         if self.bot_client:
-            self.enqueue_packet = lambda x: None
+            self.enqueue_packet = lambda data, coalesce_key=None: None
 
         self.tournament_client = extras.get("tournament_client", False)
 
         self.api_key = extras.get("api_key", None)
 
-        self._queue = bytearray()
+        self._queue: list[bytes] = []
+        self._queue_size = 0
+        # Low priority packets in the queue, by coalesce key, oldest first
+        self._low_priority_packets: dict[Hashable, int] = {}
 
     def __repr__(self) -> str:
         return f"<{self.name} (id: {self.id})"
 
+    @property
+    def privileges(self) -> Privileges:
+        return self._privileges
+
+    @privileges.setter
+    def privileges(self, privileges: Privileges) -> None:
+        self._privileges = privileges
+
+        if "bancho_privileges" in self.__dict__:
+            # Wipe cached bancho privileges
+            del self.bancho_privileges
+
+        # Keep the online players' privilege partitions up to date
+        Sessions.online_players.update_privileges(self)
+
+    def _presence_key(self) -> tuple[Any, ...]:
+        """
+        Everything the presence packet is encoded from, the status, stats and
+        geolocation are changed in place so their values are compared
+        """
+        geolocation = self.geolocation
+        return (
+            self.name,
+            self.utc_offset,
+            geolocation["country"]["numeric"],
+            geolocation["longitude"],
+            geolocation["latitude"],
+            self.bancho_privileges,
+            self.status.mode,
+            self.gamemode_stats.rank,
+        )
+
+    @property
+    def presence_packet(self) -> bytes:
+        """User's `UserPresence` packet, re-encoded only when its contents changed"""
+        key = self._presence_key()
+        if self._presence_packet is not None and self._presence_packet[0] == key:
+            packet_cache_hits.increment()
+            return self._presence_packet[1]
+
+        packet_cache_misses.increment()
+        packet = Packets.UserPresence(self)
+        self._presence_packet = (key, packet)
+        return packet
+
     @property
     def is_online(self) -> bool:
         """Returns true if user has a token (is online)"""
@@ -335,6 +381,79 @@ class Player:
         """Return a safe name for usage with sql"""
         return name.lower().replace(" ", "_")
 
+    def enqueue_packet(self, data: bytes, coalesce_key: Hashable | None = None) -> None:
+        """
+        Enqueue `data` to be sent to the client on its next connection
+
+        Packets with a `coalesce_key` (e.g. `("stats", player_id)`) are low priority:
+        a newer packet replaces a queued one with the same key, and they are the first
+        to be dropped once the queue goes over `PLAYER_QUEUE_MAX_BYTES`
+        """
+        if coalesce_key is not None:
+            index = self._low_priority_packets.get(coalesce_key)
+            if index is not None:
+                growth = len(data) - len(self._queue[index])
+                if self._queue_size + growth <= PLAYER_QUEUE_MAX_BYTES:
+                    self._queue_size += growth
+                    self._queue[index] = data
+                    queue_coalesced_packets.increment()
+                    return
+
+                # Too big to replace it in place, the queued one is outdated
+                # either way, it's dropped and `data` is enqueued as a new packet
+                self._drop_low_priority_packet(coalesce_key)
+
+        if self._queue_size + len(data) > PLAYER_QUEUE_MAX_BYTES:
+            self._drop_low_priority_packets(len(data))
+
+            if self._queue_size + len(data) > PLAYER_QUEUE_MAX_BYTES:
+                queue_dropped_packets.increment()
+                queue_dropped_bytes.increment(len(data))
+                return
+
+        if coalesce_key is not None:
+            self._low_priority_packets[coalesce_key] = len(self._queue)
+
+        self._queue.append(data)
+        self._queue_size += len(data)
+
+    def _drop_low_priority_packets(self, needed_bytes: int) -> None:
+        """Drop the oldest low priority packets until `needed_bytes` fit in the queue"""
+        while (
+            self._low_priority_packets
+            and self._queue_size + needed_bytes > PLAYER_QUEUE_MAX_BYTES
+        ):
+            self._drop_low_priority_packet(next(iter(self._low_priority_packets)))
+
+    def _drop_low_priority_packet(self, coalesce_key: Hashable) -> None:
+        index = self._low_priority_packets.pop(coalesce_key)
+
+        dropped = self._queue[index]
+        self._queue[index] = b""
+        self._queue_size -= len(dropped)
+
+        queue_dropped_packets.increment()
+        queue_dropped_bytes.increment(len(dropped))
+
+    def dequeue(self) -> bytes | None:
+        """Join and return everything enqueued to the client, if anything"""
+        if not self._queue_size:
+            return None
+
+        data = b"".join(self._queue)
+        self._queue.clear()
+        self._queue_size = 0
+        self._low_priority_packets.clear()
+        return data
+
+    def relay_spectate_frames(self, frame_bundle: Packets.ReplayFrameBundle) -> None:
+        """Relay `frame_bundle` to the player's spectators, encoding it only once"""
+        # Header + the bundle as sent by the client, shared by every spectator
+        data = Packets.SpectateFrames(frame_bundle.raw_data)
+
+        for spectator in self.spectators:
+            spectator.enqueue_packet(data)
+
     def logout(self) -> None:
         """Log the user out of the server"""
         self.token = ""
@@ -355,66 +474,62 @@ class Player:
 
         log(f"{self} logged out", Colors.YELLOW)
 
-    def update_privileges(self, new_privileges: Privileges) -> None:
+    async def update_privileges(self, new_privileges: Privileges) -> None:
         """Sets user's `privileges` to `new_privileges`"""
         self.privileges = new_privileges
 
-        # TODO: Update db to have consistent naming
-        query = "UPDATE users SET priv = %(privileges)s WHERE id = %(id)s"
-        arguments = {"privileges": self.privileges, "id": self.id}
-        database.execute(query, arguments)
+        await players_repo.update_privileges(self.id, self.privileges)
 
-        if "bancho_privileges" in self.__dict__:
-            # Wipe cached bancho privileges
-            del self.bancho_privileges
-
-    def add_privileges(self, new_privileges: Privileges) -> None:
+    async def add_privileges(self, new_privileges: Privileges) -> None:
         """Add `new_privileges` to user's privileges"""
         self.privileges |= new_privileges
 
-        # TODO: Update db to have consistent naming
-        query = "UPDATE users SET priv = %(privileges)s WHERE id = %(id)s"
-        arguments = {"privileges": self.privileges, "id": self.id}
-        database.execute(query, arguments)
-
-        if "bancho_privileges" in self.__dict__:
-            # Wipe cached bancho privileges
-            del self.bancho_privileges
+        await players_repo.update_privileges(self.id, self.privileges)
 
         if self.is_online:
             self.enqueue_packet(Packets.BanchoPrivileges(self.bancho_privileges))
 
-    def remove_privileges(self, privileges_to_remove: Privileges) -> None:
+    async def remove_privileges(self, privileges_to_remove: Privileges) -> None:
         """Remove `privileges_to_remove` from user's privileges"""
         self.privileges &= ~privileges_to_remove
 
-        # TODO: Update db to have consistent naming
-        query = "UPDATE users SET priv = %(privileges)s WHERE id = %(id)s"
-        arguments = {"privileges": self.privileges, "id": self.id}
-        database.execute(query, arguments)
-
-        if "bancho_privileges" in self.__dict__:
-            # Wipe cached bancho privileges
-            del self.bancho_privileges
+        await players_repo.update_privileges(self.id, self.privileges)
 
         if self.is_online:
             self.enqueue_packet(Packets.BanchoPrivileges(self.bancho_privileges))
 
-    def restrict(self, staff_member: Player, reason: str) -> None:
-        """Restrict user for `reason` and log to database"""
-        self.remove_privileges(Privileges.UNRESTRICTED)
+    async def restrict(
+        self, staff_member: Player, reason: str, country: str | None = None
+    ) -> None:
+        """
+        Restrict user for `reason` and log to database
 
-        query = "INSERT INTO LOGS (from, to, action, msg, time) VALUES (%(from)s, %(to)s, %(msg)s, NOW())"
-        arguments = {
-            "from": staff_member.id,
-            "to": self.id,
-            "action": "restrict",
-            "msg": reason,
-        }
-        database.execute(query, arguments)
+        `country` is the one the user is ranked in, taken from the leaderboards
+        (loaded from the same users rows as the ranks) if not given,
+        the database is only asked for players who aren't on them yet
+        """
+        await self.remove_privileges(Privileges.UNRESTRICTED)
 
-        # TODO: Remove player from redis rankings
-        # for mode in ALLOWED_GAMEMODES:
+        app.state.write_behind.queue.log(
+            from_id=staff_member.id, to_id=self.id, action="restrict", msg=reason
+        )
+
+        if country is None:
+            leaderboard_player = Sessions.leaderboards.player(self.id)
+            if leaderboard_player is not None:
+                country = leaderboard_player.country
+            else:
+                player_info = await players_repo.get_one(id=self.id)
+                if player_info is not None:
+                    country = player_info["country"]
+
+        Sessions.leaderboards.remove_player(self.id)
+
+        if country is not None:
+            await Sessions.ranks.remove_player(self.id, country)
+
+        # Cached pages would keep showing the player until they expire otherwise
+        app.state.cache.leaderboard_pages.clear()
 
         log(f"{self} got restricted by {staff_member} for {reason}", Colors.RED)
 
@@ -422,3 +537,20 @@ class Player:
 
         if self.is_online:
             self.logout()
+
+    async def unrestrict(self, staff_member: Player, reason: str) -> None:
+        """Lift user's restriction for `reason` and log to database"""
+        await self.add_privileges(Privileges.UNRESTRICTED)
+
+        app.state.write_behind.queue.log(
+            from_id=staff_member.id, to_id=self.id, action="unrestrict", msg=reason
+        )
+
+        # Back on the leaderboards and ranks, like `restrict` takes them off
+        player_info = await players_repo.get_one(id=self.id)
+        if player_info is not None:
+            await stats_repo.add_to_rankings(player_info)
+
+        app.state.cache.leaderboard_pages.clear()
+
+        log(f"{self} got unrestricted by {staff_member} for {reason}", Colors.GREEN)
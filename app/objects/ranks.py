@@ -0,0 +1,271 @@
+""" ranks: players' global and country pp ranks, on pluggable backends """
+from __future__ import annotations
+
+import asyncio
+from typing import Any
+from typing import Iterable
+from typing import Mapping
+from typing import Protocol
+from typing import Sequence
+from typing import TYPE_CHECKING
+
+from app.constants.gamemodes import GameMode
+from app.objects.leaderboards import RankedList
+from app.objects.leaderboards import RankKey
+
+if TYPE_CHECKING:
+    from redis.asyncio import Redis
+
+__all__ = ("RankBackend", "MemoryRankBackend", "RedisRankBackend", "RankService")
+
+
+class RankBackend(Protocol):
+    """
+    Sets of player ids ordered by score, highest first
+
+    Ranks are 0-based here, `RankService` turns them into 1-based ranks
+    """
+
+    async def replace(self, key: str, scores: Mapping[int, float]) -> None:
+        ...
+
+    async def set(self, key: str, player_id: int, score: float) -> None:
+        ...
+
+    async def remove(self, key: str, player_id: int) -> None:
+        ...
+
+    async def rank(self, key: str, player_id: int) -> int | None:
+        ...
+
+    async def ranks(self, key: str, player_ids: Sequence[int]) -> list[int | None]:
+        ...
+
+    async def member_at(self, key: str, rank: int) -> int | None:
+        ...
+
+    async def keys(self, prefix: str) -> list[str]:
+        ...
+
+
+class MemoryRankBackend:
+    """
+    In-process backend, a `RankedList` per key
+
+    Everything is O(log n). Ties are ranked by player id, highest first,
+    like the leaderboards
+    """
+
+    def __init__(self) -> None:
+        # Maps keys to the ranking and every player's current rank key
+        self._rankings: dict[str, tuple[RankedList, dict[int, RankKey]]] = {}
+
+    def __repr__(self) -> str:
+        return f"<MemoryRankBackend {len(self._rankings)} rankings>"
+
+    async def replace(self, key: str, scores: Mapping[int, float]) -> None:
+        # Built in a thread, sorting every player would block the event loop meanwhile
+        self._rankings[key] = await asyncio.to_thread(self._build, scores)
+
+    @staticmethod
+    def _build(scores: Mapping[int, float]) -> tuple[RankedList, dict[int, RankKey]]:
+        keys = {player_id: (-score, -player_id) for player_id, score in scores.items()}
+        return RankedList(keys.values()), keys
+
+    async def set(self, key: str, player_id: int, score: float) -> None:
+        ranking, keys = self._rankings.setdefault(key, (RankedList(), {}))
+
+        previous_key = keys.pop(player_id, None)
+        if previous_key is not None:
+            ranking.remove(previous_key)
+
+        keys[player_id] = (-score, -player_id)
+        ranking.add(keys[player_id])
+
+    async def remove(self, key: str, player_id: int) -> None:
+        if key not in self._rankings:
+            return
+
+        ranking, keys = self._rankings[key]
+        previous_key = keys.pop(player_id, None)
+        if previous_key is not None:
+            ranking.remove(previous_key)
+
+    async def rank(self, key: str, player_id: int) -> int | None:
+        if key not in self._rankings:
+            return None
+
+        ranking, keys = self._rankings[key]
+        rank_key = keys.get(player_id)
+        return ranking.index(rank_key) if rank_key is not None else None
+
+    async def ranks(self, key: str, player_ids: Sequence[int]) -> list[int | None]:
+        return [await self.rank(key, player_id) for player_id in player_ids]
+
+    async def member_at(self, key: str, rank: int) -> int | None:
+        if key not in self._rankings:
+            return None
+
+        ranking, _ = self._rankings[key]
+        rank_keys = ranking.slice(rank, 1)
+        return -rank_keys[0][1] if rank_keys else None
+
+    async def keys(self, prefix: str) -> list[str]:
+        return [key for key in self._rankings if key.startswith(prefix)]
+
+
+class RedisRankBackend:
+    """
+    Redis backend, a sorted set per key, shared by every server using the same Redis
+
+    Everything is O(log n) on the Redis side. Ties are ranked by Redis,
+    by the player ids' string representations
+    """
+
+    # Most members sent by a single ZADD when replacing a set
+    CHUNK_SIZE = 10_000
+
+    def __init__(self, redis: Redis) -> None:
+        self.redis = redis
+
+    def __repr__(self) -> str:
+        return f"<RedisRankBackend {self.redis!r}>"
+
+    async def replace(self, key: str, scores: Mapping[int, float]) -> None:
+        items = list(scores.items())
+
+        async with self.redis.pipeline(transaction=True) as pipeline:
+            pipeline.delete(key)
+            for start in range(0, len(items), self.CHUNK_SIZE):
+                pipeline.zadd(key, dict(items[start : start + self.CHUNK_SIZE]))
+            await pipeline.execute()
+
+    async def set(self, key: str, player_id: int, score: float) -> None:
+        await self.redis.zadd(key, {player_id: score})
+
+    async def remove(self, key: str, player_id: int) -> None:
+        await self.redis.zrem(key, player_id)
+
+    async def rank(self, key: str, player_id: int) -> int | None:
+        return await self.redis.zrevrank(key, player_id)
+
+    async def ranks(self, key: str, player_ids: Sequence[int]) -> list[int | None]:
+        async with self.redis.pipeline(transaction=False) as pipeline:
+            for player_id in player_ids:
+                pipeline.zrevrank(key, player_id)
+            return await pipeline.execute()
+
+    async def member_at(self, key: str, rank: int) -> int | None:
+        members = await self.redis.zrevrange(key, rank, rank)
+        return int(members[0]) if members else None
+
+    async def keys(self, prefix: str) -> list[str]:
+        return [
+            key.decode() if isinstance(key, bytes) else key
+            async for key in self.redis.scan_iter(match=f"{prefix}*")
+        ]
+
+
+class RankService:
+    """Players' pp ranks per gamemode, globally and per country"""
+
+    def __init__(self, backend: RankBackend) -> None:
+        self.backend = backend
+
+        # Changes made while rankings are being reloaded, see `start_recording`
+        self._recorded: list[tuple[Any, ...]] | None = None
+
+    def __repr__(self) -> str:
+        return f"<RankService {self.backend!r}>"
+
+    KEY_PREFIX = "nova:ranks:"
+
+    @classmethod
+    def key(cls, mode: GameMode, country: str | None = None) -> str:
+        if country is None:
+            return f"{cls.KEY_PREFIX}{mode.value}"
+        else:
+            return f"{cls.KEY_PREFIX}{mode.value}:{country.lower()}"
+
+    def start_recording(self) -> None:
+        """
+        Record every change made from now on, so `load` can apply them again
+        on top of rankings loaded from data read meanwhile
+        """
+        if self._recorded is None:
+            self._recorded = []
+
+    def stop_recording(self) -> None:
+        self._recorded = None
+
+    async def load(self, entries: Iterable[tuple[int, GameMode, float, str]]) -> None:
+        """
+        Replace every ranking with `entries` of (player id, mode, pp, country),
+        then apply the changes recorded since `start_recording`
+
+        Rankings nobody is in anymore (e.g. a country whose last ranked
+        player got restricted) are emptied
+        """
+        scores: dict[str, dict[int, float]] = {}
+        for player_id, mode, pp, country in entries:
+            if pp <= 0:
+                continue
+
+            scores.setdefault(self.key(mode), {})[player_id] = pp
+            scores.setdefault(self.key(mode, country), {})[player_id] = pp
+
+        for key, key_scores in scores.items():
+            await self.backend.replace(key, key_scores)
+
+        for key in await self.backend.keys(self.KEY_PREFIX):
+            if key not in scores:
+                await self.backend.replace(key, {})
+
+        recorded, self._recorded = self._recorded or [], None
+        for method, *args in recorded:
+            await getattr(self, method)(*args)
+
+    async def update(
+        self, player_id: int, mode: GameMode, pp: float, country: str
+    ) -> None:
+        """Re-rank the player after their pp changed, players without pp are unranked"""
+        if self._recorded is not None:
+            self._recorded.append(("update", player_id, mode, pp, country))
+
+        for key in (self.key(mode), self.key(mode, country)):
+            if pp > 0:
+                await self.backend.set(key, player_id, pp)
+            else:
+                await self.backend.remove(key, player_id)
+
+    async def remove_player(self, player_id: int, country: str) -> None:
+        """Unrank the player in every gamemode, e.g. on restriction"""
+        if self._recorded is not None:
+            self._recorded.append(("remove_player", player_id, country))
+
+        for mode in GameMode.valid_gamemodes():
+            await self.backend.remove(self.key(mode), player_id)
+            await self.backend.remove(self.key(mode, country), player_id)
+
+    async def rank(
+        self, player_id: int, mode: GameMode, country: str | None = None
+    ) -> int | None:
+        """The player's 1-based rank, `None` if they aren't ranked"""
+        rank = await self.backend.rank(self.key(mode, country), player_id)
+        return rank + 1 if rank is not None else None
+
+    async def ranks(
+        self, player_ids: Sequence[int], mode: GameMode
+    ) -> list[int | None]:
+        """1-based global ranks of many players at once"""
+        ranks = await self.backend.ranks(self.key(mode), player_ids)
+        return [rank + 1 if rank is not None else None for rank in ranks]
+
+    async def player_at(
+        self, rank: int, mode: GameMode, country: str | None = None
+    ) -> int | None:
+        """Id of the player at 1-based `rank`, `None` if nobody is"""
+        if rank < 1:
+            return None
+
+        return await self.backend.member_at(self.key(mode, country), rank - 1)
@@ -0,0 +1,25 @@
+""" stats: a player's stats in a single gamemode """
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+from app.objects.score import Grade
+
+__all__ = ("ModeData",)
+
+
+@dataclass(slots=True)
+class ModeData:
+    """A player's stats in a single gamemode."""
+
+    total_score: int
+    ranked_score: int
+    pp: int
+    acc: float
+    playcount: int
+    playtime: int
+    max_combo: int
+    total_hits: int
+    rank: int  # global
+
+    grades: dict[Grade, int]  # XH, X, SH, S, A
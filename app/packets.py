@@ -1,5 +1,5 @@
 from __future__ import annotations
-from functools import cache, lru_cache
+from functools import cache, cached_property, lru_cache
 import random
 import struct
 
@@ -12,12 +12,39 @@ from dataclasses import dataclass, field
 from enum import IntEnum, unique
 import struct
 
+import numpy as np
+import numpy.typing as npt
+
 if TYPE_CHECKING:
     from app.objects.player import Player
 
 from app.settings import TIMEZONE
 
 SCOREFRAME_FORMAT = struct.Struct("<iBHHHHHHiHH?BB?")
+REPLAYFRAME_FORMAT = struct.Struct("<BBffi")
+REPLAYFRAME_DTYPE = np.dtype(
+    [
+        ("button_state", "u1"),
+        ("taiko_byte", "u1"),
+        ("x", "<f4"),
+        ("y", "<f4"),
+        ("time", "<i4"),
+    ]
+)
+
+PACKET_HEADER = struct.Struct("<HxI")
+
+INT8 = struct.Struct("<b")
+UNSIGNED_INT8 = struct.Struct("<B")
+INT16 = struct.Struct("<h")
+UNSIGNED_INT16 = struct.Struct("<H")
+INT32 = struct.Struct("<i")
+UNSIGNED_INT32 = struct.Struct("<I")
+INT64 = struct.Struct("<q")
+UNSIGNED_INT64 = struct.Struct("<Q")
+FLOAT16 = struct.Struct("<e")
+FLOAT32 = struct.Struct("<f")
+FLOAT64 = struct.Struct("<d")
 
 
 @unique
@@ -217,8 +244,8 @@ class ScoreFrame:
     score_v2: bool
 
     # If score_v2 == True
-    combo_portion: float | None
-    bonus_portion: float | None
+    combo_portion: float | None = None
+    bonus_portion: float | None = None
 
 
 class ReplayFrame:
@@ -239,7 +266,23 @@ class ReplayFrame:
 
 
 class ReplayFrameBundle:
-    replay_frames: list[ReplayFrame]
+    """
+    A bundle of replay frames sent by a player that is being spectated
+
+    Attributes:
+    -----------
+    frames: `numpy.ndarray`
+        The bundle's replay frames as a structured array of `REPLAYFRAME_DTYPE`,
+        a zero-copy, read-only view into the request's body
+
+    replay_frames: `list[ReplayFrame]`
+        The replay frames as objects, only created once they are first accessed
+
+    raw_data: `memoryview`
+        A read-only view of the whole bundle, as sent by the client
+    """
+
+    frames: npt.NDArray[np.void]
     score_frame: ScoreFrame
     action: ReplayAction
     extra: int
@@ -248,20 +291,24 @@ class ReplayFrameBundle:
 
     def __init__(
         self,
-        replay_frames: list[ReplayFrame],
+        frames: npt.NDArray[np.void],
         score_frame: ScoreFrame,
         action: ReplayAction,
         extra: int,
         sequence: int,
         raw_data: memoryview,
     ) -> None:
-        self.replay_frames = replay_frames
+        self.frames = frames
         self.score_frame = score_frame
         self.action = action
         self.extra = extra
         self.sequence = sequence
         self.raw_data = raw_data
 
+    @cached_property
+    def replay_frames(self) -> list[ReplayFrame]:
+        return [ReplayFrame(*frame) for frame in self.frames.tolist()]
+
 
 @dataclass
 class MultiplayerMatch:
@@ -309,6 +356,9 @@ class BanchoPacketReader:
     """
     Class for reading bancho packets from the osu! client's request
 
+    The body is never re-sliced, reads decode in place with `struct.unpack_from`
+    and advance an integer offset instead.
+
     Attributes:
     -----------
     body_view: `memoryview`
@@ -317,27 +367,39 @@ class BanchoPacketReader:
     packet_map: `dict[ClientPackets, BasePacket]`
         A map of registered packets that the reader can handle
 
+    offset: `int`
+        Position of the next byte to read in `body_view`
+
     current_length: `int`
         The length in bytes of the packet currently being handled
+
+    packet_end: `int`
+        Offset at which the packet currently being handled ends
     """
 
     def __init__(self, body_view: memoryview, packet_map: PacketMap) -> None:
         self.body_view = body_view
         self.packet_map = packet_map
+        self.offset = 0
         self.current_length = 0
+        self.packet_end = 0
 
     def __iter__(self) -> Iterator[BasePacket]:
         return self
 
     def __next__(self) -> BasePacket:
+        # Skip whatever the previous packet's handler left unread
+        self.offset = self.packet_end
+        body_length = len(self.body_view)
+
         # Wait to break until we've read the packet's header
-        while self.body_view:
+        while self.offset < body_length:
             packet_type, packet_length = self._read_header()
+            self.packet_end = self.offset + packet_length
 
             if packet_type not in self.packet_map:
-                # Packet type not handled, remove from buffer and continue
-                if packet_length != 0:
-                    self.body_view = self.body_view[packet_length:]
+                # Packet type not handled, skip it and continue
+                self.offset = self.packet_end
 
             else:
                 break
@@ -345,95 +407,94 @@ class BanchoPacketReader:
         else:
             raise StopIteration
 
-        packet_class = self.packet_map[packet_type]
+        packet_class = self.packet_map[packet_type]  # type: ignore[index]
         self.current_length = packet_length
 
         return packet_class(self)
 
-    def _read_header(self) -> tuple[ClientPackets, int]:
+    def _read_header(self) -> tuple[int, int]:
         """Read the header of an osu! packet"""
-        packet_data = struct.unpack("<HxI", self.body_view[:7])
-        self.body_view = self.body_view[7:]
+        packet_type, packet_length = PACKET_HEADER.unpack_from(
+            self.body_view, self.offset
+        )
+        self.offset += PACKET_HEADER.size
 
-        return ClientPackets(packet_data[0]), packet_data[1]
+        return packet_type, packet_length
 
     """ Public API (exposed for packet handler's __init__ methods) """
 
     def read_raw(self) -> memoryview:
-        value = self.body_view[: self.current_length]
-        self.body_view = self.body_view[self.current_length :]
+        value = self.body_view[self.offset : self.packet_end]
+        self.offset = self.packet_end
         return value
 
     # Integral types
 
     def read_int8(self) -> int:
-        value = self.body_view[0]
-        self.body_view = self.body_view[1:]
-
-        if value > 127:
-            return value - 256
+        (value,) = INT8.unpack_from(self.body_view, self.offset)
+        self.offset += 1
 
         return value
 
     def read_unsigned_int8(self) -> int:
-        value = self.body_view[0]
-        self.body_view = self.body_view[1:]
+        value = self.body_view[self.offset]
+        self.offset += 1
 
         return value
 
     def read_int16(self) -> int:
-        value = int.from_bytes(self.body_view[:2], "little", signed=True)
-        self.body_view = self.body_view[2:]
+        (value,) = INT16.unpack_from(self.body_view, self.offset)
+        self.offset += 2
 
         return value
 
     def read_unsigned_int16(self) -> int:
-        value = int.from_bytes(self.body_view[:2], "little", signed=False)
-        self.body_view = self.body_view[2:]
+        (value,) = UNSIGNED_INT16.unpack_from(self.body_view, self.offset)
+        self.offset += 2
 
         return value
 
     def read_int32(self) -> int:
-        value = int.from_bytes(self.body_view[4:], "little", signed=True)
-        self.body_view = self.body_view[4:]
+        (value,) = INT32.unpack_from(self.body_view, self.offset)
+        self.offset += 4
 
         return value
 
     def read_unsigned_int32(self) -> int:
-        value = int.from_bytes(self.body_view[4:], "little", signed=False)
-        self.body_view = self.body_view[4:]
+        (value,) = UNSIGNED_INT32.unpack_from(self.body_view, self.offset)
+        self.offset += 4
 
         return value
 
     def read_int64(self) -> int:
-        value = int.from_bytes(self.body_view[8:], "little", signed=True)
-        self.body_view = self.body_view[8:]
+        (value,) = INT64.unpack_from(self.body_view, self.offset)
+        self.offset += 8
 
         return value
 
     def read_unsigned_int64(self) -> int:
-        value = int.from_bytes(self.body_view[8:], "little", signed=False)
-        self.body_view = self.body_view[8:]
+        (value,) = UNSIGNED_INT64.unpack_from(self.body_view, self.offset)
+        self.offset += 8
 
         return value
 
     # Floating point types
 
     def read_float16(self) -> float:
-        value, _ = struct.unpack_from("<e", self.body_view[:2])
-        self.body_view = self.body_view[2:]
+        (value,) = FLOAT16.unpack_from(self.body_view, self.offset)
+        self.offset += 2
 
         return cast(float, value)
 
     def read_float32(self) -> float:
-        value, _ = struct.unpack_from("<e", self.body_view[:4])
-        self.body_view = self.body_view[4:]
+        (value,) = FLOAT32.unpack_from(self.body_view, self.offset)
+        self.offset += 4
 
         return cast(float, value)
 
     def read_float64(self) -> float:
-        value, _ = struct.unpack_from("<e", self.body_view[:8])
-        self.body_view = self.body_view[8:]
+        (value,) = FLOAT64.unpack_from(self.body_view, self.offset)
+        self.offset += 8
 
         return cast(float, value)
 
@@ -441,37 +502,39 @@ class BanchoPacketReader:
     # Some osu! packets use OsuTypes.Int16 for array length, while others use OsuTypes.Int32
 
     def read_int32_list_int16_length(self) -> tuple[int, ...]:
-        length = int.from_bytes(self.body_view[:2], "little")
-        self.body_view = self.body_view[2:]
+        length = self.read_unsigned_int16()
 
-        value = struct.unpack(f'<{"I" * length}', self.body_view[: length * 4])
-        self.body_view = self.body_view[length * 4 :]
+        value = struct.unpack_from(f"<{length}I", self.body_view, self.offset)
+        self.offset += length * 4
 
         return value
 
     def read_int32_list_int32_length(self) -> tuple[int, ...]:
-        length = int.from_bytes(self.body_view[:4], "little")
-        self.body_view = self.body_view[4:]
+        length = self.read_unsigned_int32()
 
-        value = struct.unpack(f'<{"I" * length}', self.body_view[: length * 4])
-        self.body_view = self.body_view[length * 4 :]
+        value = struct.unpack_from(f"<{length}I", self.body_view, self.offset)
+        self.offset += length * 4
 
         return value
 
     def read_string(self) -> str:
-        exists = self.body_view[0] == 0x0B
-        self.body_view = self.body_view[1:]
+        body_view = self.body_view
+        offset = self.offset
+
+        exists = body_view[offset] == 0x0B
+        offset += 1
 
         if not exists:
             # No string sent.
+            self.offset = offset
             return ""
 
         # Non-empty string, decode str length (ULEB128)
         length = shift = 0
 
         while True:
-            current_byte = self.body_view[0]
-            self.body_view = self.body_view[1:]
+            current_byte = body_view[offset]
+            offset += 1
 
             length |= (current_byte & 0x7F) << shift
             if (current_byte & 0x80) == 0:
@@ -479,8 +542,8 @@ class BanchoPacketReader:
 
             shift += 7
 
-        value = self.body_view[:length].tobytes().decode()
-        self.body_view = self.body_view[length:]
+        value = str(body_view[offset : offset + length], "utf-8")
+        self.offset = offset + length
         return value
 
     # Custom osu! types
@@ -536,8 +599,10 @@ class BanchoPacketReader:
 
     def read_scoreframe(self) -> ScoreFrame:
         """Read an osu! scoreframe from the internal buffer"""
-        score_frame = ScoreFrame(*SCOREFRAME_FORMAT.unpack_from(self.body_view[:29]))
-        self.body_view = self.body_view[29:]
+        score_frame = ScoreFrame(
+            *SCOREFRAME_FORMAT.unpack_from(self.body_view, self.offset)
+        )
+        self.offset += SCOREFRAME_FORMAT.size
 
         if score_frame.score_v2:
             score_frame.combo_portion = self.read_float64()
@@ -546,20 +611,25 @@ class BanchoPacketReader:
         return score_frame
 
     def read_replayframe(self) -> ReplayFrame:
-        return ReplayFrame(
-            button_state=self.read_unsigned_int8(),
-            taiko_byte=self.read_unsigned_int8(),
-            x=self.read_float32(),
-            y=self.read_float32(),
-            time=self.read_int32(),
-        )
+        frame = ReplayFrame(*REPLAYFRAME_FORMAT.unpack_from(self.body_view, self.offset))
+        self.offset += REPLAYFRAME_FORMAT.size
+
+        return frame
 
     def read_replayframe_bundle(self) -> ReplayFrameBundle:
-        raw_data = self.body_view[: self.current_length]
+        raw_data = self.body_view[self.offset : self.packet_end]
 
         extra = self.read_int32()
         frame_count = self.read_unsigned_int16()
-        frames = [self.read_replayframe() for _ in range(frame_count)]
+
+        frames = np.frombuffer(
+            self.body_view,
+            dtype=REPLAYFRAME_DTYPE,
+            count=frame_count,
+            offset=self.offset,
+        )
+        self.offset += frame_count * REPLAYFRAME_DTYPE.itemsize
+
         action = ReplayAction(self.read_unsigned_int8())
         scoreframe = self.read_scoreframe()
         sequence = self.read_unsigned_int16()
@@ -596,14 +666,9 @@ def write_string(string: str) -> bytes:
     return to_return
 
 
-def write_int32_list_2_bytes_length(list: Collection[int]) -> bytearray:
+def write_int32_list_2_bytes_length(list: Collection[int]) -> bytes:
     """Write `list` into bytes (int32 list)"""
-    to_return = bytearray(len(list).to_bytes(2, "little"))
-
-    for element in list:
-        to_return += element.to_bytes(4, "little", signed=True)
-
-    return to_return
+    return struct.pack(f"<H{len(list)}i", len(list), *list)
 
 
 def write_message(
@@ -693,10 +758,124 @@ expand_types: dict[OsuTypes, Callable[..., bytearray]] = {
     # OsuTypes.Match: write_match,
 }
 
+fixed_width_formats: dict[OsuTypes, str] = {
+    OsuTypes.Int8: "b",
+    OsuTypes.UnsignedInt8: "B",
+    OsuTypes.Int16: "h",
+    OsuTypes.UnsignedInt16: "H",
+    OsuTypes.Int32: "i",
+    OsuTypes.UnsignedInt32: "I",
+    OsuTypes.Float32: "f",
+    OsuTypes.Int64: "q",
+    OsuTypes.UnsignedInt64: "Q",
+    OsuTypes.Float64: "d",
+}
+
+
+class PacketLayout:
+    """
+    Layout of a server packet, compiled into a dedicated encoder at import time
+
+    Runs of fixed-width fields are merged into one `struct.Struct`, variable-width
+    fields keep using their `write_*` function. The header is packed together with
+    the body's length, so it never has to be spliced in afterwards.
+
+    Produces the same bytes as `write_packet` called with the same field types.
+
+    Attributes:
+    -----------
+    packet_id: `ServerPackets`
+        The id written in the packet's header
+
+    field_types: `tuple[OsuTypes, ...]`
+        Types of the packet's fields, in order
+
+    encode: `Callable[..., bytes]`
+        The compiled encoder, takes one argument per field
+    """
+
+    def __init__(self, packet_id: ServerPackets, *field_types: OsuTypes) -> None:
+        self.packet_id = packet_id
+        self.field_types = field_types
+        self.encode = self._compile()
+
+    def __repr__(self) -> str:
+        return f"<PacketLayout {self.packet_id!r} {[t.name for t in self.field_types]}>"
+
+    def _compile(self) -> Callable[..., bytes]:
+        packet_id = self.packet_id
+
+        if all(field_type in fixed_width_formats for field_type in self.field_types):
+            # The whole packet is fixed-width, header included
+            formats = "".join(fixed_width_formats[t] for t in self.field_types)
+            packet_struct = struct.Struct(PACKET_HEADER.format + formats)
+            length = packet_struct.size - PACKET_HEADER.size
+
+            if not self.field_types:
+                empty_packet = packet_struct.pack(packet_id, length)
+                return lambda: empty_packet
+
+            pack = packet_struct.pack
+            return lambda *args: pack(packet_id, length, *args)
+
+        writers = self._compile_writers()
+        pack_header = PACKET_HEADER.pack
+
+        def encode(*args: Any) -> bytes:
+            parts = [write(args) for write in writers]
+            body_length = sum(map(len, parts))
+            return b"".join((pack_header(packet_id, body_length), *parts))
+
+        return encode
+
+    def _compile_writers(self) -> list[Callable[[tuple[Any, ...]], Any]]:
+        """Group the fields into writers, each taking the encoder's arguments"""
+        writers: list[Callable[[tuple[Any, ...]], Any]] = []
+        run_start = 0
+        run_formats = ""
+
+        def close_run(run_end: int) -> None:
+            if not run_formats:
+                return
+
+            pack = struct.Struct(f"<{run_formats}").pack
+            start, end = run_start, run_end
+            writers.append(lambda args: pack(*args[start:end]))
+
+        for index, field_type in enumerate(self.field_types):
+            if field_type in fixed_width_formats:
+                if not run_formats:
+                    run_start = index
+                run_formats += fixed_width_formats[field_type]
+                continue
+
+            close_run(index)
+            run_formats = ""
+
+            if field_type == OsuTypes.Raw:
+                writers.append(lambda args, index=index: args[index])
+            elif field_type in noexpand_types:
+                write = noexpand_types[field_type]
+                writers.append(lambda args, index=index, write=write: write(args[index]))
+            elif field_type in expand_types:
+                write = expand_types[field_type]
+                writers.append(
+                    lambda args, index=index, write=write: write(*args[index])
+                )
+            else:
+                raise ValueError(f"Unsupported packet field type: {field_type!r}")
+
+        close_run(len(self.field_types))
+        return writers
+
+
 # Packets
 
 
 # Packet id: 5
+USER_ID = PacketLayout(ServerPackets.USER_ID, OsuTypes.Int32)
+
+
 @cache
 def UserId(response: int) -> bytes:
     """
@@ -714,21 +893,24 @@ def UserId(response: int) -> bytes:
     `-8` - Requires Verification\n
     Anything else - valid id
     """
-    return write_packet(ServerPackets.USER_ID, (response, OsuTypes.Int32))
+    return USER_ID.encode(response)
 
 
 # Packet id: 7
+SEND_MESSAGE = PacketLayout(ServerPackets.SEND_MESSAGE, OsuTypes.Message)
+
+
 def SendMessage(sender: str, message: str, recipient: str, sender_id: int) -> bytes:
-    return write_packet(
-        ServerPackets.SEND_MESSAGE,
-        ((sender, message, recipient, sender_id), OsuTypes.Message),
-    )
+    return SEND_MESSAGE.encode((sender, message, recipient, sender_id))
 
 
 # Packet id: 8
+PONG = PacketLayout(ServerPackets.PONG)
+
+
 @cache
 def Pong() -> bytes:
-    return write_packet(ServerPackets.PONG)
+    return PONG.encode()
 
 
 ACTION_WATCHING = 6
@@ -739,30 +921,34 @@ BOT_STATUSES = (
     (ACTION_WATCHING, "you sleep :3"),
 )
 
+# Packet id: 11
+USER_STATS = PacketLayout(
+    ServerPackets.USER_STATS,
+    OsuTypes.Int32,  # ID
+    OsuTypes.UnsignedInt8,  # Action
+    OsuTypes.String,  # Action info text
+    OsuTypes.String,  # Map md5
+    OsuTypes.Int32,  # Mods
+    OsuTypes.UnsignedInt8,  # Mode
+    OsuTypes.Int32,  # Map ID
+    OsuTypes.Int64,  # Ranked score
+    OsuTypes.Float32,  # Accuracy
+    OsuTypes.Float32,  # Playcount
+    OsuTypes.Int64,  # Total score
+    OsuTypes.Int32,  # Rank
+    OsuTypes.Int16,  # pp
+)
+
 
 @cache
 def bot_stats(player: Player) -> bytes:
     status_id, status_text = random.choice(BOT_STATUSES)
 
-    return write_packet(
-        ServerPackets.USER_STATS,
-        (player.id, OsuTypes.Int32),
-        (status_id, OsuTypes.UnsignedInt8),  # Action
-        (status_text, OsuTypes.String),  # Action info text
-        ("", OsuTypes.String),  # Map md5
-        (0, OsuTypes.Int32),  # Mods
-        (0, OsuTypes.UnsignedInt8),  # Mode
-        (0, OsuTypes.Int32),  # Map ID
-        (0, OsuTypes.Int64),  # Ranked score
-        (100.0, OsuTypes.Float32),  # Accuracy
-        (0, OsuTypes.Int32),  # Playcount
-        (0, OsuTypes.Int64),  # Total score
-        (0, OsuTypes.Int32),  # Rank
-        (2137, OsuTypes.Int16),  # pp
+    return USER_STATS.encode(
+        player.id, status_id, status_text, "", 0, 0, 0, 0, 100.0, 0, 0, 0, 2137
     )
 
 
-# Packet id: 11
 def UserStats(player: Player) -> bytes:
     INGAME_PP_LIMIT = 0x7FFF
     gamemode_stats = player.gamemode_stats
@@ -787,71 +973,100 @@ def UserStats(player: Player) -> bytes:
     total_score = gamemode_stats.total_score
     rank = gamemode_stats.rank
 
-    return write_packet(
-        ServerPackets.USER_STATS,
-        (id, OsuTypes.Int32),
-        (action, OsuTypes.UnsignedInt8),
-        (action_info, OsuTypes.String),
-        (map_md5, OsuTypes.String),
-        (mods, OsuTypes.Int32),
-        (mode, OsuTypes.UnsignedInt8),
-        (map_id, OsuTypes.Int32),
-        (ranked_score, OsuTypes.Int64),
-        (acc, OsuTypes.Float32),
-        (playcount, OsuTypes.Float32),
-        (total_score, OsuTypes.Int64),
-        (rank, OsuTypes.Int32),
-        (pp, OsuTypes.Int16),
+    return USER_STATS.encode(
+        id,
+        action,
+        action_info,
+        map_md5,
+        mods,
+        mode,
+        map_id,
+        ranked_score,
+        acc,
+        playcount,
+        total_score,
+        rank,
+        pp,
     )
 
 
 # Packet id: 12
+USER_LOGOUT = PacketLayout(
+    ServerPackets.USER_LOGOUT, OsuTypes.Int32, OsuTypes.UnsignedInt8
+)
+
+
 @cache
 def Logout(user_id: int) -> bytes:
-    return write_packet(
-        ServerPackets.USER_LOGOUT, (user_id, OsuTypes.Int32), (0, OsuTypes.UnsignedInt8)
-    )
+    return USER_LOGOUT.encode(user_id, 0)
 
 
 # Packet id: 13
+SPECTATOR_JOINED = PacketLayout(ServerPackets.SPECTATOR_JOINED, OsuTypes.Int32)
+
+
 @cache
 def SpectatorJoined(user_id: int) -> bytes:
-    return write_packet(ServerPackets.SPECTATOR_JOINED, (user_id, OsuTypes.Int32))
+    return SPECTATOR_JOINED.encode(user_id)
 
 
 # Packet id: 14
+SPECTATOR_LEFT = PacketLayout(ServerPackets.SPECTATOR_LEFT, OsuTypes.Int32)
+
+
 @cache
 def SpectatorLeft(user_id: int) -> bytes:
-    return write_packet(ServerPackets.SPECTATOR_LEFT, (user_id, OsuTypes.Int32))
+    return SPECTATOR_LEFT.encode(user_id)
+
 
+# Packet id: 15
+SPECTATE_FRAMES = PacketLayout(ServerPackets.SPECTATE_FRAMES, OsuTypes.Raw)
 
-# Packet id: 16
-def SpectateFrames(data: bytes) -> bytes:
-    return write_packet(ServerPackets.SPECTATE_FRAMES, (data, OsuTypes.Raw))
+
+def SpectateFrames(data: bytes | memoryview) -> bytes:
+    """
+    Write the packet 15 (spectate frames)
+
+    `data` is the client's replay frame bundle as-is, so relaying a bundle only costs
+    one copy into the 7-byte header, the result can be shared by every spectator
+    """
+    return SPECTATE_FRAMES.encode(data)
 
 
 # Packet id: 19
+VERSION_UPDATE = PacketLayout(ServerPackets.VERSION_UPDATE)
+
+
 @cache
 def VersionUpdate() -> bytes:
-    return write_packet(ServerPackets.VERSION_UPDATE)
+    return VERSION_UPDATE.encode()
 
 
 # Packet id: 22
+SPECTATOR_CANT_SPECTATE = PacketLayout(
+    ServerPackets.SPECTATOR_CANT_SPECTATE, OsuTypes.Int32
+)
+
+
 def SpectatorCantSpectate(user_id: int) -> bytes:
-    return write_packet(
-        ServerPackets.SPECTATOR_CANT_SPECTATE, (user_id, OsuTypes.Int32)
-    )
+    return SPECTATOR_CANT_SPECTATE.encode(user_id)
 
 
 # Packet id: 23
+GET_ATTENTION = PacketLayout(ServerPackets.GET_ATTENTION)
+
+
 def GetAttention() -> bytes:
-    return write_packet(ServerPackets.GET_ATTENTION)
+    return GET_ATTENTION.encode()
 
 
 # Packet id: 24
+NOTIFICATION = PacketLayout(ServerPackets.NOTIFICATION, OsuTypes.String)
+
+
 @lru_cache(maxsize=4)
 def Notification(message: str) -> bytes:
-    return write_packet(ServerPackets.NOTIFICATION, (message, OsuTypes.String))
+    return NOTIFICATION.encode(message)
 
 
 # TODO: Multiplayer
@@ -866,14 +1081,20 @@ def Notification(message: str) -> bytes:
 
 
 # Packet id: 28
+DISPOSE_MATCH = PacketLayout(ServerPackets.DISPOSE_MATCH, OsuTypes.Int32)
+
+
 @cache
 def DisposeMatch(id: int) -> bytes:
-    return write_packet(ServerPackets.DISPOSE_MATCH, (id, OsuTypes.Int32))
+    return DISPOSE_MATCH.encode(id)
 
 
 # Packet id: 34
+TOGGLE_BLOCK_NON_FRIEND_DMS = PacketLayout(ServerPackets.TOGGLE_BLOCK_NON_FRIEND_DMS)
+
+
 def ToggleBlockNonFriendDMs() -> bytes:
-    return write_packet(ServerPackets.TOGGLE_BLOCK_NON_FRIEND_DMS)
+    return TOGGLE_BLOCK_NON_FRIEND_DMS.encode()
 
 
 # TODO: Multiplayer
@@ -888,16 +1109,24 @@ def ToggleBlockNonFriendDMs() -> bytes:
 
 
 # Packet id: 42
+FELLOW_SPECTATOR_JOINED = PacketLayout(
+    ServerPackets.FELLOW_SPECTATOR_JOINED, OsuTypes.Int32
+)
+
+
 @cache
 def FellowSpectatorJoined(user_id: int) -> bytes:
-    return write_packet(
-        ServerPackets.FELLOW_SPECTATOR_JOINED, (user_id, OsuTypes.Int32)
-    )
+    return FELLOW_SPECTATOR_JOINED.encode(user_id)
 
 
 # Packet id: 43
+FELLOW_SPECTATOR_LEFT = PacketLayout(
+    ServerPackets.FELLOW_SPECTATOR_LEFT, OsuTypes.Int32
+)
+
+
 def FellowSpectatorLeft(user_id: int) -> bytes:
-    return write_packet(ServerPackets.FELLOW_SPECTATOR_LEFT, (user_id, OsuTypes.Int32))
+    return FELLOW_SPECTATOR_LEFT.encode(user_id)
 
 
 # TODO: Multiplayer
@@ -907,210 +1136,311 @@ def FellowSpectatorLeft(user_id: int) -> bytes:
 
 
 # Packet id: 48
+MATCH_SCORE_UPDATE = PacketLayout(
+    ServerPackets.MATCH_SCORE_UPDATE, OsuTypes.ScoreFrame
+)
+
+
 def MatchScoreUpdate(frame: ScoreFrame) -> bytes:
-    return write_packet(ServerPackets.MATCH_SCORE_UPDATE, (frame, OsuTypes.ScoreFrame))
+    return MATCH_SCORE_UPDATE.encode(frame)
 
 
 # Packet id: 50
+MATCH_TRANSFER_HOST = PacketLayout(ServerPackets.MATCH_TRANSFER_HOST)
+
+
 @cache
 def MatchTransferHost() -> bytes:
-    return write_packet(ServerPackets.MATCH_TRANSFER_HOST)
+    return MATCH_TRANSFER_HOST.encode()
 
 
 # Packet id: 53
+MATCH_ALL_PLAYERS_LOADED = PacketLayout(ServerPackets.MATCH_ALL_PLAYERS_LOADED)
+
+
 @cache
 def MatchAllPlayersLoaded() -> bytes:
-    return write_packet(ServerPackets.MATCH_ALL_PLAYERS_LOADED)
+    return MATCH_ALL_PLAYERS_LOADED.encode()
 
 
 # Packet id: 57
+MATCH_PLAYER_FAILED = PacketLayout(ServerPackets.MATCH_PLAYER_FAILED, OsuTypes.Int32)
+
+
 @cache
 def MatchPlayerFailed(slot_id: int) -> bytes:
-    return write_packet(ServerPackets.MATCH_PLAYER_FAILED, (slot_id, OsuTypes.Int32))
+    return MATCH_PLAYER_FAILED.encode(slot_id)
 
 
 # Packet id: 58
+MATCH_COMPLETE = PacketLayout(ServerPackets.MATCH_COMPLETE)
+
+
 @cache
 def MatchComplete() -> bytes:
-    return write_packet(ServerPackets.MATCH_COMPLETE)
+    return MATCH_COMPLETE.encode()
 
 
 # Packet id: 61
+MATCH_SKIP = PacketLayout(ServerPackets.MATCH_SKIP)
+
+
 @cache
 def MatchSkip() -> bytes:
-    return write_packet(ServerPackets.MATCH_SKIP)
+    return MATCH_SKIP.encode()
 
 
 # Packet id: 64
+CHANNEL_JOIN_SUCCESS = PacketLayout(
+    ServerPackets.CHANNEL_JOIN_SUCCESS, OsuTypes.String
+)
+
+
 @lru_cache(maxsize=16)
 def ChannelJoin(name: str) -> bytes:
-    return write_packet(ServerPackets.CHANNEL_JOIN_SUCCESS, (name, OsuTypes.String))
+    return CHANNEL_JOIN_SUCCESS.encode(name)
 
 
 # Packet id: 65
+CHANNEL_INFO = PacketLayout(ServerPackets.CHANNEL_INFO, OsuTypes.Channel)
+
+
 @lru_cache(maxsize=8)
 def ChannelInfo(name: str, topic: str, player_count: int) -> bytes:
-    return write_packet(
-        ServerPackets.CHANNEL_INFO, ((name, topic, player_count), OsuTypes.Channel)
-    )
+    return CHANNEL_INFO.encode((name, topic, player_count))
 
 
 # Packet id: 66
+CHANNEL_KICK = PacketLayout(ServerPackets.CHANNEL_KICK, OsuTypes.String)
+
+
 @lru_cache(maxsize=8)
 def ChannelKick(name: str) -> bytes:
-    return write_packet(ServerPackets.CHANNEL_KICK, (name, OsuTypes.String))
+    return CHANNEL_KICK.encode(name)
 
 
 # Packet id: 67
+CHANNEL_AUTO_JOIN = PacketLayout(ServerPackets.CHANNEL_AUTO_JOIN, OsuTypes.Channel)
+
+
 @lru_cache(maxsize=8)
 def ChannelAutoJoin(name: str, topic: str, player_count: int) -> bytes:
-    return write_packet(
-        ServerPackets.CHANNEL_AUTO_JOIN, ((name, topic, player_count), OsuTypes.Channel)
-    )
+    return CHANNEL_AUTO_JOIN.encode((name, topic, player_count))
 
 
 # Packet id: 71
+PRIVILEGES = PacketLayout(ServerPackets.PRIVILEGES, OsuTypes.Int32)
+
+
 @cache
 def BanchoPrivileges(privileges: int) -> bytes:
-    return write_packet(ServerPackets.PRIVILEGES, (privileges, OsuTypes.Int32))
+    return PRIVILEGES.encode(privileges)
 
 
 # Packet id: 72
+FRIENDS_LIST = PacketLayout(ServerPackets.FRIENDS_LIST, OsuTypes.Int32List2BytesLength)
+
+
 def FriendsList(friends: Collection[int]) -> bytes:
-    return write_packet(
-        ServerPackets.FRIENDS_LIST, (friends, OsuTypes.Int32List2BytesLength)
-    )
+    return FRIENDS_LIST.encode(friends)
 
 
 # Packet id: 75
+PROTOCOL_VERSION = PacketLayout(ServerPackets.PROTOCOL_VERSION, OsuTypes.Int32)
+
+
 @cache
 def ProtocolVersion(version: int) -> bytes:
-    return write_packet(ServerPackets.PROTOCOL_VERSION, (version, OsuTypes.Int32))
+    return PROTOCOL_VERSION.encode(version)
 
 
 # Packet id: 76
+MAIN_MENU_ICON = PacketLayout(ServerPackets.MAIN_MENU_ICON, OsuTypes.String)
+
+
 @cache
 def MainMenuIcon(icon_url: str, onclick_url: str) -> bytes:
-    return write_packet(
-        ServerPackets.MAIN_MENU_ICON, (f"{icon_url}|{onclick_url}", OsuTypes.String)
-    )
+    return MAIN_MENU_ICON.encode(f"{icon_url}|{onclick_url}")
 
 
 # Packet id: 81
+MATCH_PLAYER_SKIPPED = PacketLayout(ServerPackets.MATCH_PLAYER_SKIPPED, OsuTypes.Int32)
+
+
 @cache
 def MatchPlayerSkipped(user_id: int) -> bytes:
-    return write_packet(ServerPackets.MATCH_PLAYER_SKIPPED, (user_id, OsuTypes.Int32))
+    return MATCH_PLAYER_SKIPPED.encode(user_id)
 
 
 # Packet id: 83
+USER_PRESENCE = PacketLayout(
+    ServerPackets.USER_PRESENCE,
+    OsuTypes.Int32,  # ID
+    OsuTypes.String,  # Name
+    OsuTypes.UnsignedInt8,  # UTC offset
+    OsuTypes.UnsignedInt8,  # Country
+    OsuTypes.UnsignedInt8,  # Bancho privileges & mode
+    OsuTypes.Float32,  # Longitude
+    OsuTypes.Float32,  # Latitude
+    OsuTypes.Int32,  # Rank
+)
+
+
 def UserPresence(player: Player) -> bytes:
-    return write_packet(
-        ServerPackets.USER_PRESENCE,
-        (player.id, OsuTypes.Int32),
-        (player.name, OsuTypes.String),
-        (player.utc_offset + 24, OsuTypes.UnsignedInt8),
-        (player.geolocation["country"]["numeric"], OsuTypes.UnsignedInt8),
-        (
-            player.bancho_privileges | (player.status.mode.as_vanilla << 5),
-            OsuTypes.UnsignedInt8,
-        ),
-        (player.geolocation["longitude"], OsuTypes.Float32),
-        (player.geolocation["latitude"], OsuTypes.Float32),
-        (player.gamemode_stats.rank, OsuTypes.Int32),
+    return USER_PRESENCE.encode(
+        player.id,
+        player.name,
+        player.utc_offset + 24,
+        player.geolocation["country"]["numeric"],
+        player.bancho_privileges | (player.status.mode.as_vanilla << 5),
+        player.geolocation["longitude"],
+        player.geolocation["latitude"],
+        player.gamemode_stats.rank,
     )
 
 
 @cache
 def BotPresence(player: Player) -> bytes:
-    return write_packet(
-        ServerPackets.USER_PRESENCE,
-        (player.id, OsuTypes.Int32),
-        (player.name, OsuTypes.String),
-        (int(TIMEZONE[4::]) + 24, OsuTypes.UnsignedInt8),
-        (245, OsuTypes.UnsignedInt8),  # Satellite Provider
-        (31, OsuTypes.UnsignedInt8),
-        (1234.0, OsuTypes.Float32),  # Coordinates out
-        (4321.0, OsuTypes.Float32),  # of the map
-        (0, OsuTypes.Int32),
+    return USER_PRESENCE.encode(
+        player.id,
+        player.name,
+        int(TIMEZONE[4::]) + 24,
+        245,  # Satellite Provider
+        31,
+        1234.0,  # Coordinates out
+        4321.0,  # of the map
+        0,
     )
 
 
 # Packet id: 86
+RESTART = PacketLayout(ServerPackets.RESTART, OsuTypes.Int32)
+
+
 @cache
 def ServerRestarted(ms: int) -> bytes:
-    return write_packet(ServerPackets.RESTART, (ms, OsuTypes.Int32))
+    return RESTART.encode(ms)
 
 
 # Packet id: 88
+MATCH_INVITE = PacketLayout(ServerPackets.MATCH_INVITE, OsuTypes.Message)
+
+
 def MatchInvite(player: Player, target_name: str) -> bytes:
     assert player.match is not None
     message = f"Come join my game: {player.match.embed}"
 
-    return write_packet(
-        ServerPackets.MATCH_INVITE,
-        ((player.name, message, target_name, player.id), OsuTypes.Message),
-    )
+    return MATCH_INVITE.encode((player.name, message, target_name, player.id))
 
 
 # Packet id: 89
+CHANNEL_INFO_END = PacketLayout(ServerPackets.CHANNEL_INFO_END)
+
+
 @cache
 def ChannelInfoEnd() -> bytes:
-    return write_packet(ServerPackets.CHANNEL_INFO_END)
+    return CHANNEL_INFO_END.encode()
 
 
 # Packet id: 91
+MATCH_CHANGE_PASSWORD = PacketLayout(
+    ServerPackets.MATCH_CHANGE_PASSWORD, OsuTypes.String
+)
+
+
 def MatchChangePassword(new_password: str) -> bytes:
-    return write_packet(
-        ServerPackets.MATCH_CHANGE_PASSWORD, (new_password, OsuTypes.String)
-    )
+    return MATCH_CHANGE_PASSWORD.encode(new_password)
 
 
 # Packet id: 92
+SILENCE_END = PacketLayout(ServerPackets.SILENCE_END, OsuTypes.Int32)
+
+
 def SilenceEnd(delta: int) -> bytes:
-    return write_packet(ServerPackets.SILENCE_END, (delta, OsuTypes.Int32))
+    return SILENCE_END.encode(delta)
 
 
 # Packet id: 94
+USER_SILENCED = PacketLayout(ServerPackets.USER_SILENCED, OsuTypes.Int32)
+
+
 @cache
 def UserSilenced(user_id: int) -> bytes:
-    return write_packet(ServerPackets.USER_SILENCED, (user_id, OsuTypes.Int32))
+    return USER_SILENCED.encode(user_id)
+
+
+# Packet id: 96
+USER_PRESENCE_BUNDLE = PacketLayout(
+    ServerPackets.USER_PRESENCE_BUNDLE, OsuTypes.Int32List2BytesLength
+)
+
+
+def UserPresenceBundle(player_ids: Collection[int]) -> bytes:
+    """
+    Write the packet 96 (user presence bundle)
+
+    Only tells the client who is online, it then asks for the full presence
+    of the players it needs with USER_PRESENCE_REQUEST
+    """
+    return USER_PRESENCE_BUNDLE.encode(player_ids)
 
 
 # Packet id: 100
+USER_DM_BLOCKED = PacketLayout(ServerPackets.USER_DM_BLOCKED, OsuTypes.Message)
+
+
 def UserDMBlocked(target: str) -> bytes:
-    return write_packet(
-        ServerPackets.USER_DM_BLOCKED, (("", "", target, 0), OsuTypes.Message)
-    )
+    return USER_DM_BLOCKED.encode(("", "", target, 0))
 
 
 # Packet id: 101
+TARGET_IS_SILENCED = PacketLayout(ServerPackets.TARGET_IS_SILENCED, OsuTypes.String)
+
+
 def TargetSilenced(target: str) -> bytes:
-    return write_packet(ServerPackets.TARGET_IS_SILENCED, (target, OsuTypes.String))
+    return TARGET_IS_SILENCED.encode(target)
 
 
 # Packet id: 102
+VERSION_UPDATE_FORCED = PacketLayout(ServerPackets.VERSION_UPDATE_FORCED)
+
+
 @cache
 def VersionUpdateForced() -> bytes:
-    return write_packet(ServerPackets.VERSION_UPDATE_FORCED)
+    return VERSION_UPDATE_FORCED.encode()
 
 
 # Packet id: 103
+SWITCH_SERVER = PacketLayout(ServerPackets.SWITCH_SERVER, OsuTypes.Int32)
+
+
 def SwitchServer(timeout: int) -> bytes:
-    return write_packet(ServerPackets.SWITCH_SERVER, (timeout, OsuTypes.Int32))
+    return SWITCH_SERVER.encode(timeout)
 
 
 # Packet id: 104
+ACCOUNT_RESTRICTED = PacketLayout(ServerPackets.ACCOUNT_RESTRICTED)
+
+
 @cache
 def AccountRestricted() -> bytes:
-    return write_packet(ServerPackets.ACCOUNT_RESTRICTED)
+    return ACCOUNT_RESTRICTED.encode()
 
 
 # Packet id: 106
+MATCH_ABORT = PacketLayout(ServerPackets.MATCH_ABORT)
+
+
 @cache
 def MatchAbort() -> bytes:
-    return write_packet(ServerPackets.MATCH_ABORT)
+    return MATCH_ABORT.encode()
 
 
 # Packet id: 107
+SWITCH_TOURNAMENT_SERVER = PacketLayout(
+    ServerPackets.SWITCH_TOURNAMENT_SERVER, OsuTypes.String
+)
+
+
 def SwitchTournamentServer(ip: str) -> bytes:
-    return write_packet(ServerPackets.SWITCH_TOURNAMENT_SERVER, (ip, OsuTypes.String))
+    return SWITCH_TOURNAMENT_SERVER.encode(ip)
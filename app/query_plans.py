@@ -0,0 +1,53 @@
+""" query plans: EXPLAIN checks making sure hot queries are served by indexes """
+from __future__ import annotations
+
+from typing import Any
+from typing import TYPE_CHECKING
+
+from app.logging import Colors
+from app.logging import log
+
+if TYPE_CHECKING:
+    from app.adapters.instrumented_database import InstrumentedDatabase
+
+__all__ = ("register", "full_scans", "check")
+
+# Registered queries by name, with example parameters to EXPLAIN them with
+_queries: dict[str, tuple[str, dict[str, Any]]] = {}
+
+
+def register(name: str, query: str, params: dict[str, Any] | None = None) -> None:
+    """
+    Have `check` make sure the query doesn't scan whole tables
+
+    Queries that are meant to read whole tables (e.g. loading every player
+    into memory) shouldn't be registered
+    """
+    _queries[name] = (query, params or {})
+
+
+async def full_scans(database: InstrumentedDatabase, name: str) -> list[str]:
+    """Tables the registered query called `name` reads in full"""
+    query, params = _queries[name]
+    plan = await database.fetch_all(f"EXPLAIN {query}", params, primary=True)
+    return [row["table"] for row in plan if row["type"] == "ALL"]
+
+
+async def check(database: InstrumentedDatabase) -> bool:
+    """
+    EXPLAIN every registered query, logging the ones scanning whole tables
+
+    MySQL happily scans tiny tables in full, so this is only meaningful
+    against a database holding a realistic amount of rows
+    """
+    passed = True
+
+    for name in sorted(_queries):
+        tables = await full_scans(database, name)
+        if tables:
+            passed = False
+            log(f"{name} scans {', '.join(tables)} in full", Colors.RED)
+        else:
+            log(f"{name} uses indexes", Colors.GREEN)
+
+    return passed
@@ -3,8 +3,12 @@ from __future__ import annotations
 
 import textwrap
 from typing import Any
+from typing import AsyncIterator
+from typing import Mapping
 from typing import Optional
+from typing import Sequence
 
+import app.query_plans
 import app.state
 
 READ_PARAMS = textwrap.dedent(
@@ -15,13 +19,16 @@ READ_PARAMS = textwrap.dedent(
     """,
 )
 
+# Most values bound in a single `IN (...)` list, bigger lookups are split up
+GET_MANY_CHUNK_SIZE = 1000
+
 
 def make_safe_name(name: str) -> str:
     """Returns a name that is safe for use with MySQL"""
     return name.lower().replace(" ", "_")
 
 
-def create(
+async def create(
     name: str,
     email: str,
     pw_bcrypt: bytes,
@@ -39,10 +46,10 @@ def create(
         "pw_bcrypt": pw_bcrypt,
         "country": country,
     }
-    cursor = app.state.services.database.cursor()
+    rec_id = await app.state.services.database.execute(query, params)
 
-    rec_id = cursor.execute(query, params)
-    app.state.services.database.commit()
+    # The name or email may have belonged to another account that got cached
+    app.state.cache.players.invalidate(safe_name=params["safe_name"], email=email)
 
     query = f"""\
         SELECT {READ_PARAMS}
@@ -52,18 +59,56 @@ def create(
     params = {
         "id": rec_id,
     }
-    cursor.execute(query, params)
-    rec = cursor.fetchone()
+    # Read back from the primary, replicas may not have the new row yet
+    rec = await app.state.services.database.fetch_one(query, params, primary=True)
     assert rec is not None
+
+    app.state.cache.players.set(rec, email=email)
+    if app.state.cache.player_counts.loaded:
+        app.state.cache.player_counts.add(rec)
+
     return rec
 
 
-def get_one(
-    id: Optional[int] = None, name: Optional[str] = None, email: Optional[str] = None
-):
+async def get_one(
+    id: Optional[int] = None,
+    name: Optional[str] = None,
+    email: Optional[str] = None,
+    primary: bool = False,
+) -> dict[str, Any] | None:
+    """
+    Fetch a player by any of `id`, `name` and `email`
+
+    Read from the primary if `primary` is set, or if the player's privileges
+    were just written and the replicas may not have them yet
+    """
     if id is None and name is None and email is None:
         raise ValueError("players repo: get_one: Must provide at least one parameter")
 
+    safe_name = make_safe_name(name) if name is not None else None
+
+    player = app.state.cache.players.get(id=id, safe_name=safe_name, email=email)
+    if player is not None:
+        return player
+
+    query, params = get_one_query(id, safe_name, email)
+
+    if id is not None and app.state.write_behind.queue.privileges_written_recently(id):
+        primary = True
+
+    player = await app.state.services.database.fetch_one(query, params, primary=primary)
+
+    if player is not None:
+        _apply_pending_writes(player)
+        app.state.cache.players.set(player, email=email)
+
+    return player
+
+
+def get_one_query(
+    id: Optional[int], safe_name: Optional[str], email: Optional[str]
+) -> tuple[str, dict[str, Any]]:
+    """Query and params of the player matching every given column"""
     query = f"""
         SELECT {READ_PARAMS}
         FROM users
@@ -72,7 +117,7 @@ def get_one(
 
     conditions = [
         ("id", id),
-        ("safe_name", make_safe_name(name) if name is not None else None),
+        ("safe_name", safe_name),
         ("email", email),
     ]
 
@@ -87,39 +132,188 @@ def get_one(
     if query_conditions:
         query += " AND ".join(query_conditions)
 
-    cursor = app.state.services.database.cursor()
-
-    cursor.execute(query, params)
-
-    result = cursor.fetchone()
-
-    player = (
-        {
-            "id": result[0],
-            "name": result[1],
-            "safe_name": result[2],
-            "priv": result[3],
-            "country": result[4],
-            "silence_end": result[5],
-            "donor_end": result[6],
-            "creation_time": result[7],
-            "latest_activity": result[8],
-            "clan_id": result[9],
-            "clan_priv": result[10],
-            "preferred_mode": result[11],
-            "play_style": result[12],
-            "custom_badge_name": result[13],
-            "custom_badge_icon": result[14],
-            "userpage_content": result[15],
-        }
-        if result is not None
-        else None
-    )
+    return query, params
 
-    return player
 
+app.query_plans.register("players.get_one.id", *get_one_query(1, None, None))
+app.query_plans.register(
+    "players.get_one.safe_name", *get_one_query(None, "nova", None)
+)
+app.query_plans.register("players.get_one.email", *get_one_query(None, None, "a@b.c"))
+
+
+async def get_many(
+    ids: Optional[Sequence[int]] = None, names: Optional[Sequence[str]] = None
+) -> list[dict[str, Any]]:
+    """
+    Fetch the players matching `ids` and `names`, one query per chunk of missing keys
+
+    Players come back in input order, `ids` first, then `names`.
+    Unknown players are skipped, as are players that were already returned
+    """
+    if ids is None and names is None:
+        raise ValueError("players repo: get_many: Must provide at least one parameter")
+
+    ids = list(ids) if ids is not None else []
+    safe_names = [make_safe_name(name) for name in names] if names is not None else []
+
+    found_by_id: dict[int, dict[str, Any]] = {}
+    found_by_safe_name: dict[str, dict[str, Any]] = {}
+
+    missing_ids = []
+    for id in dict.fromkeys(ids):
+        player = app.state.cache.players.get(id=id)
+        if player is not None:
+            found_by_id[id] = player
+        else:
+            missing_ids.append(id)
+
+    async for rows in _fetch_in_chunks("id", missing_ids):
+        for player in rows:
+            _apply_pending_writes(player)
+            app.state.cache.players.set(player)
+            found_by_id[player["id"]] = player
+
+    # Names are looked up after ids, players just fetched by id are cached by then
+    missing_safe_names = []
+    for safe_name in dict.fromkeys(safe_names):
+        player = app.state.cache.players.get(safe_name=safe_name)
+        if player is not None:
+            found_by_safe_name[safe_name] = player
+        else:
+            missing_safe_names.append(safe_name)
+
+    async for rows in _fetch_in_chunks("safe_name", missing_safe_names):
+        for player in rows:
+            _apply_pending_writes(player)
+            app.state.cache.players.set(player)
+            found_by_safe_name[player["safe_name"]] = player
+
+    players = []
+    returned_ids = set()
+
+    for player in [
+        *(found_by_id.get(id) for id in ids),
+        *(found_by_safe_name.get(safe_name) for safe_name in safe_names),
+    ]:
+        if player is None or player["id"] in returned_ids:
+            continue
+
+        returned_ids.add(player["id"])
+        players.append(player)
+
+    return players
+
+
+def _apply_pending_writes(player: dict[str, Any]) -> None:
+    """Patch a row fetched from the database with writes that are still queued"""
+    privileges = app.state.write_behind.queue.pending_privileges(player["id"])
+    if privileges is not None:
+        player["priv"] = privileges
+
+
+async def _fetch_in_chunks(
+    column: str, values: Sequence[Any], primary: bool = False
+) -> AsyncIterator[list[dict[str, Any]]]:
+    """Yield the players whose `column` is in `values`, a chunk at a time"""
+    for start in range(0, len(values), GET_MANY_CHUNK_SIZE):
+        chunk = values[start : start + GET_MANY_CHUNK_SIZE]
+        query, params = get_many_query(column, chunk)
+
+        yield await app.state.services.database.fetch_all(
+            query, params, primary=primary
+        )
+
+
+def get_many_query(column: str, values: Sequence[Any]) -> tuple[str, dict[str, Any]]:
+    """Query and params of the players whose `column` is in `values`"""
+    placeholders = ", ".join(f"%({column}_{i})s" for i in range(len(values)))
+    query = f"""
+        SELECT {READ_PARAMS}
+        FROM users
+        WHERE {column} IN ({placeholders})
+    """
+    params = {f"{column}_{i}": value for i, value in enumerate(values)}
 
-def count(
+    return query, params
+
+
+app.query_plans.register("players.get_many.id", *get_many_query("id", (1, 2)))
+app.query_plans.register(
+    "players.get_many.safe_name", *get_many_query("safe_name", ("nova", "bancho"))
+)
+
+
+async def update_privileges(
+    id: int, privileges: int, player: Optional[Mapping[str, Any]] = None
+) -> None:
+    """
+    Set the privileges of the player with `id`, keeping the caches in sync
+
+    `player` is their `users` row from before the change, it's only needed
+    to keep the player counts up to date, and is fetched if not given then.
+    Moderating many players at once should pass the rows (e.g. from `get_many`),
+    so it doesn't cost a query per player
+    """
+    if app.state.cache.player_counts.loaded:
+        if player is None:
+            player = await get_one(id=id)
+
+        # Before the cached row (which `player` may be) gets the new privileges
+        if player is not None:
+            app.state.cache.player_counts.change_privileges(player, privileges)
+
+    # Written on the next flush, until then rows fetched from the database are patched
+    app.state.write_behind.queue.update_privileges(id, privileges)
+
+    app.state.cache.players.update(id, priv=privileges)
+
+
+async def load_counts() -> None:
+    """
+    (Re)load the player counts served by `count` from the database
+
+    Privilege updates still queued in the write-behind queue are applied on top,
+    as are changes made while the counts are read
+    """
+    player_counts = app.state.cache.player_counts
+
+    dimensions = ", ".join(app.state.cache.PlayerCounts.DIMENSIONS)
+    query = f"""
+        SELECT {dimensions}, COUNT(*) AS count
+        FROM users
+        GROUP BY {dimensions}
+    """
+
+    # Nothing pending is written while reading, so the pending privileges
+    # are exactly the ones missing from the rows, and changes made meanwhile
+    # are recorded to be replayed
+    async with app.state.write_behind.queue.paused():
+        pending_privileges = app.state.write_behind.queue.all_pending_privileges()
+        player_counts.start_recording()
+
+        try:
+            rows = await app.state.services.database.fetch_all(query, primary=True)
+
+            # Their rows as they are in the database, `get_many` would patch them
+            pending_players = []
+            async for chunk in _fetch_in_chunks(
+                "id", list(pending_privileges), primary=True
+            ):
+                pending_players.extend(chunk)
+        except BaseException:
+            player_counts.stop_recording()
+            raise
+
+    player_counts.load(
+        rows,
+        privilege_changes=(
+            (player, pending_privileges[player["id"]]) for player in pending_players
+        ),
+    )
+
+
+async def count(
     priv: Optional[int] = None,
     country: Optional[str] = None,
     clan_id: Optional[int] = None,
@@ -127,6 +321,40 @@ def count(
     preferred_mode: Optional[int] = None,
     play_style: Optional[int] = None,
 ) -> int:
+    if app.state.cache.player_counts.loaded:
+        return app.state.cache.player_counts.count(
+            priv=priv,
+            country=country,
+            clan_id=clan_id,
+            clan_priv=clan_priv,
+            preferred_mode=preferred_mode,
+            play_style=play_style,
+        )
+
+    query, params = count_query(
+        priv=priv,
+        country=country,
+        clan_id=clan_id,
+        clan_priv=clan_priv,
+        preferred_mode=preferred_mode,
+        play_style=play_style,
+    )
+
+    count = await app.state.services.database.fetch_val(query, params)
+
+    assert count is not None
+    return count
+
+
+def count_query(
+    priv: Optional[int] = None,
+    country: Optional[str] = None,
+    clan_id: Optional[int] = None,
+    clan_priv: Optional[int] = None,
+    preferred_mode: Optional[int] = None,
+    play_style: Optional[int] = None,
+) -> tuple[str, dict[str, Any]]:
+    """Query and params counting the players matching every given column"""
     query = (
         f"""
         SELECT COUNT(*) AS count
@@ -170,9 +398,10 @@ def count(
     if query_conditions:
         query += " AND ".join(query_conditions)
 
-    cursor = app.state.services.database.cursor()
-    cursor.execute(query, params)
-    count = cursor.fetchone()
+    return query, params
 
-    assert count is not None
-    return count[0]
+
+app.query_plans.register(
+    "players.count.country_priv", *count_query(priv=1, country="pl")
+)
+app.query_plans.register("players.count.clan", *count_query(clan_id=1))
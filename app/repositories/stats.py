@@ -1 +1,283 @@
+""" stats repo: fetch and/or update players' stats in every gamemode """
 from __future__ import annotations
+
+import asyncio
+import textwrap
+from typing import Any
+from typing import Sequence
+
+import app.query_plans
+import app.state
+from app.constants.gamemodes import GameMode
+from app.constants.privileges import Privileges
+from app.objects.leaderboards import LeaderboardPlayer
+from app.objects.leaderboards import Leaderboards
+from app.objects.stats import ModeData
+from app.objects.ranks import RankService
+from app.objects.score import Grade
+from app.repositories import players as players_repo
+
+READ_PARAMS = textwrap.dedent(
+    """\
+        id, mode, tscore, rscore, pp, acc, plays, playtime, max_combo, total_hits,
+        xh_count, x_count, sh_count, s_count, a_count
+    """,
+)
+
+# Most players whose stats are fetched by a single query, bigger lookups are split up
+GET_MANY_CHUNK_SIZE = 1000
+
+
+def _mode_data(row: dict[str, Any]) -> ModeData:
+    return ModeData(
+        total_score=row["tscore"],
+        ranked_score=row["rscore"],
+        pp=row["pp"],
+        acc=row["acc"],
+        playcount=row["plays"],
+        playtime=row["playtime"],
+        max_combo=row["max_combo"],
+        total_hits=row["total_hits"],
+        rank=0,  # not stored in the stats table
+        grades={
+            Grade.XH: row["xh_count"],
+            Grade.X: row["x_count"],
+            Grade.SH: row["sh_count"],
+            Grade.S: row["s_count"],
+            Grade.A: row["a_count"],
+        },
+    )
+
+
+async def get_all_modes(player_id: int) -> dict[GameMode, ModeData]:
+    """
+    Fetch the player's stats in every gamemode with a single query
+
+    The returned dict is the cached one, `update` changes it in place.
+    Ranks shift as other players climb, they're looked up on every read
+    """
+    stats = app.state.cache.stats.get(player_id)
+    if stats is None:
+        query, params = get_all_modes_query(player_id)
+        rows = await app.state.services.database.fetch_all(query, params)
+
+        stats = {GameMode(row["mode"]): _mode_data(row) for row in rows}
+        app.state.cache.stats.set(player_id, stats)
+
+    for mode, mode_stats in stats.items():
+        mode_stats.rank = await app.state.sessions.ranks.rank(player_id, mode) or 0
+
+    return stats
+
+
+async def get_many(player_ids: Sequence[int]) -> dict[int, dict[GameMode, ModeData]]:
+    """
+    Fetch the stats in every gamemode of many players,
+    one query per chunk of players that aren't cached
+
+    Players without any stats map to an empty dict.
+    Ranks are looked up on every read, like `get_all_modes`
+    """
+    found: dict[int, dict[GameMode, ModeData]] = {}
+
+    missing_ids = []
+    for player_id in dict.fromkeys(player_ids):
+        stats = app.state.cache.stats.get(player_id)
+        if stats is not None:
+            found[player_id] = stats
+        else:
+            missing_ids.append(player_id)
+
+    for start in range(0, len(missing_ids), GET_MANY_CHUNK_SIZE):
+        chunk = missing_ids[start : start + GET_MANY_CHUNK_SIZE]
+        query, params = get_many_query(chunk)
+
+        fetched: dict[int, dict[GameMode, ModeData]] = {
+            player_id: {} for player_id in chunk
+        }
+        for row in await app.state.services.database.fetch_all(query, params):
+            fetched[row["id"]][GameMode(row["mode"])] = _mode_data(row)
+
+        for player_id, stats in fetched.items():
+            app.state.cache.stats.set(player_id, stats)
+
+        found.update(fetched)
+
+    await _fill_ranks(found)
+    return found
+
+
+async def _fill_ranks(stats: dict[int, dict[GameMode, ModeData]]) -> None:
+    """Set the current global rank of every player's stats, one lookup per gamemode"""
+    players_by_mode: dict[GameMode, list[int]] = {}
+    for player_id, player_stats in stats.items():
+        for mode in player_stats:
+            players_by_mode.setdefault(mode, []).append(player_id)
+
+    for mode, player_ids in players_by_mode.items():
+        ranks = await app.state.sessions.ranks.ranks(player_ids, mode)
+        for player_id, rank in zip(player_ids, ranks):
+            stats[player_id][mode].rank = rank or 0
+
+
+def get_all_modes_query(player_id: int) -> tuple[str, dict[str, Any]]:
+    """Query and params of the player's stats in every gamemode"""
+    query = f"""
+        SELECT {READ_PARAMS}
+        FROM stats
+        WHERE id = %(id)s
+    """
+    return query, {"id": player_id}
+
+
+def get_many_query(player_ids: Sequence[int]) -> tuple[str, dict[str, Any]]:
+    """Query and params of the stats in every gamemode of many players"""
+    placeholders = ", ".join(f"%(id_{i})s" for i in range(len(player_ids)))
+    query = f"""
+        SELECT {READ_PARAMS}
+        FROM stats
+        WHERE id IN ({placeholders})
+    """
+    params = {f"id_{i}": player_id for i, player_id in enumerate(player_ids)}
+
+    return query, params
+
+
+app.query_plans.register("stats.get_all_modes", *get_all_modes_query(1))
+app.query_plans.register("stats.get_many", *get_many_query((1, 2)))
+
+
+async def update(player_id: int, mode: GameMode, stats: ModeData) -> None:
+    """Save the player's stats in `mode`, e.g. after a score submission"""
+    query = """
+        UPDATE stats
+        SET tscore = %(tscore)s, rscore = %(rscore)s, pp = %(pp)s, acc = %(acc)s,
+            plays = %(plays)s, playtime = %(playtime)s, max_combo = %(max_combo)s,
+            total_hits = %(total_hits)s, xh_count = %(xh_count)s, x_count = %(x_count)s,
+            sh_count = %(sh_count)s, s_count = %(s_count)s, a_count = %(a_count)s
+        WHERE id = %(id)s AND mode = %(mode)s
+    """
+    params = {
+        "id": player_id,
+        "mode": mode,
+        "tscore": stats.total_score,
+        "rscore": stats.ranked_score,
+        "pp": stats.pp,
+        "acc": stats.acc,
+        "plays": stats.playcount,
+        "playtime": stats.playtime,
+        "max_combo": stats.max_combo,
+        "total_hits": stats.total_hits,
+        "xh_count": stats.grades[Grade.XH],
+        "x_count": stats.grades[Grade.X],
+        "sh_count": stats.grades[Grade.SH],
+        "s_count": stats.grades[Grade.S],
+        "a_count": stats.grades[Grade.A],
+    }
+    await app.state.services.database.execute(query, params)
+
+    # Cached stats are updated in place, instead of being read again
+    app.state.cache.stats.update(player_id, mode, stats)
+
+    player = await players_repo.get_one(id=player_id)
+    if player is not None and player["priv"] & Privileges.UNRESTRICTED:
+        # Also recorded while the leaderboards are being rebuilt, before they're loaded
+        app.state.sessions.leaderboards.update_stats(
+            player_id, mode, stats, _leaderboard_player(player)
+        )
+
+        await app.state.sessions.ranks.update(
+            player_id, mode, stats.pp, player["country"]
+        )
+        stats.rank = await app.state.sessions.ranks.rank(player_id, mode) or 0
+
+
+async def add_to_rankings(player: dict[str, Any]) -> None:
+    """
+    Put the player back on the leaderboards and ranks
+    with their stats in every gamemode, e.g. on unrestriction
+    """
+    leaderboard_player = _leaderboard_player(player)
+
+    for mode, stats in (await get_all_modes(player["id"])).items():
+        app.state.sessions.leaderboards.update_stats(
+            player["id"], mode, stats, leaderboard_player
+        )
+        await app.state.sessions.ranks.update(
+            player["id"], mode, stats.pp, player["country"]
+        )
+
+
+def _leaderboard_player(row: dict[str, Any]) -> LeaderboardPlayer:
+    return LeaderboardPlayer(
+        id=row["id"],
+        name=row["name"],
+        country=row["country"],
+        clan_id=row["clan_id"],
+    )
+
+
+async def load_rankings() -> None:
+    """
+    (Re)build the in-memory leaderboards and the pp ranks
+    from the stats of unrestricted players
+    """
+    live_leaderboards = app.state.sessions.leaderboards
+    ranks = app.state.sessions.ranks
+
+    # Changes made while the rows are read and the replacement is built
+    # would be missing from it, they're replayed onto it before it's swapped in
+    live_leaderboards.start_recording()
+    ranks.start_recording()
+
+    try:
+        await _load_rankings(live_leaderboards, ranks)
+    finally:
+        live_leaderboards.stop_recording()
+        ranks.stop_recording()
+
+
+async def _load_rankings(live_leaderboards: Leaderboards, ranks: RankService) -> None:
+    stats_params = ", ".join(f"s.{param.strip()}" for param in READ_PARAMS.split(","))
+    query = f"""
+        SELECT {stats_params}, u.name, u.country, u.clan_id
+        FROM stats s
+        JOIN users u ON s.id = u.id
+        WHERE u.priv & 1
+    """
+    rows = await app.state.services.database.fetch_all(query)
+
+    clans = await app.state.services.database.fetch_all(
+        "SELECT id, name, tag FROM clans"
+    )
+
+    players = {row["id"]: _leaderboard_player(row) for row in rows}
+
+    # Built in a thread, then swapped in, so the event loop isn't blocked meanwhile
+    leaderboards = Leaderboards()
+    await asyncio.to_thread(
+        leaderboards.load,
+        players=players.values(),
+        stats=((row["id"], GameMode(row["mode"]), _mode_data(row)) for row in rows),
+        clans={clan["id"]: (clan["name"], clan["tag"]) for clan in clans},
+    )
+    live_leaderboards.replay(leaderboards)
+
+    # Restrictions that weren't written to the database yet when the rows were read
+    restricted = {
+        player_id: players[player_id].country
+        for player_id, privileges in (
+            app.state.write_behind.queue.all_pending_privileges().items()
+        )
+        if not privileges & Privileges.UNRESTRICTED and player_id in players
+    }
+    for player_id in restricted:
+        leaderboards.remove_player(player_id)
+
+    app.state.sessions.leaderboards = leaderboards
+
+    await ranks.load(
+        (row["id"], GameMode(row["mode"]), row["pp"], row["country"])
+        for row in rows
+        if row["id"] not in restricted
+    )
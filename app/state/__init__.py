@@ -5,6 +5,7 @@ from asyncio import AbstractEventLoop
 from . import cache
 from . import services
 from . import sessions
+from . import write_behind
 
 loop: AbstractEventLoop
 packets = {"all": {}, "restricted": {}}
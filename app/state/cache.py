@@ -1,3 +1,484 @@
+""" cache: in-memory caches in front of the database """
 from __future__ import annotations
 
-#TODO
\ No newline at end of file
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Hashable
+from typing import TYPE_CHECKING
+from typing import Iterable
+from typing import Mapping
+
+import app.metrics
+import app.settings
+from app.logging import Colors
+from app.logging import log
+
+if TYPE_CHECKING:
+    from app.constants.gamemodes import GameMode
+    from app.objects.stats import ModeData
+
+
+class PlayerCache:
+    """
+    LRU cache of player rows from the `users` table, with a time to live
+
+    Rows are stored by id, safe names and emails only map to an id.
+    Once `max_size` rows are cached, the least recently used one is evicted.
+
+    Attributes:
+    -----------
+    max_size: `int`
+        The amount of rows that can be cached at once
+
+    ttl: `float`
+        Seconds a row stays valid after being cached
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+
+        # Maps player ids to (expiry time, row), least recently used first
+        self._rows: OrderedDict[int, tuple[float, dict[str, Any]]] = OrderedDict()
+        self._ids_by_safe_name: dict[str, int] = {}
+        self._ids_by_email: dict[str, int] = {}
+        # Reverse of `_ids_by_email`, to drop the mapping along with the row
+        self._emails_by_id: dict[int, str] = {}
+
+        self.hits = app.metrics.counter("cache.players.hits")
+        self.misses = app.metrics.counter("cache.players.misses")
+        self.evictions = app.metrics.counter("cache.players.evictions")
+        self.expirations = app.metrics.counter("cache.players.expirations")
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __repr__(self) -> str:
+        return (
+            f"<PlayerCache {len(self)}/{self.max_size} rows, {self.hit_ratio:.0%} hits>"
+        )
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits.value + self.misses.value
+        return self.hits.value / lookups if lookups else 0.0
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "size": len(self),
+            "max_size": self.max_size,
+            "hits": self.hits.value,
+            "misses": self.misses.value,
+            "hit_ratio": self.hit_ratio,
+            "evictions": self.evictions.value,
+            "expirations": self.expirations.value,
+        }
+
+    def get(
+        self,
+        id: int | None = None,
+        safe_name: str | None = None,
+        email: str | None = None,
+    ) -> dict[str, Any] | None:
+        """
+        Return a copy of the cached row matching every given key,
+        `None` on a miss or if the keys point at different players
+        """
+        row = self._get(id, safe_name, email)
+
+        if row is None:
+            self.misses.increment()
+            return None
+
+        self.hits.increment()
+        return dict(row)
+
+    def _get(
+        self, id: int | None, safe_name: str | None, email: str | None
+    ) -> dict[str, Any] | None:
+        if safe_name is not None:
+            safe_name_id = self._ids_by_safe_name.get(safe_name)
+            if safe_name_id is None or (id is not None and id != safe_name_id):
+                return None
+            id = safe_name_id
+
+        if email is not None:
+            email_id = self._ids_by_email.get(email)
+            if email_id is None or (id is not None and id != email_id):
+                return None
+            id = email_id
+
+        if id is None:
+            return None
+
+        entry = self._rows.get(id)
+        if entry is None:
+            return None
+
+        expires_at, row = entry
+        if expires_at <= time.monotonic():
+            self.expirations.increment()
+            self.invalidate(id)
+            return None
+
+        self._rows.move_to_end(id)
+        return row
+
+    def set(self, row: dict[str, Any], email: str | None = None) -> None:
+        """Cache `row`, `email` is remembered to map to the row's id"""
+        id = row["id"]
+
+        # Drop the previous version so stale name/email mappings go with it
+        if id in self._rows:
+            if email is None:
+                email = self._emails_by_id.get(id)
+            self.invalidate(id)
+
+        self._rows[id] = (time.monotonic() + self.ttl, dict(row))
+        self._ids_by_safe_name[row["safe_name"]] = id
+
+        if email is not None:
+            self._ids_by_email[email] = id
+            self._emails_by_id[id] = email
+
+        while len(self._rows) > self.max_size:
+            evicted_id, (_, evicted_row) = self._rows.popitem(last=False)
+            self._forget_keys(evicted_id, evicted_row)
+            self.evictions.increment()
+
+    def update(self, id: int, **values: Any) -> None:
+        """Update the cached row of the player with `id` in place, if there is one"""
+        entry = self._rows.get(id)
+        if entry is not None:
+            entry[1].update(values)
+
+    def invalidate(
+        self,
+        id: int | None = None,
+        safe_name: str | None = None,
+        email: str | None = None,
+    ) -> None:
+        """Remove the rows matching any of the given keys"""
+        if safe_name is not None:
+            safe_name_id = self._ids_by_safe_name.pop(safe_name, None)
+            if safe_name_id is not None:
+                self.invalidate(safe_name_id)
+
+        if email is not None:
+            email_id = self._ids_by_email.pop(email, None)
+            if email_id is not None:
+                self.invalidate(email_id)
+
+        if id is not None:
+            entry = self._rows.pop(id, None)
+            if entry is not None:
+                self._forget_keys(id, entry[1])
+
+    def clear(self) -> None:
+        self._rows.clear()
+        self._ids_by_safe_name.clear()
+        self._ids_by_email.clear()
+        self._emails_by_id.clear()
+
+    def _forget_keys(self, id: int, row: dict[str, Any]) -> None:
+        """Drop the safe name and email mappings to `id`, once its row is gone"""
+        if self._ids_by_safe_name.get(row["safe_name"]) == id:
+            del self._ids_by_safe_name[row["safe_name"]]
+
+        email = self._emails_by_id.pop(id, None)
+        if email is not None and self._ids_by_email.get(email) == id:
+            del self._ids_by_email[email]
+
+
+class StatsCache:
+    """
+    LRU cache of players' stats in every gamemode, by player id
+
+    The cached dicts are shared with whoever fetched them (e.g. `Player.stats`),
+    so updates made through `update` show up everywhere
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+
+        self._stats: OrderedDict[int, dict[GameMode, ModeData]] = OrderedDict()
+
+        self.hits = app.metrics.counter("cache.stats.hits")
+        self.misses = app.metrics.counter("cache.stats.misses")
+        self.evictions = app.metrics.counter("cache.stats.evictions")
+
+    def __len__(self) -> int:
+        return len(self._stats)
+
+    def __repr__(self) -> str:
+        return f"<StatsCache {len(self)}/{self.max_size} players>"
+
+    def get(self, player_id: int) -> dict[GameMode, ModeData] | None:
+        stats = self._stats.get(player_id)
+
+        if stats is None:
+            self.misses.increment()
+            return None
+
+        self.hits.increment()
+        self._stats.move_to_end(player_id)
+        return stats
+
+    def set(self, player_id: int, stats: dict[GameMode, ModeData]) -> None:
+        self._stats[player_id] = stats
+        self._stats.move_to_end(player_id)
+
+        while len(self._stats) > self.max_size:
+            self._stats.popitem(last=False)
+            self.evictions.increment()
+
+    def update(self, player_id: int, mode: GameMode, mode_stats: ModeData) -> None:
+        """Replace the player's stats in `mode` in place, if they're cached"""
+        stats = self._stats.get(player_id)
+        if stats is not None:
+            stats[mode] = mode_stats
+
+    def invalidate(self, player_id: int) -> None:
+        self._stats.pop(player_id, None)
+
+
+class PlayerCounts:
+    """
+    Amount of players in the `users` table, per combination of the columns
+    `players_repo.count` can filter on
+
+    Loaded from a GROUP BY query and kept up to date as players register and
+    their privileges change, filtered counts are summed over the groups.
+
+    Attributes:
+    -----------
+    loaded: `bool`
+        Whether the counts were loaded from the database yet
+    """
+
+    DIMENSIONS = (
+        "priv",
+        "country",
+        "clan_id",
+        "clan_priv",
+        "preferred_mode",
+        "play_style",
+    )
+
+    def __init__(self) -> None:
+        self._groups: dict[tuple[Any, ...], int] = {}
+        # Counts for filters that were asked for since the last change
+        self._results: dict[tuple[Any, ...], int] = {}
+
+        # Changes made while counts are being reloaded, see `start_recording`
+        self._recorded: list[tuple[Mapping[str, Any], int]] | None = None
+
+        self.loaded = False
+
+    def __repr__(self) -> str:
+        return f"<PlayerCounts {len(self._groups)} groups, {self.count()} players>"
+
+    def start_recording(self) -> None:
+        """
+        Record every change made from now on, so `load` can apply them again
+        on top of counts read from the database meanwhile
+        """
+        if self._recorded is None:
+            self._recorded = []
+
+    def stop_recording(self) -> None:
+        self._recorded = None
+
+    def load(
+        self,
+        rows: Iterable[Mapping[str, Any]],
+        privilege_changes: Iterable[tuple[Mapping[str, Any], int]] = (),
+    ) -> None:
+        """
+        Replace every count with `rows`, each holding the dimensions and a `count`
+
+        `privilege_changes` of (`users` row, privileges) missing from `rows`
+        (e.g. still queued to be written) are applied on top, then the changes
+        recorded since `start_recording`
+        """
+        recorded, self._recorded = self._recorded or [], None
+
+        self._groups = {
+            tuple(row[dimension] for dimension in self.DIMENSIONS): row["count"]
+            for row in rows
+        }
+
+        for player, privileges in privilege_changes:
+            self.change_privileges(player, privileges)
+
+        for player, amount in recorded:
+            self.add(player, amount)
+
+        self._results.clear()
+        self.loaded = True
+
+    def add(self, player: Mapping[str, Any], amount: int = 1) -> None:
+        """Count `player` (a `users` row) `amount` more times"""
+        if self._recorded is not None:
+            self._recorded.append((dict(player), amount))
+
+        group = tuple(player[dimension] for dimension in self.DIMENSIONS)
+
+        count = self._groups.get(group, 0) + amount
+        if count > 0:
+            self._groups[group] = count
+        else:
+            self._groups.pop(group, None)
+
+        self._results.clear()
+
+    def change_privileges(self, player: Mapping[str, Any], privileges: int) -> None:
+        """Move `player` (a `users` row) from its current `priv` group to `privileges`"""
+        self.add(player, -1)
+        self.add({**player, "priv": privileges})
+
+    def count(self, **filters: Any) -> int:
+        """Amount of players matching every filter that isn't `None`"""
+        key = tuple(filters.get(dimension) for dimension in self.DIMENSIONS)
+
+        count = self._results.get(key)
+        if count is None:
+            count = self._results[key] = sum(
+                group_count
+                for group, group_count in self._groups.items()
+                if all(
+                    value is None or value == group_value
+                    for value, group_value in zip(key, group)
+                )
+            )
+
+        return count
+
+
+@dataclass(slots=True)
+class CachedResponse:
+    body: bytes
+    etag: str
+    created_at: float
+
+
+class ResponseCache:
+    """
+    Serialized response bodies by key, with stale-while-revalidate
+
+    Entries younger than `ttl` are served as is. Entries up to `stale_ttl` seconds
+    older than that are still served, but refreshed in the background.
+    Concurrent misses for the same key share a single `compute` call.
+    """
+
+    def __init__(self, name: str, ttl: float, stale_ttl: float, max_size: int) -> None:
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_size = max_size
+
+        self._entries: OrderedDict[Hashable, CachedResponse] = OrderedDict()
+        self._computing: dict[Hashable, asyncio.Task[CachedResponse]] = {}
+
+        self._hits = app.metrics.counter(f"response_cache.{name}.hits")
+        self._stale_hits = app.metrics.counter(f"response_cache.{name}.stale_hits")
+        self._misses = app.metrics.counter(f"response_cache.{name}.misses")
+        self._coalesced = app.metrics.counter(f"response_cache.{name}.coalesced")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self) -> str:
+        return f"<ResponseCache {self.name} ({len(self)}/{self.max_size})>"
+
+    async def get(
+        self, key: Hashable, compute: Callable[[], Awaitable[bytes]]
+    ) -> CachedResponse:
+        """The cached response for `key`, `compute` makes its body on misses"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry.created_at
+
+            if age < self.ttl:
+                self._entries.move_to_end(key)
+                self._hits.increment()
+                return entry
+
+            if age < self.ttl + self.stale_ttl:
+                self._entries.move_to_end(key)
+                self._stale_hits.increment()
+                if key not in self._computing:
+                    self._start_computing(key, compute)
+                return entry
+
+        if key in self._computing:
+            self._coalesced.increment()
+        else:
+            self._misses.increment()
+            self._start_computing(key, compute)
+
+        # Shielded, so a client going away doesn't cancel everyone else's response
+        return await asyncio.shield(self._computing[key])
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def _start_computing(
+        self, key: Hashable, compute: Callable[[], Awaitable[bytes]]
+    ) -> None:
+        task = asyncio.create_task(self._compute(key, compute))
+        task.add_done_callback(self._log_failed_refresh)
+        self._computing[key] = task
+
+    async def _compute(
+        self, key: Hashable, compute: Callable[[], Awaitable[bytes]]
+    ) -> CachedResponse:
+        try:
+            body = await compute()
+        finally:
+            del self._computing[key]
+
+        entry = CachedResponse(
+            body=body,
+            etag=f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"',
+            created_at=time.monotonic(),
+        )
+
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+        return entry
+
+    def _log_failed_refresh(self, task: asyncio.Task[CachedResponse]) -> None:
+        # Retrieving the exception keeps asyncio from warning about background
+        # refreshes nobody awaited, requests that did await it got it raised
+        if not task.cancelled() and task.exception() is not None:
+            log(
+                f"Failed to compute {self.name} response: {task.exception()}",
+                Colors.RED,
+            )
+
+
+players = PlayerCache(
+    max_size=app.settings.PLAYER_CACHE_MAX_SIZE, ttl=app.settings.PLAYER_CACHE_TTL
+)
+
+stats = StatsCache(max_size=app.settings.STATS_CACHE_MAX_SIZE)
+
+player_counts = PlayerCounts()
+
+# Serialized /v1/leaderboard pages by (sort, mode, limit, offset, country, cursor)
+leaderboard_pages = ResponseCache(
+    "leaderboard",
+    ttl=app.settings.LEADERBOARD_CACHE_TTL,
+    stale_ttl=app.settings.LEADERBOARD_CACHE_STALE_TTL,
+    max_size=app.settings.LEADERBOARD_CACHE_MAX_SIZE,
+)
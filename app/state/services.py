@@ -1,19 +1,122 @@
 from __future__ import annotations
 
+from pathlib import Path
+
 import aiohttp
-import MySQLdb
-import MySQLdb.cursors
+import redis.asyncio
 
 import app.settings
+from app.adapters.database import Database
+from app.adapters.instrumented_database import InstrumentedDatabase
+from app.adapters.replicated_database import parse_dsn
+from app.adapters.replicated_database import ReplicatedDatabase
+from app.adapters.threadpool_database import ThreadPoolDatabase
+from app.logging import Colors
+from app.logging import log
 
 http_client: aiohttp.ClientSession
 
-_database_connection: MySQLdb.Connection = MySQLdb.connect(
-    host=app.settings.MYSQL_HOST,
-    port=app.settings.MYSQL_PORT,
-    user=app.settings.MYSQL_USERNAME,
-    password=app.settings.MYSQL_PASSWORD,
-    database=app.settings.MYSQL_DATABASE,
+redis_client: redis.asyncio.Redis | None = None
+if app.settings.RANK_BACKEND == "redis":
+    redis_client = redis.asyncio.from_url(app.settings.REDIS_URL)
+
+
+def _make_database(
+    host: str, port: int, user: str, password: str, database: str
+) -> Database | ThreadPoolDatabase:
+    """Database on the configured backend"""
+    if app.settings.DATABASE_BACKEND == "threadpool":
+        return ThreadPoolDatabase(
+            host=host,
+            port=port,
+            user=user,
+            password=password,
+            database=database,
+            max_workers=app.settings.MYSQL_THREADPOOL_WORKERS,
+            max_queue_size=app.settings.MYSQL_THREADPOOL_QUEUE_SIZE,
+        )
+    else:
+        return Database(
+            host=host,
+            port=port,
+            user=user,
+            password=password,
+            database=database,
+            min_size=app.settings.MYSQL_POOL_MIN_SIZE,
+            max_size=app.settings.MYSQL_POOL_MAX_SIZE,
+            acquire_timeout=app.settings.MYSQL_ACQUIRE_TIMEOUT,
+            health_check_interval=app.settings.MYSQL_HEALTH_CHECK_INTERVAL,
+        )
+
+
+database = InstrumentedDatabase(
+    ReplicatedDatabase(
+        primary=_make_database(
+            host=app.settings.MYSQL_HOST,
+            port=app.settings.MYSQL_PORT,
+            user=app.settings.MYSQL_USERNAME,
+            password=app.settings.MYSQL_PASSWORD,
+            database=app.settings.MYSQL_DATABASE,
+        ),
+        replicas=[
+            _make_database(**parse_dsn(dsn))
+            for dsn in app.settings.MYSQL_REPLICA_DSNS
+        ],
+        failure_threshold=app.settings.MYSQL_REPLICA_FAILURE_THRESHOLD,
+        ejection_time=app.settings.MYSQL_REPLICA_EJECTION_TIME,
+    ),
+    slow_query_threshold=app.settings.SLOW_QUERY_THRESHOLD_MS,
+    explain_slow_queries=app.settings.SLOW_QUERY_EXPLAIN,
 )
 
-database: MySQLdb.cursors.Cursor = _database_connection.cursor()
+# Numbered `.sql` files, applied in order and recorded in `schema_migrations`
+MIGRATIONS_DIR = Path(__file__).resolve().parents[2] / "migrations"
+
+# MySQL's error code for creating an index under a name that's already taken
+ER_DUP_KEYNAME = 1061
+
+
+async def run_sql_migrations() -> None:
+    """Apply every migration in `MIGRATIONS_DIR` that wasn't applied yet"""
+    await database.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT UNSIGNED NOT NULL PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+
+    applied = {
+        row["version"]
+        for row in await database.fetch_all(
+            "SELECT version FROM schema_migrations", primary=True
+        )
+    }
+
+    for path in sorted(MIGRATIONS_DIR.glob("[0-9]*_*.sql")):
+        version, _, name = path.stem.partition("_")
+        if int(version) in applied:
+            continue
+
+        for statement in _split_statements(path.read_text()):
+            try:
+                await database.execute(statement)
+            except Exception as exc:
+                # Indexes made by hand, or by a run that failed halfway through
+                if exc.args[:1] != (ER_DUP_KEYNAME,):
+                    raise
+
+        await database.execute(
+            "INSERT INTO schema_migrations (version, name) "
+            "VALUES (%(version)s, %(name)s)",
+            {"version": int(version), "name": name},
+        )
+        log(f"Applied migration {path.name}", Colors.GREEN)
+
+
+def _split_statements(sql: str) -> list[str]:
+    lines = [line for line in sql.splitlines() if not line.lstrip().startswith("--")]
+    statements = "\n".join(lines).split(";")
+    return [statement.strip() for statement in statements if statement.strip()]
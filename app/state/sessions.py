@@ -1,6 +1,28 @@
 from __future__ import annotations
 
+import asyncio
+
+import app.settings
+import app.state.services
 from app.objects.collections import Players
+from app.objects.leaderboards import Leaderboards
+from app.objects.ranks import MemoryRankBackend
+from app.objects.ranks import RankBackend
+from app.objects.ranks import RankService
+from app.objects.ranks import RedisRankBackend
 
 online_players = Players()
+
+leaderboards = Leaderboards()
+
+rank_backend: RankBackend
+if app.settings.RANK_BACKEND == "redis":
+    assert app.state.services.redis_client is not None
+    rank_backend = RedisRankBackend(app.state.services.redis_client)
+else:
+    rank_backend = MemoryRankBackend()
+
+ranks = RankService(rank_backend)
+
+housekeeping_tasks: set[asyncio.Task] = set()
 # TODO
@@ -0,0 +1,255 @@
+""" write behind: database writes that are batched and flushed in the background """
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any
+from typing import AsyncIterator
+
+import app.metrics
+import app.settings
+import app.state.services
+from app.logging import Colors
+from app.logging import log
+
+# Most rows written by a single statement, bigger batches are split up
+MAX_BATCH_SIZE = 1000
+
+# Flushes a write can fail before it's dropped instead of being retried again
+MAX_FLUSH_ATTEMPTS = 5
+
+# Seconds replicas are given to catch up with a flushed write, reads of
+# the rows it touched should go to the primary until then
+REPLICA_LAG_WINDOW = 10.0
+
+LOG_COLUMNS = ("from", "to", "action", "msg", "time")
+
+BATCH_SIZE_BUCKETS = (1, 10, 50, 100, 500, 1_000, 5_000, 10_000)
+
+flush_time = app.metrics.histogram("write_behind.flush_ms")
+privileges_batch_size = app.metrics.histogram(
+    "write_behind.privileges.batch_size", buckets=BATCH_SIZE_BUCKETS
+)
+logs_batch_size = app.metrics.histogram(
+    "write_behind.logs.batch_size", buckets=BATCH_SIZE_BUCKETS
+)
+failed_flushes = app.metrics.counter("write_behind.failed_flushes")
+dropped_writes = app.metrics.counter("write_behind.dropped_writes")
+
+
+class WriteBehindQueue:
+    """
+    Pending `users.priv` updates and `LOGS` inserts
+
+    Privilege updates are coalesced per player, only the latest one is written.
+    `flush` writes everything pending with one statement per `MAX_BATCH_SIZE` rows,
+    writes that fail are put back to be retried on the next flush, up to
+    `MAX_FLUSH_ATTEMPTS` times.
+    """
+
+    def __init__(self) -> None:
+        self._privileges: dict[int, int] = {}
+        self._logs: list[dict[str, Any]] = []
+
+        # Privileges being written by the current flush, still pending until it commits
+        self._flushing_privileges: dict[int, int] = {}
+        # Failed flushes of the privilege updates that are pending, by player id
+        self._privilege_attempts: dict[int, int] = {}
+        # When the privileges of players were last written, by player id
+        self._written_privileges: dict[int, float] = {}
+
+        self._flush_lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._privileges) + len(self._logs)
+
+    def __repr__(self) -> str:
+        return (
+            f"<WriteBehindQueue {len(self._privileges)} privilege updates, "
+            f"{len(self._logs)} logs>"
+        )
+
+    def pending_privileges(self, id: int) -> int | None:
+        """Privileges of the player with `id` that weren't written yet, if any"""
+        privileges = self._privileges.get(id)
+        if privileges is None:
+            privileges = self._flushing_privileges.get(id)
+
+        return privileges
+
+    def privileges_written_recently(self, id: int) -> bool:
+        """
+        Whether the privileges of the player with `id` are pending, or were
+        written too recently for the replicas to be sure to have them
+        """
+        if id in self._privileges or id in self._flushing_privileges:
+            return True
+
+        written_at = self._written_privileges.get(id)
+        return (
+            written_at is not None
+            and time.monotonic() - written_at < REPLICA_LAG_WINDOW
+        )
+
+    def all_pending_privileges(self) -> dict[int, int]:
+        """Privileges that weren't written yet, by player id"""
+        return self._flushing_privileges | self._privileges
+
+    def update_privileges(self, id: int, privileges: int) -> None:
+        self._privileges[id] = privileges
+
+    def log(self, from_id: int, to_id: int, action: str, msg: str) -> None:
+        self._logs.append(
+            {
+                "from": from_id,
+                "to": to_id,
+                "action": action,
+                "msg": msg,
+                "time": int(time.time()),
+                "attempts": 0,
+            }
+        )
+
+    @asynccontextmanager
+    async def paused(self) -> AsyncIterator[None]:
+        """
+        Wait for the current flush, and hold off the next ones for the duration
+        of the block, so nothing pending gets written meanwhile
+        """
+        async with self._flush_lock:
+            yield
+
+    async def flush(self) -> None:
+        """Write everything that's pending"""
+        async with self._flush_lock:
+            if not self:
+                return
+
+            start_time = time.perf_counter_ns()
+
+            now = time.monotonic()
+            self._written_privileges = {
+                id: written_at
+                for id, written_at in self._written_privileges.items()
+                if now - written_at < REPLICA_LAG_WINDOW
+            }
+
+            privileges, self._privileges = self._privileges, {}
+            self._flushing_privileges = dict(privileges)
+
+            try:
+                await self._flush_privileges(list(privileges.items()))
+            finally:
+                # Left over when the flush got cancelled, retried on the next one
+                for id, leftover in self._flushing_privileges.items():
+                    self._privileges.setdefault(id, leftover)
+                self._flushing_privileges = {}
+
+            logs, self._logs = self._logs, []
+            for start in range(0, len(logs), MAX_BATCH_SIZE):
+                batch = logs[start : start + MAX_BATCH_SIZE]
+                try:
+                    await self._write_logs(batch)
+                except Exception as exc:
+                    self._requeue_logs(batch)
+                    failed_flushes.increment()
+                    log(f"Failed to write logs: {exc}", Colors.RED)
+                except BaseException:
+                    self._logs[:0] = logs[start:]
+                    raise
+                else:
+                    logs_batch_size.observe(len(batch))
+
+            flush_time.observe((time.perf_counter_ns() - start_time) / 1e6)
+
+    async def _flush_privileges(self, updates: list[tuple[int, int]]) -> None:
+        for start in range(0, len(updates), MAX_BATCH_SIZE):
+            batch = updates[start : start + MAX_BATCH_SIZE]
+            try:
+                await self._write_privileges(batch)
+            except Exception as exc:
+                self._requeue_privileges(batch)
+                failed_flushes.increment()
+                log(f"Failed to write privilege updates: {exc}", Colors.RED)
+            else:
+                written_at = time.monotonic()
+                for id, _ in batch:
+                    self._privilege_attempts.pop(id, None)
+                    self._written_privileges[id] = written_at
+                privileges_batch_size.observe(len(batch))
+
+            # Written or back in `_privileges`, either way no longer in flight
+            for id, _ in batch:
+                del self._flushing_privileges[id]
+
+    def _requeue_privileges(self, batch: list[tuple[int, int]]) -> None:
+        for id, privileges in batch:
+            # Updates made since the flush started are newer, keep those
+            if id in self._privileges:
+                self._privilege_attempts.pop(id, None)
+                continue
+
+            attempts = self._privilege_attempts.get(id, 0) + 1
+            if attempts >= MAX_FLUSH_ATTEMPTS:
+                self._privilege_attempts.pop(id, None)
+                dropped_writes.increment()
+                log(
+                    f"Dropped privilege update of player {id} to {privileges} "
+                    f"after {attempts} failed flushes",
+                    Colors.RED,
+                )
+                continue
+
+            self._privilege_attempts[id] = attempts
+            self._privileges[id] = privileges
+
+    def _requeue_logs(self, batch: list[dict[str, Any]]) -> None:
+        requeued = []
+        for row in batch:
+            row["attempts"] += 1
+            if row["attempts"] >= MAX_FLUSH_ATTEMPTS:
+                dropped_writes.increment()
+                log(
+                    f"Dropped log {row['action']} of player {row['to']} "
+                    f"({row['msg']}) after {row['attempts']} failed flushes",
+                    Colors.RED,
+                )
+                continue
+
+            requeued.append(row)
+
+        self._logs[:0] = requeued
+
+    async def _write_privileges(self, batch: list[tuple[int, int]]) -> None:
+        cases = " ".join(
+            f"WHEN %(id_{i})s THEN %(priv_{i})s" for i in range(len(batch))
+        )
+        ids = ", ".join(f"%(id_{i})s" for i in range(len(batch)))
+
+        # TODO: Update db to have consistent naming
+        query = f"UPDATE users SET priv = CASE id {cases} END WHERE id IN ({ids})"
+        params = {}
+        for i, (id, privileges) in enumerate(batch):
+            params[f"id_{i}"] = id
+            params[f"priv_{i}"] = privileges
+
+        await app.state.services.database.execute(query, params)
+
+    async def _write_logs(self, batch: list[dict[str, Any]]) -> None:
+        values = ", ".join(
+            f"(%(from_{i})s, %(to_{i})s, %(action_{i})s, %(msg_{i})s, "
+            f"FROM_UNIXTIME(%(time_{i})s))"
+            for i in range(len(batch))
+        )
+
+        query = f"INSERT INTO LOGS (`from`, `to`, action, msg, time) VALUES {values}"
+        params = {}
+        for i, row in enumerate(batch):
+            for column in LOG_COLUMNS:
+                params[f"{column}_{i}"] = row[column]
+
+        await app.state.services.database.execute(query, params)
+
+
+queue = WriteBehindQueue()
@@ -0,0 +1,75 @@
+""" database pool: a slow query must not stall pings running next to it """
+from __future__ import annotations
+
+import asyncio
+import time
+
+import app.state.services
+from app.logging import format_time_magnitude
+
+SLOW_QUERY_SECONDS = 3
+SLOW_QUERY_COUNT = 4
+PING_INTERVAL = 0.05
+
+
+async def run_slow_query() -> None:
+    await app.state.services.database.fetch_val(
+        "SELECT SLEEP(%(seconds)s)", {"seconds": SLOW_QUERY_SECONDS}
+    )
+
+
+async def ping_loop(stop: asyncio.Event) -> tuple[list[int], list[int]]:
+    """Measure event loop lag and a cheap query's latency, like a bancho poll would"""
+    loop_lags: list[int] = []
+    query_latencies: list[int] = []
+
+    while not stop.is_set():
+        expected = time.perf_counter_ns() + int(PING_INTERVAL * 1e9)
+        await asyncio.sleep(PING_INTERVAL)
+        loop_lags.append(max(0, time.perf_counter_ns() - expected))
+
+        start = time.perf_counter_ns()
+        await app.state.services.database.fetch_val("SELECT 1")
+        query_latencies.append(time.perf_counter_ns() - start)
+
+    return loop_lags, query_latencies
+
+
+def summarize(name: str, samples: list[int]) -> None:
+    samples = sorted(samples)
+    p99 = samples[int(len(samples) * 0.99)]
+    print(
+        f"{name:<20} {len(samples):>4} samples"
+        f" | p50: {format_time_magnitude(samples[len(samples) // 2]):>12}"
+        f" | p99: {format_time_magnitude(p99):>12}"
+        f" | max: {format_time_magnitude(samples[-1]):>12}"
+    )
+
+
+async def main() -> int:
+    database = app.state.services.database
+    await database.connect()
+
+    stop = asyncio.Event()
+    pings = asyncio.create_task(ping_loop(stop))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_slow_query() for _ in range(SLOW_QUERY_COUNT)))
+    print(
+        f"{SLOW_QUERY_COUNT}x SELECT SLEEP({SLOW_QUERY_SECONDS}) finished"
+        f" after {time.perf_counter() - start:.2f}s"
+    )
+
+    stop.set()
+    loop_lags, query_latencies = await pings
+
+    summarize("event loop lag", loop_lags)
+    summarize("SELECT 1 latency", query_latencies)
+    print(f"pool: {database.pool_stats()}")
+
+    await database.disconnect()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(asyncio.run(main()))
@@ -0,0 +1,125 @@
+""" leaderboards: in-memory leaderboard pages vs. the SQL path, at 1M ranked players """
+from __future__ import annotations
+
+import asyncio
+import random
+import sys
+import time
+
+from app.api.v1.leaderboard import fetch_leaderboard
+from app.constants.gamemodes import GameMode
+from app.logging import format_time_magnitude
+from app.objects.leaderboards import Leaderboards
+from app.objects.leaderboards import LeaderboardPlayer
+from app.objects.player import ModeData
+from app.objects.score import Grade
+
+PLAYER_COUNT = 1_000_000
+COUNTRIES = ("pl", "us", "de", "jp", "kr", "br", "ca", "fr")
+OFFSETS = (0, 1_000, 100_000, 500_000, PLAYER_COUNT - 50)
+LIMIT = 50
+PAGES_PER_OFFSET = 100
+
+
+def build_leaderboards() -> Leaderboards:
+    players = [
+        LeaderboardPlayer(
+            id=id,
+            name=f"Player {id}",
+            country=random.choice(COUNTRIES),
+            clan_id=None,
+        )
+        for id in range(1, PLAYER_COUNT + 1)
+    ]
+    grades = {Grade.XH: 0, Grade.X: 0, Grade.SH: 0, Grade.S: 0, Grade.A: 0}
+    stats = [
+        (
+            player.id,
+            GameMode.VANILLA_OSU,
+            ModeData(
+                total_score=random.randint(1, 10**10),
+                ranked_score=random.randint(1, 10**9),
+                pp=random.randint(1, 20_000),
+                acc=random.uniform(50, 100),
+                playcount=random.randint(1, 100_000),
+                playtime=random.randint(1, 10**7),
+                max_combo=0,
+                total_hits=0,
+                rank=0,
+                grades=grades,
+            ),
+        )
+        for player in players
+    ]
+
+    leaderboards = Leaderboards()
+    start = time.perf_counter_ns()
+    leaderboards.load(players, stats, clans={})
+    elapsed = time.perf_counter_ns() - start
+    print(f"loaded {PLAYER_COUNT} players in {format_time_magnitude(elapsed)}")
+
+    return leaderboards
+
+
+def time_pages(name: str, get_page) -> None:
+    results = []
+    for offset in OFFSETS:
+        start = time.perf_counter_ns()
+        for _ in range(PAGES_PER_OFFSET):
+            get_page(offset)
+        elapsed = (time.perf_counter_ns() - start) // PAGES_PER_OFFSET
+        results.append(f"@{offset}: {format_time_magnitude(elapsed)}")
+
+    print(f"{name:<16} | " + " | ".join(results))
+
+
+async def time_sql_pages() -> None:
+    import app.state.services
+
+    await app.state.services.database.connect()
+
+    results = []
+    for offset in OFFSETS:
+        start = time.perf_counter_ns()
+        await fetch_leaderboard(GameMode.VANILLA_OSU, "pp", offset, LIMIT, None)
+        elapsed = time.perf_counter_ns() - start
+        results.append(f"@{offset}: {format_time_magnitude(elapsed)}")
+
+    print(f"{'sql pp':<16} | " + " | ".join(results))
+
+    await app.state.services.database.disconnect()
+
+
+def main() -> int:
+    leaderboards = build_leaderboards()
+
+    mode = GameMode.VANILLA_OSU
+    time_pages(
+        "memory pp", lambda offset: leaderboards.page(mode, "pp", offset, LIMIT)
+    )
+    time_pages(
+        "memory pp (pl)",
+        lambda offset: leaderboards.page(mode, "pp", offset // 8, LIMIT, "pl"),
+    )
+
+    grades = {Grade.XH: 0, Grade.X: 0, Grade.SH: 0, Grade.S: 0, Grade.A: 0}
+    start = time.perf_counter_ns()
+    for _ in range(10_000):
+        player_id = random.randint(1, PLAYER_COUNT)
+        leaderboards.update_stats(
+            player_id,
+            mode,
+            ModeData(1, 1, random.randint(1, 20_000), 99.0, 1, 1, 0, 0, 0, grades),
+        )
+    elapsed = (time.perf_counter_ns() - start) // 10_000
+    print(f"score submission re-rank (6 sorts): {format_time_magnitude(elapsed)}")
+
+    # Needs a database with PLAYER_COUNT rows in `stats` to compare against
+    if "--sql" in sys.argv:
+        asyncio.run(time_sql_pages())
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
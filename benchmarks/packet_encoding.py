@@ -0,0 +1,89 @@
+""" packet encoding: compiled packet layouts vs the generic write_packet """
+from __future__ import annotations
+
+import timeit
+
+import app.packets as Packets
+from app.packets import OsuTypes
+from app.packets import ServerPackets
+
+ITERATIONS = 200_000
+
+USER_STATS_ARGS = (
+    (1001, OsuTypes.Int32),
+    (2, OsuTypes.UnsignedInt8),
+    ("Camellia - Exit This Earth's Atomosphere [Evolution]", OsuTypes.String),
+    ("5c6e9e0f7a1e8d3b2a4f6c8e0d2b4a6f", OsuTypes.String),
+    (72, OsuTypes.Int32),
+    (0, OsuTypes.UnsignedInt8),
+    (1_234_567, OsuTypes.Int32),
+    (12_345_678_901, OsuTypes.Int64),
+    (0.9876, OsuTypes.Float32),
+    (12_345, OsuTypes.Float32),
+    (98_765_432_101, OsuTypes.Int64),
+    (42, OsuTypes.Int32),
+    (7_000, OsuTypes.Int16),
+)
+
+USER_PRESENCE_ARGS = (
+    (1001, OsuTypes.Int32),
+    ("cool player", OsuTypes.String),
+    (26, OsuTypes.UnsignedInt8),
+    (171, OsuTypes.UnsignedInt8),
+    (1, OsuTypes.UnsignedInt8),
+    (19.9, OsuTypes.Float32),
+    (50.0, OsuTypes.Float32),
+    (42, OsuTypes.Int32),
+)
+
+SEND_MESSAGE_ARGS = (("cool player", "hello there!", "#osu", 1001),)
+
+CASES = (
+    ("USER_STATS", ServerPackets.USER_STATS, USER_STATS_ARGS, Packets.USER_STATS),
+    (
+        "USER_PRESENCE",
+        ServerPackets.USER_PRESENCE,
+        USER_PRESENCE_ARGS,
+        Packets.USER_PRESENCE,
+    ),
+    (
+        "SEND_MESSAGE",
+        ServerPackets.SEND_MESSAGE,
+        ((SEND_MESSAGE_ARGS[0], OsuTypes.Message),),
+        Packets.SEND_MESSAGE,
+    ),
+    (
+        "SPECTATOR_JOINED",
+        ServerPackets.SPECTATOR_JOINED,
+        ((1001, OsuTypes.Int32),),
+        Packets.SPECTATOR_JOINED,
+    ),
+)
+
+
+def main() -> int:
+    for name, packet_id, typed_args, layout in CASES:
+        values = [value for value, _ in typed_args]
+
+        generic = Packets.write_packet(packet_id, *typed_args)
+        compiled = layout.encode(*values)
+        assert generic == compiled, f"{name}: compiled layout differs from write_packet"
+
+        generic_time = timeit.timeit(
+            lambda: Packets.write_packet(packet_id, *typed_args), number=ITERATIONS
+        )
+        compiled_time = timeit.timeit(
+            lambda: layout.encode(*values), number=ITERATIONS
+        )
+
+        print(
+            f"{name:<18} write_packet: {generic_time / ITERATIONS * 1e9:>7.0f} ns"
+            f" | layout: {compiled_time / ITERATIONS * 1e9:>7.0f} ns"
+            f" | speedup: {generic_time / compiled_time:.2f}x"
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
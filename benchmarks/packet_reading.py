@@ -0,0 +1,289 @@
+""" packet reading: offset cursor vs re-slicing readers over client poll bodies """
+from __future__ import annotations
+
+import struct
+import timeit
+from typing import Any
+from typing import Iterator
+
+from app.packets import BanchoPacketReader
+from app.packets import BasePacket
+from app.packets import ClientPackets
+from app.packets import Message
+from app.packets import PacketMap
+from app.packets import ReplayAction
+from app.packets import ReplayFrame
+from app.packets import SCOREFRAME_FORMAT
+from app.packets import ScoreFrame
+from app.packets import write_message
+from app.packets import write_string
+
+ITERATIONS = 50_000
+
+
+def client_packet(packet_id: ClientPackets, body: bytes = b"") -> bytes:
+    return struct.pack("<HxI", packet_id, len(body)) + body
+
+
+def replay_frame_bundle(frame_count: int) -> bytes:
+    frames = b"".join(
+        struct.pack("<BBffi", i % 2, 0, 256.0 + i, 192.0 - i, 16 * i)
+        for i in range(frame_count)
+    )
+    score_frame = struct.pack(
+        "<iBHHHHHHiHH?BB?",
+        *(61_234, 0, 312, 14, 2, 80, 9, 1),  # time, id, 300/100/50/geki/katu/miss
+        *(1_234_567, 88, 301, False),  # score, combo, max combo, perfect
+        *(187, 0, False),  # hp, tag byte, score v2
+    )
+    return (
+        struct.pack("<iH", 0, frame_count)
+        + frames
+        + struct.pack("<B", 0)
+        + score_frame
+        + struct.pack("<H", 117)
+    )
+
+
+PING = client_packet(ClientPackets.PING)
+
+CHANGE_ACTION = client_packet(
+    ClientPackets.CHANGE_ACTION,
+    struct.pack("<B", 2)
+    + write_string("xi - FREEDOM DiVE [FOUR DIMENSIONS]")
+    + write_string("da8aae79c8f3306b5d65ec951874a7fb")
+    + struct.pack("<IBi", 72, 0, 129_891),
+)
+
+SEND_PUBLIC_MESSAGE = client_packet(
+    ClientPackets.SEND_PUBLIC_MESSAGE,
+    bytes(write_message("", "anyone up for a multi lobby?", "#osu", 0)),
+)
+
+SPECTATE_FRAMES = client_packet(ClientPackets.SPECTATE_FRAMES, replay_frame_bundle(30))
+
+# Bodies as sent by an idle client, a player, a chatter and a streamer
+POLL_BODIES = {
+    "ping": PING,
+    "status change": CHANGE_ACTION + PING,
+    "chat": SEND_PUBLIC_MESSAGE + SEND_PUBLIC_MESSAGE + PING,
+    "spectate frames": SPECTATE_FRAMES + SPECTATE_FRAMES,
+}
+
+
+class SlicingPacketReader:
+    """
+    The reader as it was before the offset cursor, every read re-slices the body
+
+    Only the reads used below, with the field widths the old reader got wrong fixed,
+    so both readers decode the same values
+    """
+
+    def __init__(self, body_view: memoryview, packet_map: PacketMap) -> None:
+        self.body_view = body_view
+        self.packet_map = packet_map
+        self.current_length = 0
+
+    def __iter__(self) -> Iterator[BasePacket]:
+        return self
+
+    def __next__(self) -> BasePacket:
+        while self.body_view:
+            packet_type, packet_length = struct.unpack("<HxI", self.body_view[:7])
+            self.body_view = self.body_view[7:]
+
+            if packet_type not in self.packet_map:
+                if packet_length != 0:
+                    self.body_view = self.body_view[packet_length:]
+
+            else:
+                break
+
+        else:
+            raise StopIteration
+
+        self.current_length = packet_length
+        return self.packet_map[packet_type](self)  # type: ignore[index, arg-type]
+
+    def read_unsigned_int8(self) -> int:
+        value = self.body_view[0]
+        self.body_view = self.body_view[1:]
+
+        return value
+
+    def read_unsigned_int16(self) -> int:
+        value = int.from_bytes(self.body_view[:2], "little", signed=False)
+        self.body_view = self.body_view[2:]
+
+        return value
+
+    def read_int32(self) -> int:
+        value = int.from_bytes(self.body_view[:4], "little", signed=True)
+        self.body_view = self.body_view[4:]
+
+        return value
+
+    def read_unsigned_int32(self) -> int:
+        value = int.from_bytes(self.body_view[:4], "little", signed=False)
+        self.body_view = self.body_view[4:]
+
+        return value
+
+    def read_float32(self) -> float:
+        (value,) = struct.unpack_from("<f", self.body_view[:4])
+        self.body_view = self.body_view[4:]
+
+        return value
+
+    def read_float64(self) -> float:
+        (value,) = struct.unpack_from("<d", self.body_view[:8])
+        self.body_view = self.body_view[8:]
+
+        return value
+
+    def read_string(self) -> str:
+        exists = self.body_view[0] == 0x0B
+        self.body_view = self.body_view[1:]
+
+        if not exists:
+            return ""
+
+        length = shift = 0
+
+        while True:
+            current_byte = self.body_view[0]
+            self.body_view = self.body_view[1:]
+
+            length |= (current_byte & 0x7F) << shift
+            if (current_byte & 0x80) == 0:
+                break
+
+            shift += 7
+
+        value = self.body_view[:length].tobytes().decode()
+        self.body_view = self.body_view[length:]
+        return value
+
+    def read_message(self) -> Message:
+        return Message(
+            sender=self.read_string(),
+            text=self.read_string(),
+            recipient=self.read_string(),
+            sender_id=self.read_int32(),
+        )
+
+    def read_scoreframe(self) -> ScoreFrame:
+        score_frame = ScoreFrame(*SCOREFRAME_FORMAT.unpack_from(self.body_view[:29]))
+        self.body_view = self.body_view[29:]
+
+        if score_frame.score_v2:
+            score_frame.combo_portion = self.read_float64()
+            score_frame.bonus_portion = self.read_float64()
+
+        return score_frame
+
+    def read_replayframe(self) -> ReplayFrame:
+        return ReplayFrame(
+            button_state=self.read_unsigned_int8(),
+            taiko_byte=self.read_unsigned_int8(),
+            x=self.read_float32(),
+            y=self.read_float32(),
+            time=self.read_int32(),
+        )
+
+    def read_replayframe_bundle(self) -> tuple[Any, ...]:
+        raw_data = self.body_view[: self.current_length]
+
+        extra = self.read_int32()
+        frame_count = self.read_unsigned_int16()
+        frames = [self.read_replayframe() for _ in range(frame_count)]
+        action = ReplayAction(self.read_unsigned_int8())
+        scoreframe = self.read_scoreframe()
+        sequence = self.read_unsigned_int16()
+
+        return frames, scoreframe, action, extra, sequence, raw_data
+
+
+class Ping(BasePacket):
+    async def handle(self, player) -> None:
+        ...
+
+
+class ChangeAction(BasePacket):
+    def __init__(self, reader: BanchoPacketReader) -> None:
+        self.action = reader.read_unsigned_int8()
+        self.action_info = reader.read_string()
+        self.map_md5 = reader.read_string()
+        self.mods = reader.read_unsigned_int32()
+        self.mode = reader.read_unsigned_int8()
+        self.map_id = reader.read_int32()
+
+    async def handle(self, player) -> None:
+        ...
+
+
+class SendPublicMessage(BasePacket):
+    def __init__(self, reader: BanchoPacketReader) -> None:
+        self.message = reader.read_message()
+
+    async def handle(self, player) -> None:
+        ...
+
+
+class SpectateFrames(BasePacket):
+    def __init__(self, reader: BanchoPacketReader) -> None:
+        self.frame_bundle = reader.read_replayframe_bundle()
+
+    async def handle(self, player) -> None:
+        ...
+
+
+PACKET_MAP: PacketMap = {
+    ClientPackets.PING: Ping,
+    ClientPackets.CHANGE_ACTION: ChangeAction,
+    ClientPackets.SEND_PUBLIC_MESSAGE: SendPublicMessage,
+    ClientPackets.SPECTATE_FRAMES: SpectateFrames,
+}
+
+
+def read_all(body: bytes) -> int:
+    return sum(1 for _ in BanchoPacketReader(memoryview(body), PACKET_MAP))
+
+
+def read_all_slicing(body: bytes) -> int:
+    return sum(1 for _ in SlicingPacketReader(memoryview(body), PACKET_MAP))
+
+
+def decoded(reader_class: type, body: bytes) -> list[dict[str, Any]]:
+    """Fields of every packet except frame bundles, which differ in representation"""
+    return [
+        vars(packet)
+        for packet in reader_class(memoryview(body), PACKET_MAP)
+        if not isinstance(packet, SpectateFrames)
+    ]
+
+
+def main() -> int:
+    for name, body in POLL_BODIES.items():
+        packet_count = read_all(body)
+        assert packet_count == read_all_slicing(body), f"{name}: packet counts differ"
+        assert decoded(BanchoPacketReader, body) == decoded(
+            SlicingPacketReader, body
+        ), f"{name}: readers decoded different values"
+
+        slicing_time = timeit.timeit(lambda: read_all_slicing(body), number=ITERATIONS)
+        offset_time = timeit.timeit(lambda: read_all(body), number=ITERATIONS)
+
+        print(
+            f"{name:<16} {len(body):>5} bytes, {packet_count} packets"
+            f" | slicing: {slicing_time / ITERATIONS * 1e6:>7.2f} μs/poll"
+            f" | offset: {offset_time / ITERATIONS * 1e6:>7.2f} μs/poll"
+            f" | {ITERATIONS * packet_count / offset_time:>10,.0f} packets/sec"
+            f" | speedup: {slicing_time / offset_time:.2f}x"
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
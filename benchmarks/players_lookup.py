@@ -0,0 +1,38 @@
+""" players lookup: Players.get latency by token, id and name as sessions grow """
+from __future__ import annotations
+
+import random
+import timeit
+
+from app.objects.collections import Players
+from app.objects.player import Player
+
+LOOKUPS = 100_000
+SESSION_COUNTS = (100, 1_000, 10_000, 50_000)
+
+
+def main() -> int:
+    for session_count in SESSION_COUNTS:
+        players = Players(
+            Player(id, f"Player {id}", privileges=1) for id in range(session_count)
+        )
+        targets = random.choices(list(players), k=LOOKUPS)
+
+        tokens = [player.token for player in targets]
+        ids = [player.id for player in targets]
+        names = [player.name for player in targets]
+
+        results = []
+        for key, values in (("token", tokens), ("id", ids), ("name", names)):
+            elapsed = timeit.timeit(
+                lambda: [players.get(**{key: value}) for value in values], number=1
+            )
+            results.append(f"{key}: {elapsed / LOOKUPS * 1e9:>5.0f} ns")
+
+        print(f"{session_count:>6} sessions | " + " | ".join(results))
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,59 @@
+""" replay frames: structured array decoding vs a ReplayFrame object per frame """
+from __future__ import annotations
+
+import timeit
+
+from app.packets import BanchoPacketReader
+from app.packets import PACKET_HEADER
+from benchmarks.packet_reading import PACKET_MAP
+from benchmarks.packet_reading import replay_frame_bundle
+
+ITERATIONS = 20_000
+FRAME_COUNTS = (10, 30, 100)
+
+
+def bundle_reader(bundle: bytes) -> BanchoPacketReader:
+    reader = BanchoPacketReader(memoryview(bundle), PACKET_MAP)
+    reader.packet_end = len(bundle)
+    return reader
+
+
+def read_frame_objects(bundle: bytes) -> None:
+    reader = bundle_reader(bundle)
+    reader.read_int32()
+    frame_count = reader.read_unsigned_int16()
+    [reader.read_replayframe() for _ in range(frame_count)]
+    reader.read_unsigned_int8()
+    reader.read_scoreframe()
+    reader.read_unsigned_int16()
+
+
+def read_frame_array(bundle: bytes) -> None:
+    bundle_reader(bundle).read_replayframe_bundle()
+
+
+def read_frame_array_and_iterate(bundle: bytes) -> None:
+    bundle_reader(bundle).read_replayframe_bundle().replay_frames
+
+
+def main() -> int:
+    for frame_count in FRAME_COUNTS:
+        bundle = replay_frame_bundle(frame_count)
+        total_frames = frame_count * ITERATIONS
+
+        bundle_size = len(bundle) + PACKET_HEADER.size
+        print(f"{frame_count} frames per bundle ({bundle_size} bytes)")
+
+        for name, read in (
+            ("ReplayFrame per frame", read_frame_objects),
+            ("structured array", read_frame_array),
+            ("array + lazy objects", read_frame_array_and_iterate),
+        ):
+            elapsed = timeit.timeit(lambda: read(bundle), number=ITERATIONS)
+            print(f"  {name:<22} {total_frames / elapsed:>14,.0f} frames/sec")
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
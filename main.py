@@ -11,6 +11,7 @@ import os
 os.chdir(os.path.dirname(os.path.realpath(__file__)))
 
 import argparse
+import asyncio
 
 import uvicorn
 import logging
@@ -20,6 +21,21 @@ from typing import Sequence
 
 import app.utils
 import app.settings
+import app.query_plans
+import app.state.services
+
+
+async def check_query_plans() -> int:
+    """Migrate the database, then make sure no hot query scans a whole table"""
+    await app.state.services.database.connect()
+
+    try:
+        await app.state.services.run_sql_migrations()
+        passed = await app.query_plans.check(app.state.services.database)
+    finally:
+        await app.state.services.database.disconnect()
+
+    return 0 if passed else 1
 
 
 def main(argv: Sequence[str]) -> int:
@@ -34,7 +50,16 @@ def main(argv: Sequence[str]) -> int:
         "-V", "--version", action="version", version=f"%(prog)s v{app.settings.VERSION}"
     )
 
-    parser.parse_args(argv)
+    parser.add_argument(
+        "--check-query-plans",
+        action="store_true",
+        help="EXPLAIN the hot queries and exit, failing if any scans a whole table",
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.check_query_plans:
+        return asyncio.run(check_query_plans())
 
     server_arguments = {
         "host": app.settings.SERVER_ADDRESS,
@@ -0,0 +1,8 @@
+-- Leaderboards filter on the gamemode and sort by one of these columns, the
+-- primary key is appended by InnoDB so ties are sorted by player id as well
+CREATE INDEX stats_mode_tscore_idx ON stats (mode, tscore);
+CREATE INDEX stats_mode_rscore_idx ON stats (mode, rscore);
+CREATE INDEX stats_mode_pp_idx ON stats (mode, pp);
+CREATE INDEX stats_mode_acc_idx ON stats (mode, acc);
+CREATE INDEX stats_mode_plays_idx ON stats (mode, plays);
+CREATE INDEX stats_mode_playtime_idx ON stats (mode, playtime);
@@ -0,0 +1,6 @@
+-- Players are looked up by name and email on login and registration,
+-- and counted per country, privileges and clan
+CREATE INDEX users_safe_name_idx ON users (safe_name);
+CREATE INDEX users_email_idx ON users (email);
+CREATE INDEX users_country_priv_idx ON users (country, priv);
+CREATE INDEX users_clan_id_idx ON users (clan_id, clan_priv);